@@ -0,0 +1,218 @@
+"""
+Concurrency auto-tuner: find how many executions n8n should run at once on this host.
+
+Without a limit n8n starts every production execution the moment it arrives. Under a
+burst they all compete for the same event loop and CPU, so each one gets slower and the
+p99 latency blows up, while the throughput stays the same or drops. The tuner redeploys
+the installed stack with a range of limits, measures each one under a synthetic webhook
+load (see `bench.py`) and picks the knee: the smallest limit whose throughput is within a
+few percent of the best, and whose p99 latency is not far above the lowest of those. More
+concurrency than that only adds latency and memory.
+
+The limit that is swept depends on the mode of the stack:
+- regular mode: N8N_CONCURRENCY_PRODUCTION_LIMIT of the main instance
+- queue mode: N8N_WORKER_CONCURRENCY, the `--concurrency` of every worker
+
+The chosen value is written back to n8n/.env and the stack is redeployed with it.
+
+Usage:
+    N8N_API_KEY=... python3 autotune.py [--values 2,4,8,16] [--duration 20] [--dry-run]
+"""
+import argparse
+import os
+from typing import List, Tuple
+
+from bench import Load_Result, run_load, create_webhook_workflow, delete_workflow, webhook_url, DEFAULT_BASE_URL
+from config import read_env_file, update_env_file
+from docker import wait_for_compose_services
+from host import get_cpu_count
+from utils import run_command
+
+
+PROJECT_DIR = "n8n"
+ENV_FILE_PATH = f"{PROJECT_DIR}/.env"
+# Busy loop iterations of the benchmark workflow, a few milliseconds of CPU per execution
+DEFAULT_WORK_ITERATIONS = 2_000_000
+# A limit is at the knee once its throughput is within this share of the best one
+DEFAULT_TOLERANCE = 0.05
+# ...and its p99 latency at most this many times the lowest p99 of those limits
+DEFAULT_LATENCY_FACTOR = 1.5
+WARMUP_SECONDS = 3
+
+
+def tuned_setting(env) -> str:
+    """
+    Get the variable that limits the concurrency of the stack.
+
+    Args:
+        env: The values of the .env file.
+
+    Returns:
+        str: N8N_WORKER_CONCURRENCY in queue mode, N8N_CONCURRENCY_PRODUCTION_LIMIT otherwise.
+    """
+    return "N8N_WORKER_CONCURRENCY" if env.get("EXECUTIONS_MODE") == "queue" else "N8N_CONCURRENCY_PRODUCTION_LIMIT"
+
+
+def default_values(setting, cpu_count = None) -> List[int]:
+    # Up to 16 executions per core, enough to cover executions that mostly wait on the network
+    cpu_count = cpu_count or get_cpu_count()
+    values = sorted({cpu_count * factor for factor in [1, 2, 4, 8, 16]})
+    # Unlimited, the n8n default, as the baseline
+    if setting == "N8N_CONCURRENCY_PRODUCTION_LIMIT":
+        values.append(-1)
+    return values
+
+
+def _limit_order(value):
+    # -1 is no limit, so larger than any number
+    return float("inf") if value < 0 else value
+
+
+def _count_workers(project_dir = PROJECT_DIR) -> int:
+    with open(f"{project_dir}/docker-compose.yaml") as f:
+        return sum(1 for line in f if line.startswith("  n8n-worker-"))
+
+
+def apply_settings(values: dict, project_dir: str = PROJECT_DIR):
+    """
+    Write settings to the .env file and redeploy the stack with them.
+
+    `docker compose up -d` only recreates the containers whose config changed.
+
+    Args:
+        values: The variables to set, keyed by name.
+        project_dir: Folder with the docker-compose.yaml and .env files.
+    """
+    update_env_file(f"{project_dir}/.env", values)
+    run_command(f"cd {project_dir} && docker compose up -d", timeout=600)
+    wait_for_compose_services(project_dir)
+
+
+def sweep(setting: str, values: List[int], url: str, load_concurrency: int, duration: float) -> List[Tuple[int, Load_Result]]:
+    """
+    Redeploy the stack with every value of a setting and measure it under load.
+
+    Args:
+        setting: The variable to sweep, see `tuned_setting()`.
+        values: The values to try.
+        url: The webhook URL to send the load to.
+        load_concurrency: Requests in flight at all times, should be above the largest value.
+        duration: Seconds to measure every value for.
+
+    Returns:
+        List[tuple]: (value, `bench.Load_Result`) of every value.
+    """
+    results = []
+    for value in values:
+        print(f"\n{setting}={value}: redeploying...")
+        apply_settings({setting: value})
+        # n8n registers the webhooks of active workflows after it reports healthy, and the
+        # first executions warm up the JIT, neither should count
+        run_load(url, WARMUP_SECONDS, concurrency=load_concurrency)
+        result = run_load(url, duration, concurrency=load_concurrency)
+        summary = result.summary()
+        print(f"  {summary['throughput_rps']} req/s, p50 {summary['p50_ms']}ms, p99 {summary['p99_ms']}ms, {summary['errors']} errors")
+        results.append((value, result))
+    return results
+
+
+def find_knee(results: List[Tuple[int, Load_Result]], tolerance: float = DEFAULT_TOLERANCE, latency_factor: float = DEFAULT_LATENCY_FACTOR) -> int | None:
+    """
+    Pick the smallest value with close to the best throughput and latency.
+
+    The candidates are the values whose throughput is within `tolerance` of the best. Of
+    those, the ones whose p99 latency is more than `latency_factor` times the lowest p99 of the
+    candidates are dropped: a limit that is too small keeps up by queueing the executions, so
+    its throughput looks fine while every request waits longer. The smallest remaining value
+    is chosen.
+
+    -1 (no limit) counts as the largest value. Runs with more than 1% errors are left out, a limit that drops requests is no good
+    however fast it is.
+
+    Args:
+        results: (value, `bench.Load_Result`) of every value, as returned by `sweep()`.
+        tolerance: Share of the best throughput a value may lose.
+        latency_factor: How many times the lowest p99 of the candidates a value's p99 may be.
+
+    Returns:
+        int | None: The chosen value, None if no run succeeded.
+    """
+    usable = [(value, result) for value, result in results if result.latencies and result.error_rate <= 0.01]
+    if not usable:
+        return None
+    best = max(result.throughput for _, result in usable)
+    candidates = [(value, result.percentile(99)) for value, result in usable if result.throughput >= best * (1 - tolerance)]
+    lowest_p99 = min(p99 for _, p99 in candidates)
+    return min((value for value, p99 in candidates if p99 <= lowest_p99 * latency_factor), key=_limit_order)
+
+
+def print_sweep(setting: str, results: List[Tuple[int, Load_Result]], chosen: int | None):
+    print(f"\n{setting:>34}  {'req/s':>8}  {'p50':>8}  {'p95':>8}  {'p99':>8}  errors")
+    for value, result in results:
+        summary = result.summary()
+        marker = "  <- knee" if value == chosen else ""
+        print(f"{value:>34}  {summary['throughput_rps']:>8}  {summary['p50_ms']:>6}ms  {summary['p95_ms']:>6}ms  {summary['p99_ms']:>6}ms  {summary['errors']:>6}{marker}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find the concurrency limit of the installed n8n stack under load and write it to n8n/.env.")
+    parser.add_argument("--values", help="comma separated values to try, multiples of the CPU count by default")
+    parser.add_argument("--duration", type=float, default=20, help="seconds to measure every value for")
+    parser.add_argument("--load-concurrency", type=int, help="requests in flight during the measurement, twice the largest limit by default")
+    parser.add_argument("--work-iterations", type=int, default=DEFAULT_WORK_ITERATIONS, help="busy loop iterations per execution")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="share of the best throughput the chosen value may lose")
+    parser.add_argument("--latency-factor", type=float, default=DEFAULT_LATENCY_FACTOR, help="how many times the lowest p99 the chosen value's p99 may be")
+    parser.add_argument("--base-url", default=DEFAULT_BASE_URL, help="URL of the n8n instance")
+    parser.add_argument("--api-key", default=os.environ.get("N8N_API_KEY"), help="n8n API key, to create the benchmark workflow")
+    parser.add_argument("--dry-run", action="store_true", help="only report the knee, restore the original value")
+    args = parser.parse_args()
+
+    if not os.path.exists(ENV_FILE_PATH):
+        print(f"Error: {ENV_FILE_PATH} not found, run the installer first (or run this from the folder it was run in).")
+        exit(1)
+    if not args.api_key:
+        print("Error: give an n8n API key (--api-key or N8N_API_KEY) to create the benchmark workflow.")
+        exit(1)
+
+    env = read_env_file(ENV_FILE_PATH)
+    setting = tuned_setting(env)
+    original_value = env.get(setting)
+    values = [int(value) for value in args.values.split(",")] if args.values else default_values(setting)
+
+    # Enough requests in flight that every limit is reached, in queue mode every worker takes that many
+    largest_limit = max([value for value in values if value > 0], default=get_cpu_count() * 16)
+    process_count = max(1, _count_workers()) if setting == "N8N_WORKER_CONCURRENCY" else 1
+    load_concurrency = args.load_concurrency or 2 * largest_limit * process_count
+
+    import requests
+    try:
+        workflow_id, path = create_webhook_workflow(args.base_url, args.api_key, args.work_iterations)
+    except requests.RequestException as e:
+        print(f"Error: could not create the benchmark workflow: {e}")
+        exit(1)
+
+    # Unless a knee is applied, the original value is put back, also when the sweep fails or is
+    # stopped half way (a value that was not set is commented out again)
+    applied = False
+    chosen = None
+    try:
+        try:
+            results = sweep(setting, values, webhook_url(args.base_url, path, ENV_FILE_PATH), load_concurrency, args.duration)
+        finally:
+            delete_workflow(args.base_url, args.api_key, workflow_id)
+
+        chosen = find_knee(results, args.tolerance, args.latency_factor)
+        print_sweep(setting, results, chosen)
+        if chosen is None:
+            print("\nNo value handled the load without errors, keeping the original setting.")
+        elif not args.dry_run:
+            print(f"\nSetting {setting}={chosen} in {ENV_FILE_PATH}...")
+            apply_settings({setting: chosen})
+            applied = True
+    finally:
+        if not applied:
+            print(f"\nRestoring {setting}={original_value if original_value is not None else '(not set)'}...")
+            apply_settings({setting: original_value})
+
+    print("Done.")
+    exit(0 if chosen is not None else 1)
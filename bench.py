@@ -0,0 +1,441 @@
+"""
+Webhook load generator: how many requests an n8n instance handles, and how fast.
+
+Creates a workflow with a single webhook node through the n8n public API (or uses the
+webhook path of an existing one) and drives its production URL, under the configured
+N8N_ENDPOINT_WEBHOOK path, with one of:
+- a fixed rate (open loop): requests are sent on schedule whether or not earlier ones have
+  finished, like real traffic. The latency counts from the scheduled time, so a request
+  that had to wait for a free connection is not reported as fast.
+- a fixed concurrency (closed loop): every connection sends its next request as soon as
+  the previous one is answered, which finds the maximum throughput.
+
+The HTTP/1.1 client is built on asyncio streams with keep-alive connections, so thousands
+of requests per second fit in a single process without extra dependencies.
+
+`serve` runs a stand-in for the n8n webhook endpoint, to try the load generator without n8n.
+
+Usage:
+    python3 bench.py run --api-key <n8n API key> [--rate 200 | --concurrency 32] [--duration 30]
+    python3 bench.py run --webhook-path my-webhook --concurrency 64
+    python3 bench.py run --stub --concurrency 64        # against an in-process stand-in
+    python3 bench.py serve [--port 8080] [--delay-ms 5]
+
+The n8n URL and webhook endpoint are read from n8n/.env, the API key can also be given with
+the N8N_API_KEY environment variable (create one in n8n under Settings > n8n API).
+"""
+import argparse
+import asyncio
+import json
+import os
+import ssl
+import time
+import uuid
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+from config import read_env_file
+
+
+ENV_FILE_PATH = "n8n/.env"
+DEFAULT_BASE_URL = "http://localhost:5678"
+REQUEST_TIMEOUT = 30
+DEFAULT_BODY = {"message": "benchmark"}
+
+
+class Load_Result:
+    """
+    The outcome of a load run.
+
+    Attributes:
+        latencies (List[float]): Seconds of every successful request, sorted.
+        errors (int): Requests that failed, timed out or got a status of 400 or higher.
+        status_counts (Dict[int, int]): Number of responses of every status code.
+        duration (float): Seconds the run took.
+    """
+    def __init__(self, latencies: List[float], errors: int, status_counts: Dict[int, int], duration: float):
+        self.latencies: List[float] = sorted(latencies)
+        self.errors: int = errors
+        self.status_counts: Dict[int, int] = status_counts
+        self.duration: float = duration
+
+    @property
+    def throughput(self) -> float:
+        # Successful requests per second
+        return len(self.latencies) / self.duration if self.duration else 0.0
+
+    @property
+    def error_rate(self) -> float:
+        total = len(self.latencies) + self.errors
+        return self.errors / total if total else 0.0
+
+    def percentile(self, percent: float) -> float:
+        """
+        Get a latency percentile (nearest rank).
+
+        Args:
+            percent: Like 99 for the p99.
+
+        Returns:
+            float: The latency in seconds, 0 if no request succeeded.
+        """
+        if not self.latencies:
+            return 0.0
+        rank = max(0, min(len(self.latencies) - 1, int(round(percent / 100 * len(self.latencies))) - 1))
+        return self.latencies[rank]
+
+    def summary(self) -> dict:
+        return {
+            "requests": len(self.latencies) + self.errors,
+            "errors": self.errors,
+            "duration_s": round(self.duration, 2),
+            "throughput_rps": round(self.throughput, 1),
+            "p50_ms": round(self.percentile(50) * 1000, 1),
+            "p95_ms": round(self.percentile(95) * 1000, 1),
+            "p99_ms": round(self.percentile(99) * 1000, 1),
+            "status_counts": {str(status): count for status, count in sorted(self.status_counts.items())},
+        }
+
+
+class _Connection:
+    # One keep-alive HTTP/1.1 connection, reused for requests one after the other
+    def __init__(self, url):
+        self.url = urlparse(url)
+        self.reader = None
+        self.writer = None
+
+    async def request(self, body: bytes) -> int:
+        if self.writer is None:
+            port = self.url.port or (443 if self.url.scheme == "https" else 80)
+            ssl_context = ssl.create_default_context() if self.url.scheme == "https" else None
+            self.reader, self.writer = await asyncio.open_connection(self.url.hostname, port, ssl=ssl_context)
+
+        path = self.url.path or "/"
+        if self.url.query:
+            path += f"?{self.url.query}"
+        self.writer.write(
+            f"POST {path} HTTP/1.1\r\n"
+            f"Host: {self.url.netloc}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: keep-alive\r\n\r\n".encode() + body
+        )
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip().lower()
+
+        if headers.get("transfer-encoding") == "chunked":
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        else:
+            await self.reader.readexactly(int(headers.get("content-length", 0)))
+
+        if headers.get("connection") == "close":
+            self.close()
+        return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+async def _send(connection, body, result):
+    # Returns whether the request succeeded, a failed connection is reopened by the next request
+    try:
+        status = await asyncio.wait_for(connection.request(body), REQUEST_TIMEOUT)
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, IndexError):
+        connection.close()
+        result["errors"] += 1
+        return False
+    result["status_counts"][status] = result["status_counts"].get(status, 0) + 1
+    if status >= 400:
+        result["errors"] += 1
+        return False
+    return True
+
+
+async def _fixed_concurrency(url, body, concurrency, duration, result):
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        connection = _Connection(url)
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            if await _send(connection, body, result):
+                result["latencies"].append(time.perf_counter() - start)
+        connection.close()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def _fixed_rate(url, body, rate, duration, max_connections, result):
+    idle_connections = asyncio.Queue()
+    for _ in range(max_connections):
+        idle_connections.put_nowait(_Connection(url))
+
+    async def send_at(scheduled):
+        connection = await idle_connections.get()
+        try:
+            if await _send(connection, body, result):
+                result["latencies"].append(time.perf_counter() - scheduled)
+        finally:
+            idle_connections.put_nowait(connection)
+
+    start = time.perf_counter()
+    requests = []
+    for number in range(int(rate * duration)):
+        scheduled = start + number / rate
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        requests.append(asyncio.ensure_future(send_at(scheduled)))
+    await asyncio.gather(*requests)
+
+    while not idle_connections.empty():
+        idle_connections.get_nowait().close()
+
+
+def run_load(url: str, duration: float = 30, rate: Optional[float] = None, concurrency: Optional[int] = None, max_connections: int = 256, body: Optional[dict] = None) -> Load_Result:
+    """
+    Send POST requests to a URL for a while, at a fixed rate or a fixed concurrency.
+
+    Args:
+        url: The URL to send the requests to, like a production webhook URL.
+        duration: Seconds to send requests for.
+        rate: Requests per second (open loop). Takes precedence over `concurrency`.
+        concurrency: Number of requests in flight at all times (closed loop), if no rate is given.
+        max_connections: Most connections open at once at a fixed rate, requests wait for a free one.
+        body: The json body of every request.
+
+    Returns:
+        Load_Result: The latencies, errors and status codes of the run.
+    """
+    encoded_body = json.dumps(body or DEFAULT_BODY).encode()
+    result = {"latencies": [], "errors": 0, "status_counts": {}}
+
+    start = time.perf_counter()
+    if rate:
+        asyncio.run(_fixed_rate(url, encoded_body, rate, duration, max_connections, result))
+    else:
+        asyncio.run(_fixed_concurrency(url, encoded_body, concurrency or 16, duration, result))
+    return Load_Result(result["latencies"], result["errors"], result["status_counts"], time.perf_counter() - start)
+
+
+def print_load_result(result: Load_Result, label: str = ""):
+    summary = result.summary()
+    print(f"\n{label}{summary['requests']} requests in {summary['duration_s']}s, {summary['errors']} errors")
+    print(f"  throughput {summary['throughput_rps']} req/s")
+    print(f"  latency p50 {summary['p50_ms']}ms  p95 {summary['p95_ms']}ms  p99 {summary['p99_ms']}ms")
+    if any(int(status) >= 400 for status in summary["status_counts"]):
+        print(f"  status codes {summary['status_counts']}")
+
+
+def create_webhook_workflow(base_url: str, api_key: str, work_iterations: int = 0) -> tuple:
+    """
+    Create and activate a benchmark workflow with a webhook node.
+
+    Without work the webhook answers straight away, which measures how fast n8n takes in
+    requests. With work a Code node runs a busy loop and the webhook answers once it is done,
+    so the latency includes the execution (and, in queue mode, the trip through a worker).
+
+    Args:
+        base_url: URL of the n8n instance, like http://localhost:5678.
+        api_key: An n8n API key.
+        work_iterations: Iterations of the busy loop in the Code node, 0 for no Code node.
+
+    Returns:
+        tuple: (workflow ID, webhook path).
+
+    Raises:
+        requests.HTTPError: If the API refused the request, like a wrong API key.
+    """
+    import requests
+    path = f"bench-{uuid.uuid4()}"
+    nodes = [{
+        "id": str(uuid.uuid4()),
+        "name": "Webhook",
+        "type": "n8n-nodes-base.webhook",
+        "typeVersion": 2,
+        "position": [0, 0],
+        "webhookId": str(uuid.uuid4()),
+        "parameters": {"httpMethod": "POST", "path": path, "responseMode": "lastNode" if work_iterations else "onReceived", "options": {}},
+    }]
+    connections = {}
+    if work_iterations:
+        nodes.append({
+            "id": str(uuid.uuid4()),
+            "name": "Work",
+            "type": "n8n-nodes-base.code",
+            "typeVersion": 2,
+            "position": [220, 0],
+            "parameters": {"jsCode": f"let total = 0;\nfor (let i = 0; i < {int(work_iterations)}; i++) {{ total += i % 7; }}\nreturn [{{ json: {{ total }} }}];"},
+        })
+        connections = {"Webhook": {"main": [[{"node": "Work", "type": "main", "index": 0}]]}}
+    workflow = {
+        "name": f"Benchmark webhook {path}",
+        "nodes": nodes,
+        "connections": connections,
+        "settings": {"saveDataSuccessExecution": "none"},
+    }
+    headers = {"X-N8N-API-KEY": api_key}
+
+    response = requests.post(f"{base_url}/api/v1/workflows", json=workflow, headers=headers, timeout=30)
+    response.raise_for_status()
+    workflow_id = response.json()["id"]
+    response = requests.post(f"{base_url}/api/v1/workflows/{workflow_id}/activate", headers=headers, timeout=30)
+    response.raise_for_status()
+    return workflow_id, path
+
+
+def delete_workflow(base_url: str, api_key: str, workflow_id: str):
+    import requests
+    requests.delete(f"{base_url}/api/v1/workflows/{workflow_id}", headers={"X-N8N-API-KEY": api_key}, timeout=30)
+
+
+async def _stub_handler(reader, writer, delay):
+    # Answers every request like an n8n webhook in "respond immediately" mode
+    response_body = b'{"message":"Workflow was started"}'
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            content_length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.partition(b":")
+                if name.strip().lower() == b"content-length":
+                    content_length = int(value)
+            await reader.readexactly(content_length)
+            if delay:
+                await asyncio.sleep(delay)
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                + f"Content-Length: {len(response_body)}\r\n\r\n".encode() + response_body
+            )
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve_stub(host: str = "127.0.0.1", port: int = 8080, delay_ms: float = 0, started: Optional[asyncio.Future] = None):
+    """
+    Serve a stand-in for the n8n webhook endpoint, answering every request with 200.
+
+    Args:
+        host: Address to listen on.
+        port: Port to listen on, 0 for any free port.
+        delay_ms: Milliseconds to wait before answering, like the time n8n takes.
+        started: Set to the port once the server is listening.
+    """
+    server = await asyncio.start_server(lambda reader, writer: _stub_handler(reader, writer, delay_ms / 1000), host, port, backlog=1024)
+    if started is not None:
+        started.set_result(server.sockets[0].getsockname()[1])
+    async with server:
+        await server.serve_forever()
+
+
+def start_stub_in_thread(delay_ms: float = 0) -> str:
+    """
+    Start the stand-in server on a free port in a background thread.
+
+    Args:
+        delay_ms: Milliseconds to wait before answering.
+
+    Returns:
+        str: The URL of its webhook.
+    """
+    import threading
+    loop = asyncio.new_event_loop()
+    started = loop.create_future()
+    threading.Thread(target=loop.run_until_complete, args=(serve_stub("127.0.0.1", 0, delay_ms, started),), daemon=True).start()
+    while not started.done():
+        time.sleep(0.01)
+    return f"http://127.0.0.1:{started.result()}/webhook/stub"
+
+
+def webhook_url(base_url: str, webhook_path: str, env_file_path: str = ENV_FILE_PATH) -> str:
+    # The production webhook endpoint is configurable, read it from the generated .env file
+    endpoint = "webhook"
+    if os.path.exists(env_file_path):
+        endpoint = read_env_file(env_file_path).get("N8N_ENDPOINT_WEBHOOK") or endpoint
+    return f"{base_url.rstrip('/')}/{endpoint}/{webhook_path}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the webhook throughput and latency of an n8n instance.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="send load to a webhook and report the throughput and latency")
+    load_mode = run_parser.add_mutually_exclusive_group()
+    load_mode.add_argument("--rate", type=float, help="requests per second (open loop)")
+    load_mode.add_argument("--concurrency", type=int, help="requests in flight at all times (closed loop), 16 by default")
+    run_parser.add_argument("--duration", type=float, default=30, help="seconds to send requests for")
+    run_parser.add_argument("--max-connections", type=int, default=256, help="most connections open at once at a fixed rate")
+    run_parser.add_argument("--base-url", default=DEFAULT_BASE_URL, help="URL of the n8n instance")
+    run_parser.add_argument("--api-key", default=os.environ.get("N8N_API_KEY"), help="n8n API key, to create the benchmark workflow")
+    run_parser.add_argument("--webhook-path", help="path of an existing active webhook instead of creating a workflow")
+    run_parser.add_argument("--work-iterations", type=int, default=0, help="busy loop iterations in a Code node, the webhook answers once it is done")
+    run_parser.add_argument("--keep-workflow", action="store_true", help="don't delete the created workflow afterwards")
+    run_parser.add_argument("--stub", action="store_true", help="send the load to an in-process stand-in instead of n8n")
+    run_parser.add_argument("--record", help="append the results as a json line to this file")
+
+    serve_parser = subparsers.add_parser("serve", help="run a stand-in for the n8n webhook endpoint")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8080)
+    serve_parser.add_argument("--delay-ms", type=float, default=0, help="milliseconds to wait before answering")
+
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        print(f"Stand-in webhook server on http://{args.host}:{args.port}")
+        try:
+            asyncio.run(serve_stub(args.host, args.port, args.delay_ms))
+        except KeyboardInterrupt:
+            pass
+        exit(0)
+
+    workflow_id = None
+    if args.stub:
+        url = start_stub_in_thread()
+    elif args.webhook_path:
+        url = webhook_url(args.base_url, args.webhook_path)
+    elif args.api_key:
+        import requests
+        try:
+            workflow_id, path = create_webhook_workflow(args.base_url, args.api_key, args.work_iterations)
+        except requests.RequestException as e:
+            print(f"Error: could not create the benchmark workflow: {e}")
+            exit(1)
+        url = webhook_url(args.base_url, path)
+    else:
+        print("Error: give an n8n API key (--api-key or N8N_API_KEY) to create the benchmark workflow, or --webhook-path of an existing one.")
+        exit(1)
+
+    mode = f"{args.rate} req/s" if args.rate else f"concurrency {args.concurrency or 16}"
+    print(f"Sending requests to {url} for {args.duration}s at {mode}...")
+    try:
+        result = run_load(url, args.duration, args.rate, args.concurrency, args.max_connections)
+    finally:
+        if workflow_id and not args.keep_workflow:
+            delete_workflow(args.base_url, args.api_key, workflow_id)
+    print_load_result(result)
+
+    if args.record:
+        with open(args.record, "a") as f:
+            f.write(json.dumps({"time": time.time(), "url": url, "mode": mode, "result": result.summary()}) + "\n")
@@ -0,0 +1,77 @@
+"""
+Config render benchmark: how many tenant configs can be rendered per second.
+
+Renders the .env file, the compose environment and the docs for a set of generated tenants
+(different domains, databases, queue mode and secrets) with `config.render_config()`, the
+same call the installer and the fleet tooling use.
+
+Usage:
+    python3 benchmarks/render.py [--tenants 5000] [--runs 5] [--record results.jsonl]
+"""
+import argparse
+import json
+import os
+import secrets
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import default_env_vars, render_config
+
+
+def make_tenants(count):
+    tenants = []
+    for i in range(count):
+        env_vars = default_env_vars()
+        domain = f"n8n.tenant-{i}.example.com"
+        env_vars["N8N_EDITOR_BASE_URL"] = f"https://{domain}"
+        env_vars["WEBHOOK_URL"] = f"https://{domain}"
+        env_vars["N8N_ENCRYPTION_KEY"] = secrets.token_urlsafe(24)
+        env_vars["GENERIC_TIMEZONE"] = "Europe/Dublin"
+        if i % 2:
+            env_vars["DB_TYPE"] = "postgresdb"
+            env_vars["DB_POSTGRESDB_HOST"] = "postgres"
+            env_vars["DB_POSTGRESDB_PASSWORD"] = secrets.token_urlsafe(24)
+        if i % 3 == 0:
+            env_vars["EXECUTIONS_MODE"] = "queue"
+            env_vars["QUEUE_BULL_REDIS_HOST"] = "redis"
+        tenants.append(env_vars)
+    return tenants
+
+
+def measure_render(tenants, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        for env_vars in tenants:
+            render_config(env_vars)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure how fast tenant configs are rendered.")
+    parser.add_argument("--tenants", type=int, default=5000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--record", help="append the results as a json line to this file")
+    args = parser.parse_args()
+
+    timings = measure_render(make_tenants(args.tenants), args.runs)
+    median = statistics.median(timings)
+    result = {
+        "name": "render_config",
+        "tenants": args.tenants,
+        "runs": args.runs,
+        "median_ms": round(median * 1000, 1),
+        "configs_per_second": round(args.tenants / median),
+        "us_per_config": round(median / args.tenants * 1_000_000, 1),
+    }
+
+    print(f"{result['tenants']} tenants rendered in {result['median_ms']}ms (median of {result['runs']} runs)")
+    print(f"{result['configs_per_second']} configs/s, {result['us_per_config']}us per config")
+
+    if args.record:
+        with open(args.record, "a") as f:
+            f.write(json.dumps({"time": time.time(), "result": result}) + "\n")
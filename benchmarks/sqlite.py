@@ -0,0 +1,176 @@
+"""
+SQLite benchmark: insert and read throughput of n8n's execution tables, default vs tuned profile.
+
+Runs the same load against the n8n defaults (rollback journal, one connection) and the SQLite
+profile (WAL mode with a pool of read connections, see `n8n.use_sqlite_profile()`):
+- inserts: every execution is written in its own transaction, a row in `execution_entity` and
+  its data in `execution_data`, like n8n does when an execution finishes
+- reads: reader threads load the latest executions of a workflow (the executions list) while
+  the inserts run, one connection per reader
+
+Run it with --database on the disk the database will be stored on, the fsyncs dominate.
+
+Usage:
+    python3 benchmarks/sqlite.py [--executions 2000] [--readers 4] [--database /mnt/fast-disk] [--record results.jsonl]
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from host import default_sqlite_pool_size
+
+
+# The columns n8n reads and writes on every execution
+SCHEMA = """
+CREATE TABLE execution_entity (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    workflowId VARCHAR(36) NOT NULL,
+    finished BOOLEAN NOT NULL,
+    mode VARCHAR NOT NULL,
+    status VARCHAR NOT NULL,
+    startedAt DATETIME,
+    stoppedAt DATETIME,
+    waitTill DATETIME,
+    deletedAt DATETIME,
+    createdAt DATETIME NOT NULL DEFAULT (STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW'))
+);
+CREATE INDEX idx_execution_entity_workflow_id_id ON execution_entity (workflowId, id);
+CREATE INDEX idx_execution_entity_stopped_at ON execution_entity (stoppedAt);
+CREATE TABLE execution_data (
+    executionId INTEGER PRIMARY KEY REFERENCES execution_entity (id) ON DELETE CASCADE,
+    workflowData TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+"""
+
+WORKFLOW_COUNT = 20
+
+# Settings of each profile, the pragmas are what n8n's SQLite driver sets
+PROFILES = {
+    "default": {"pragmas": ["PRAGMA journal_mode=DELETE"], "shared_connection": True},
+    "tuned": {"pragmas": ["PRAGMA journal_mode=WAL"], "shared_connection": False},
+}
+
+
+def make_execution_data(size):
+    # Roughly what n8n stores for a small workflow: the workflow json and the run data
+    workflow_data = json.dumps({"nodes": [{"name": f"Node {i}", "type": "n8n-nodes-base.set", "parameters": {"value": i}} for i in range(5)]})
+    data = json.dumps({"resultData": {"runData": {"Node": [{"data": "x" * size}]}}})
+    return workflow_data, data
+
+
+def create_database(path, profile):
+    connection = sqlite3.connect(path, check_same_thread=False)
+    for pragma in PROFILES[profile]["pragmas"]:
+        connection.execute(pragma)
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def insert_executions(connection, lock, count, data_size):
+    workflow_data, data = make_execution_data(data_size)
+    start = time.perf_counter()
+    for _ in range(count):
+        workflow_id = str(random.randrange(WORKFLOW_COUNT))
+        with lock:
+            with connection:
+                cursor = connection.execute(
+                    "INSERT INTO execution_entity (workflowId, finished, mode, status, startedAt, stoppedAt) "
+                    "VALUES (?, 1, 'webhook', 'success', STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW'), STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW'))",
+                    (workflow_id,),
+                )
+                connection.execute(
+                    "INSERT INTO execution_data (executionId, workflowData, data) VALUES (?, ?, ?)",
+                    (cursor.lastrowid, workflow_data, data),
+                )
+    return time.perf_counter() - start
+
+
+def read_executions(connection, lock, stop, counts, index):
+    reads = 0
+    while not stop.is_set():
+        workflow_id = str(random.randrange(WORKFLOW_COUNT))
+        with lock:
+            connection.execute(
+                "SELECT id, finished, mode, status, startedAt, stoppedAt FROM execution_entity "
+                "WHERE workflowId = ? AND deletedAt IS NULL ORDER BY id DESC LIMIT 10",
+                (workflow_id,),
+            ).fetchall()
+        reads += 1
+    counts[index] = reads
+
+
+def measure_profile(profile, folder, executions, readers, data_size):
+    path = os.path.join(folder, f"benchmark-{profile}.sqlite")
+    writer = create_database(path, profile)
+    writer_lock = threading.Lock()
+
+    # The default profile has a single connection (and lock) that readers and the writer share,
+    # the tuned profile gives every reader its own connection like n8n's read pool
+    if PROFILES[profile]["shared_connection"]:
+        reader_connections = [(writer, writer_lock)] * readers
+    else:
+        reader_connections = [(sqlite3.connect(path, check_same_thread=False), threading.Lock()) for _ in range(readers)]
+
+    stop = threading.Event()
+    counts = [0] * readers
+    threads = [
+        threading.Thread(target=read_executions, args=(connection, lock, stop, counts, index))
+        for index, (connection, lock) in enumerate(reader_connections)
+    ]
+    for thread in threads:
+        thread.start()
+    duration = insert_executions(writer, writer_lock, executions, data_size)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    for connection, _ in reader_connections:
+        connection.close()
+    writer.close()
+    for suffix in ["", "-wal", "-shm", "-journal"]:
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+    return {
+        "inserts_per_second": round(executions / duration),
+        "reads_per_second": round(sum(counts) / duration),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure SQLite insert and read throughput of the n8n execution tables.")
+    parser.add_argument("--executions", type=int, default=2000)
+    parser.add_argument("--readers", type=int, default=default_sqlite_pool_size(), help="reader threads, the pool size of the tuned profile")
+    parser.add_argument("--data-size", type=int, default=4096, help="bytes of run data per execution")
+    parser.add_argument("--database", help="folder to create the test databases in, a temporary folder by default")
+    parser.add_argument("--record", help="append the results as a json line to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.database) as folder:
+        results = {profile: measure_profile(profile, folder, args.executions, args.readers, args.data_size) for profile in PROFILES}
+
+    result = {
+        "name": "sqlite",
+        "executions": args.executions,
+        "readers": args.readers,
+        "data_size": args.data_size,
+        **results,
+    }
+
+    for profile, counts in results.items():
+        print(f"{profile:<8} {counts['inserts_per_second']:>7} inserts/s  {counts['reads_per_second']:>7} reads/s")
+    print(f"tuned vs default: {results['tuned']['inserts_per_second'] / results['default']['inserts_per_second']:.1f}x inserts, "
+          f"{results['tuned']['reads_per_second'] / max(1, results['default']['reads_per_second']):.1f}x reads")
+
+    if args.record:
+        with open(args.record, "a") as f:
+            f.write(json.dumps({"time": time.time(), "result": result}) + "\n")
@@ -0,0 +1,94 @@
+"""
+Startup benchmark: how long the installer takes before it shows anything.
+
+Measures, in fresh python processes:
+    - the time to import the installer modules
+    - the time to the first question, with `--full` (this runs main.py, which checks for
+      docker first, so only use it on a host that already has docker)
+
+Usage:
+    python3 benchmarks/startup.py [--runs 10] [--full] [--record results.jsonl]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+import utils, tasks, host, docker, cloudflare, n8n
+print(time.perf_counter() - start)
+"""
+
+
+def measure_imports(runs):
+    timings = []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, "-c", IMPORT_SNIPPET], cwd=REPO_DIR, universal_newlines=True)
+        timings.append(float(output.strip()))
+    return timings
+
+
+def measure_first_prompt(runs, timeout = 60):
+    timings = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            log_path = os.path.join(tmp_dir, "startup.log")
+            env = dict(os.environ, N8N_INSTALL_STARTUP_LOG=log_path)
+            start = time.time()
+            process = subprocess.Popen(
+                [sys.executable, "main.py"],
+                cwd=REPO_DIR,
+                env=env,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            try:
+                while not os.path.exists(log_path) and process.poll() is None and time.time() - start < timeout:
+                    time.sleep(0.005)
+            finally:
+                process.kill()
+                process.wait()
+
+            if not os.path.exists(log_path):
+                raise RuntimeError("main.py exited before showing the first question")
+            with open(log_path) as f:
+                timings.append(float(f.readline()) - start)
+    return timings
+
+
+def _summary(name, timings):
+    return {
+        "name": name,
+        "runs": len(timings),
+        "median_ms": round(statistics.median(timings) * 1000, 1),
+        "min_ms": round(min(timings) * 1000, 1),
+        "max_ms": round(max(timings) * 1000, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure installer startup time.")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--full", action="store_true", help="also measure time to the first question by running main.py")
+    parser.add_argument("--record", help="append the results as a json line to this file")
+    args = parser.parse_args()
+
+    results = [_summary("import_modules", measure_imports(args.runs))]
+    if args.full:
+        results.append(_summary("time_to_first_prompt", measure_first_prompt(args.runs)))
+
+    for result in results:
+        print(f"{result['name']:<22} median {result['median_ms']:>8.1f}ms  (min {result['min_ms']}ms, max {result['max_ms']}ms, {result['runs']} runs)")
+
+    if args.record:
+        with open(args.record, "a") as f:
+            f.write(json.dumps({"time": time.time(), "results": results}) + "\n")
@@ -1,85 +1,292 @@
-from utils import run_command
+from utils import stream_command, Command_Error
+from docker_api import Docker_Error, get_client
+from tasks import Task, run_tasks
+from typing import List
+from concurrent.futures import Future
 import os
 import base64
-import requests
+import random
 import subprocess
 import platform
-import tldextract
+import threading
+import time
 
 
-def create_cf_tunnel(domain, account_id, token):
-    tunnel_secret = base64.b64encode(os.urandom(32)).decode('utf-8')
+CLOUDFLARED_IMAGE = "cloudflare/cloudflared:latest"
+CF_API_URL = "https://api.cloudflare.com/client/v4"
 
-    
-    # Create Tunnel
-    print("\nCreating Cloudflare Tunnel in account...")
-    cf_create_response = _create_tunnel(domain, account_id, token, tunnel_secret)
-    print(f"Tunnel '{cf_create_response['result']['name']}' created successfully")
-    
-    tunnel_id = cf_create_response["result"]["id"]
-    tunnel_token = cf_create_response["result"]["token"]
+# Public suffix list shipped with this repo (copied from the snapshot in tldextract 5.1.2) so
+# finding the zone of a domain never has to download the list. Bump the version when the file
+# is replaced, it is part of the on-disk cache path.
+PUBLIC_SUFFIX_LIST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "public_suffix_list.dat")
+PUBLIC_SUFFIX_LIST_VERSION = "tldextract-5.1.2"
+PUBLIC_SUFFIX_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "n8n-auto-install", "public-suffix", PUBLIC_SUFFIX_LIST_VERSION)
 
-    # Add Config to Tunnel
-    print("\nAdding configuration to Cloudflare Tunnel...")
-    _add_domain_to_tunel(tunnel_id, domain, account_id, token)
-    print("Tunnel configuration updated successfully")
 
-    print(f"\nPointing {domain} DNS records to Cloudflare Tunnel...")
-    _add_tunnel_dns_records(tunnel_id, domain, account_id, token)
-    print("DNS records updated successfully")
+class Cloudflare_Error(Exception):
+    """
+    Raised when a Cloudflare API call fails.
 
+    Attributes:
+        status_code (int | None): HTTP status of the last response, None if no response was received.
+        errors (list): The `errors` list from the Cloudflare response body, if any.
+    """
+    def __init__(self, message: str, status_code: int | None = None, errors: list | None = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.errors = errors or []
 
-    # Start docker container that connects tunnel
-    print("\nStarting Cloudflare Tunnel Docker Container...")
-    _run_cf_docker_tunnel(tunnel_token)
-    print("Container successfully started")
+
+class Cloudflare_Rate_Limit_Error(Cloudflare_Error):
+    """Raised when Cloudflare keeps answering 429 after every retry was used."""
+
+
+class Cloudflare_Client:
+    """
+    Small client for the Cloudflare v4 API.
+
+    All calls share one `requests.Session`, so the TLS connection is kept alive and reused
+    between calls (and between threads). Rate limits (429), server errors and connection
+    errors are retried with exponential backoff, honouring the `Retry-After` header. A POST
+    creates something, so it is only retried when it surely wasn't handled: on a 429 or when
+    the connection failed before it was sent. After a server error or timeout the tunnel or
+    record may already exist, and running the installer again finds it instead of creating a
+    second one. Every call is timed, see `print_timings()`.
+
+    Attributes:
+        timings (List[tuple]): (method, path, status code, seconds) for every request sent.
+
+    Examples:
+        >>> client = Cloudflare_Client(token)
+        >>> zones = client.request("GET", "/zones", params={"name": "example.com"})
+    """
+    def __init__(self, token: str, max_retries: int = 5, backoff: float = 0.5, timeout: float = 30):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.timings: List[tuple] = []
+        self._timings_lock = threading.Lock()
+
+        import requests
+        import requests.adapters
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {token}",
+        })
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self.session.mount("https://", adapter)
+
+    def request(self, method: str, path: str, **kwargs) -> dict:
+        """
+        Send a request and return the parsed JSON body.
+
+        Args:
+            method: HTTP method.
+            path: Path after the API base url, like "/zones".
+            **kwargs: Passed to `requests.Session.request` (json, params...).
+
+        Returns:
+            dict: The response body.
+
+        Raises:
+            Cloudflare_Rate_Limit_Error: If the request is still rate limited after every retry.
+            Cloudflare_Error: If the request fails for any other reason.
+        """
+        import requests
+        url = CF_API_URL + path
+
+        for attempt in range(self.max_retries + 1):
+            start = time.monotonic()
+            try:
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            except requests.RequestException as e:
+                self._record(method, path, None, time.monotonic() - start)
+                if attempt == self.max_retries or (method == "POST" and not _request_not_sent(e)):
+                    raise Cloudflare_Error(f"{method} {path} failed: {e}") from e
+                time.sleep(self._backoff_delay(attempt))
+                continue
+
+            self._record(method, path, response.status_code, time.monotonic() - start)
+
+            if response.status_code == 429 or (response.status_code >= 500 and method != "POST"):
+                if attempt == self.max_retries:
+                    break
+                time.sleep(self._retry_after(response) or self._backoff_delay(attempt))
+                continue
+
+            return self._parse(method, path, response)
+
+        if response.status_code == 429:
+            raise Cloudflare_Rate_Limit_Error(f"{method} {path} is still rate limited after {self.max_retries} retries", 429)
+        raise Cloudflare_Error(f"{method} {path} failed with status {response.status_code}", response.status_code, self._errors(response))
+
+    def print_timings(self):
+        with self._timings_lock:
+            timings = list(self.timings)
+        if not timings:
+            return
+        total = sum(seconds for _, _, _, seconds in timings)
+        print(f"\nCloudflare API: {len(timings)} requests, {total:.2f}s total, {total / len(timings) * 1000:.0f}ms average")
+        for method, path, status_code, seconds in timings:
+            print(f"  {method:<6} {path:<60} {status_code or 'error'} {seconds * 1000:.0f}ms")
+
+    def _record(self, method, path, status_code, seconds):
+        with self._timings_lock:
+            self.timings.append((method, path, status_code, seconds))
+
+    def _backoff_delay(self, attempt: int) -> float:
+        # Exponential backoff with jitter so parallel callers don't retry in lock step
+        return self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+    def _retry_after(self, response) -> float | None:
+        value = response.headers.get("Retry-After")
+        try:
+            return max(0, float(value)) if value is not None else None
+        except ValueError:
+            return None
+
+    def _parse(self, method, path, response) -> dict:
+        try:
+            data = response.json()
+        except ValueError:
+            data = None
+
+        if response.status_code >= 400 or not isinstance(data, dict) or data.get("success") is False:
+            raise Cloudflare_Error(f"{method} {path} failed with status {response.status_code}", response.status_code, self._errors(response))
+
+        return data
+
+    def _errors(self, response) -> list:
+        try:
+            return response.json().get("errors", [])
+        except (ValueError, AttributeError):
+            return [response.text]
+
+
+def _request_not_sent(error) -> bool:
+    # Whether the connection failed before the request went out, so sending it again can't do it twice
+    import requests
+    import urllib3.exceptions
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(error, requests.ConnectionError) and isinstance(reason, urllib3.exceptions.NewConnectionError)
+
+
+def create_cf_tunnel(domain, account_id, token, state = None):
+    client = Cloudflare_Client(token)
+    try:
+        run_tasks(cf_tunnel_tasks(domain, account_id, client, state=state))
+    except Cloudflare_Error as e:
+        print(f"Cloudflare setup failed: {e}")
+        print(e.errors)
+        exit(1)
+    except Docker_Error as e:
+        print(f"Error starting the cloudflared container: {e}")
+        exit(1)
+    if state is not None:
+        state.save()
+    client.print_timings()
     print(f"visit https://{domain} to test it out\n")
 
 
+def cf_tunnel_tasks(domain, account_id, client, after = None, state = None) -> List[Task]:
+    """
+    Steps to set up a Cloudflare Tunnel for the domain, point its DNS at it and start the connector.
 
+    The tunnel and DNS record are reused if they already exist (see `provision_cf_tunnel()`)
+    and the connector is only started if it is not running yet, so running the installer
+    again does not leave duplicates behind. Looking up the DNS zone runs at the same time as
+    looking up the tunnel.
 
-def _create_tunnel(domain, account_id, token, tunnel_secret):
-    url = f"https://api.cloudflare.com/client/v4/accounts/{account_id}/cfd_tunnel"
+    Args:
+        domain: The domain n8n will be served on.
+        account_id: The Cloudflare account ID.
+        client: A `Cloudflare_Client` for a token with the Tunnel and DNS edit scopes.
+        after: Names of tasks that have to finish before the connector container is started.
+        state: The `state.Install_State` to record the tunnel and DNS record IDs in.
 
-    tunnel_name = f'n8n {domain} tunnel'
+    Returns:
+        List[Task]: The tasks to pass to `run_tasks()`. They raise `Cloudflare_Error` if an API call fails.
+    """
+    zone_cache = Zone_Cache(client, account_id)
 
-    payload = {
-        "config_src": "cloudflare",
-        "name": tunnel_name,
-        "tunnel_secret": tunnel_secret
-    }
+    return [
+        Task("cf_zone", lambda results: zone_cache.zone_id(domain)),
+        Task("cf_tunnel", lambda results: _provision_tunnel_step(client, domain, account_id, zone_cache, state)),
+        Task("cf_connector", lambda results: start_cf_connector(results["cf_tunnel"]["token"], results["cf_tunnel"]["id"]), ["cf_tunnel"] + (after or [])),
+    ]
 
-    headers = {
-        'Content-Type': "application/json",
-        'Authorization': f"Bearer {token}"
-    }
 
-    
+def _provision_tunnel_step(client, domain, account_id, zone_cache, state = None):
+    previous = (state.resources.get("cloudflare") if state is not None else None) or {}
+    if previous and previous.get("domain") != domain:
+        print(f"\nNote: the tunnel and DNS record of {previous.get('domain')} from the last run are left in place, delete them in the Cloudflare dashboard if they are not used anymore.")
+
+    print("\nSetting up Cloudflare Tunnel and DNS records...")
+    result = provision_cf_tunnel(client, domain, account_id, zone_cache)
+    print(f"Tunnel {'created' if result['created'] else 'already there, updated'} ({result['id']}), {domain} points to it")
 
-    response = requests.post(url, headers=headers, json=payload)
+    if state is not None:
+        state.set_resource("cloudflare", {
+            "domain": domain,
+            "account_id": account_id,
+            "tunnel_id": result["id"],
+            "dns_record_id": result["dns_record_id"],
+        })
+    return result
 
-    # Check for a successful response
-    if response.status_code == 200:
-        return response.json()
+
+def start_cf_connector(tunnel_token, tunnel_id = None):
+    """
+    Start the cloudflared container that connects the tunnel.
+
+    With the tunnel ID the container is named after it and comes back after a reboot, and it is
+    not started a second time if it already runs.
+
+    Args:
+        tunnel_token: The connector token of the tunnel.
+        tunnel_id: The ID of the tunnel.
+
+    Raises:
+        Docker_Error: If the container could not be checked or started.
+    """
+    name = f"cloudflared-{tunnel_id}" if tunnel_id else None
+    status = _cf_connector_status(name) if name else None
+    if status == "running":
+        print(f"\nCloudflare Tunnel Docker Container {name} is already running")
+        return
+
+    print("\nStarting Cloudflare Tunnel Docker Container...")
+    if status == "stopped":
+        _start_cf_docker_tunnel(name)
     else:
-        print(f"Failed to create tunnel. Status code: {response.status_code}")
-        print(response.json())
-        exit()
+        _run_cf_docker_tunnel(tunnel_token, name)
+    print("Container successfully started")
 
 
+def _create_tunnel(client, domain, account_id, tunnel_secret):
+    tunnel_name = f'n8n {domain} tunnel'
+
+    payload = {
+        "config_src": "cloudflare",
+        "name": tunnel_name,
+        "tunnel_secret": tunnel_secret
+    }
 
+    return client.request("POST", f"/accounts/{account_id}/cfd_tunnel", json=payload)
 
-def _add_domain_to_tunel(tunnel_id, domain, account_id, token):
-    url = f"https://api.cloudflare.com/client/v4/accounts/{account_id}/cfd_tunnel/{tunnel_id}/configurations"
 
-    local_ip = _get_local_ip()
+def _add_domain_to_tunel(client, tunnel_id, domain, account_id, service = None):
+    service = service or f"http://{_get_local_ip()}:5678"
 
     payload = {
         "config": {
             "ingress": [
                 {
                     "hostname":domain,
-                    "service": f"http://{local_ip}:5678"
+                    "service": service
                 },
                 {
                     "service": f"http_status:404"
@@ -88,72 +295,50 @@ def _add_domain_to_tunel(tunnel_id, domain, account_id, token):
         }
     }
 
-    headers = {
-        'Content-Type': "application/json",
-        'Authorization': f"Bearer {token}"
-    }
+    return client.request("PUT", f"/accounts/{account_id}/cfd_tunnel/{tunnel_id}/configurations", json=payload)
 
-    response = requests.put(url, headers=headers, json=payload)
 
-    # Check if the request was successful
-    if response.status_code == 200:
-        return response.json()
-    else:
-        print(f"Failed to update tunnel configuration. Status code: {response.status_code}")
-        exit()
+def _zone_name(domain):
+    extracted = _extract_domain(domain)
+    return f"{extracted.domain}.{extracted.suffix}"
 
 
-def _find_dns_zone_id(domain, account_id, token):
-    url = "https://api.cloudflare.com/client/v4/zones"
+_tld_extractor = None
+_tld_extractor_lock = threading.Lock()
 
 
-    extracted = tldextract.extract(domain)
-    search_domain = f"{extracted.domain}.{extracted.suffix}"
+def _extract_domain(domain):
+    # tldextract is only imported and the suffix list only parsed the first time it is needed
+    global _tld_extractor
+    with _tld_extractor_lock:
+        if _tld_extractor is None:
+            import tldextract
+            _tld_extractor = tldextract.TLDExtract(
+                cache_dir=PUBLIC_SUFFIX_CACHE_DIR,
+                suffix_list_urls=(f"file://{PUBLIC_SUFFIX_LIST_PATH}",),
+                fallback_to_snapshot=True,
+            )
+    return _tld_extractor(domain)
+
+
+def _find_dns_zone_id(client, domain, account_id):
+    search_domain = _zone_name(domain)
 
-    
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
-    
     params = {
         "name": search_domain,  # This will use the 'equal' operator by default
         "account.id": account_id
     }
-    
-    try:
-        response = requests.get(url, headers=headers, params=params)
-        response.raise_for_status()  # Raise an exception for 4xx and 5xx status codes
-        
-        data = response.json()
-        
-        if data["success"] and data["result"]:
-            # Return the ID of the first (and should be only) matching zone
-            return data["result"][0]["id"]
-        else:
-            print(f"No zone found for domain: {domain}")
-            exit()
-    
-    except requests.RequestException as e:
-        print(f"Error fetching zone ID: {e}")
-        if response:
-            print(f"Response content: {response.text}")
-        raise
 
+    data = client.request("GET", "/zones", params=params)
 
-def _add_tunnel_dns_records(tunnel_id, domain, account_id, token):
+    if not data["result"]:
+        raise Cloudflare_Error(f"No zone found for domain: {domain}")
 
-    zone_id = _find_dns_zone_id(domain, account_id, token)
+    # Return the ID of the first (and should be only) matching zone
+    return data["result"][0]["id"]
 
-    # Parse the domain
-    extracted = tldextract.extract(domain)
-    if extracted.subdomain:
-        name = extracted.subdomain
-    else:
-        name = '@'
 
-    # Generate a base64 ID
-    id = base64.b64encode(os.urandom(32)).decode('utf-8')
+def _add_tunnel_dns_records(client, tunnel_id, zone_id, domain):
 
     # Set the content to the tunnel URL
     content = f"{tunnel_id}.cfargotunnel.com"
@@ -161,40 +346,169 @@ def _add_tunnel_dns_records(tunnel_id, domain, account_id, token):
     # Prepare the payload
     payload = {
         "type": "CNAME",
-        "name": name,
+        "name": domain,
         "content": content,
         "ttl": 1, 
         "proxied": True,
         "comment": f"Added by automatic tunnel setup script for tunnel ID: {tunnel_id}",
-        "id": id
     }
 
-    # Prepare the headers
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {token}"
+    return client.request("POST", f"/zones/{zone_id}/dns_records", json=payload)
+
+
+
+
+class Zone_Cache:
+    """
+    Looks up each Cloudflare zone ID once, even when many hostnames in the same zone
+    are provisioned from different threads at the same time.
+    """
+    def __init__(self, client, account_id):
+        self.client = client
+        self.account_id = account_id
+        self._lock = threading.Lock()
+        self._zones: dict[str, Future] = {}
+
+    def zone_id(self, domain) -> str:
+        zone_name = _zone_name(domain)
+        with self._lock:
+            future = self._zones.get(zone_name)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                self._zones[zone_name] = future
+
+        if is_owner:
+            try:
+                future.set_result(_find_dns_zone_id(self.client, domain, self.account_id))
+            except BaseException as e:
+                future.set_exception(e)
+
+        return future.result()
+
+
+def provision_cf_tunnel(client, domain, account_id, zone_cache, service = None) -> dict:
+    """
+    Create or update the tunnel, ingress config and CNAME record for one hostname.
+
+    An existing tunnel named `n8n <domain> tunnel` is reused instead of creating a second one,
+    and an existing DNS record for the hostname is updated instead of duplicated, so running
+    this again for the same hostname is safe.
+
+    Args:
+        client: A `Cloudflare_Client`.
+        domain: The hostname to route through the tunnel.
+        account_id: The Cloudflare account ID.
+        zone_cache: A `Zone_Cache` shared between calls.
+        service: Where the tunnel sends traffic, defaults to n8n on this machine.
+
+    Returns:
+        dict: The tunnel "id", its connector "token", whether it was "created" and the
+            "dns_record_id".
+
+    Raises:
+        Cloudflare_Error: If an API call fails.
+    """
+    tunnel = _find_tunnel(client, account_id, f"n8n {domain} tunnel")
+    created = tunnel is None
+
+    if created:
+        tunnel_secret = base64.b64encode(os.urandom(32)).decode('utf-8')
+        tunnel = _create_tunnel(client, domain, account_id, tunnel_secret)["result"]
+        tunnel_token = tunnel["token"]
+    else:
+        tunnel_token = client.request("GET", f"/accounts/{account_id}/cfd_tunnel/{tunnel['id']}/token")["result"]
+
+    _add_domain_to_tunel(client, tunnel["id"], domain, account_id, service)
+    dns_record = _upsert_tunnel_dns_record(client, tunnel["id"], zone_cache.zone_id(domain), domain)
+
+    return {
+        "id": tunnel["id"],
+        "token": tunnel_token,
+        "created": created,
+        "dns_record_id": dns_record["id"],
+    }
+
+
+def _find_tunnel(client, account_id, tunnel_name):
+    params = {
+        "name": tunnel_name,
+        "is_deleted": "false",
+    }
+    tunnels = client.request("GET", f"/accounts/{account_id}/cfd_tunnel", params=params)["result"]
+    return tunnels[0] if tunnels else None
+
+
+def _upsert_tunnel_dns_record(client, tunnel_id, zone_id, domain):
+    content = f"{tunnel_id}.cfargotunnel.com"
+    params = {
+        "type": "CNAME",
+        "name": domain,
+    }
+    records = client.request("GET", f"/zones/{zone_id}/dns_records", params=params)["result"]
+
+    if not records:
+        return _add_tunnel_dns_records(client, tunnel_id, zone_id, domain)["result"]
+
+    record = records[0]
+    if record["content"] == content and record["proxied"]:
+        return record
+
+    payload = {
+        "type": "CNAME",
+        "name": domain,
+        "content": content,
+        "ttl": 1,
+        "proxied": True,
+        "comment": f"Added by automatic tunnel setup script for tunnel ID: {tunnel_id}",
     }
+    return client.request("PUT", f"/zones/{zone_id}/dns_records/{record['id']}", json=payload)["result"]
+
+
+def _cf_connector_status(name):
+    # "running", "stopped" or None if there is no container with the name
+    client = get_client()
+    if client is None:
+        status = _docker_command(f"sudo docker ps -a --filter name=^/{name}$ --format '{{{{.State}}}}'").strip()
+        return None if not status else "running" if status == "running" else "stopped"
 
-    # Make the API request
-    url = f"https://api.cloudflare.com/client/v4/zones/{zone_id}/dns_records"
-    
     try:
-        response = requests.post(url, json=payload, headers=headers)
-        response.raise_for_status()  # Raise an exception for 4xx and 5xx status codes
-        return response.json()
-    except requests.RequestException as e:
-        print(f"Error adding DNS record: {e}")
-        if response:
-            print(f"Response content: {response.text}")
-        raise
+        return "running" if client.inspect(name)["State"]["Running"] else "stopped"
+    except Docker_Error as e:
+        if e.status_code != 404:
+            raise
+        return None
+
 
+def _start_cf_docker_tunnel(name):
+    client = get_client()
+    if client is None:
+        _docker_command(f"sudo docker start {name}")
+        return
+    client.start(name)
 
 
+def _run_cf_docker_tunnel(tunnel_token, name = None):
+    # run docker from token returned from creation, a named connector comes back after reboots
+    restart_policy = "unless-stopped" if name else None
+    client = get_client()
+    if client is None:
+        name_options = f"--name {name} --restart {restart_policy} " if name else ""
+        _docker_command(f"sudo docker run -d {name_options}{CLOUDFLARED_IMAGE} tunnel --no-autoupdate run --token {tunnel_token}")
+        return
 
-def _run_cf_docker_tunnel(tunnel_token):
-    # run docker from token returned from creation
+    client.run(CLOUDFLARED_IMAGE, ["tunnel", "--no-autoupdate", "run", "--token", tunnel_token], name=name, restart_policy=restart_policy)
 
-    run_command(f"sudo docker run -d cloudflare/cloudflared:latest tunnel --no-autoupdate run --token {tunnel_token}")
+
+def _docker_command(command):
+    # The docker CLI, for when the socket can't be used. Failures raise like the API client does
+    try:
+        return "\n".join(stream_command(command))
+    except Command_Error as e:
+        # Without the token
+        shown_command = command.split(" --token ")[0]
+        output = "\n".join(e.tail[-5:])
+        raise Docker_Error(f"{shown_command} exited with code {e.returncode}: {output}") from e
 
 
 
@@ -0,0 +1,425 @@
+"""
+Registry of the environment variables written to the n8n config files.
+
+Every variable is declared once, with the section it is listed under, its default value,
+whether it is a secret and which files it is written to. `render_config()` walks the
+registry a single time and builds the .env file, the `environment:` list of the docker
+compose file and a markdown reference of the configuration together.
+
+Usage:
+    >>> files = render_config(env_vars)
+    >>> create_file("n8n/.env", files["env"])
+"""
+from enum import Enum
+from typing import Any, Dict, List, Optional
+
+
+class Env_Target(Enum):
+    """
+    The files a variable is written to.
+
+    Attributes:
+        ENV: Written to the .env file.
+        ENV_COMMENTED: Written commented out to the .env file, as a hint for the user.
+        COMPOSE: Passed to the n8n containers in docker-compose.yaml.
+    """
+    ENV = ".env"
+    ENV_COMMENTED = ".env (commented out)"
+    COMPOSE = "docker-compose.yaml"
+
+
+class Env_Var:
+    """
+    A single environment variable in the registry.
+
+    The parts of the rendered lines that only depend on the name are built once here, so
+    rendering a config only has to fill in the values.
+
+    Attributes:
+        name (str): The name of the variable.
+        default (str | None): The default value. None leaves the variable unset.
+        secret (bool): Whether the value is hidden in the generated docs.
+        targets (List[Env_Target]): The files the variable is written to.
+        section (str | None): The section the variable is listed under, set by `_section()`.
+        subsection (str | None): The subsection within the section, if any.
+    """
+    def __init__(self, name: str, default: Optional[str] = None, secret: bool = False, targets: Optional[List[Env_Target]] = None):
+        self.name: str = name
+        self.default: str | None = default
+        self.secret: bool = secret
+        self.targets: List[Env_Target] = targets or [Env_Target.ENV, Env_Target.COMPOSE]
+        self.section: str | None = None
+        self.subsection: str | None = None
+
+        self.commented: bool = Env_Target.ENV_COMMENTED in self.targets
+        self.in_compose: bool = Env_Target.COMPOSE in self.targets
+        self.compose_line: str = f"    - {name}=${{{name}}}"
+        self.env_unset_line: str = f"# {name}="
+        self.env_prefix: str = f'# {name}="' if self.commented else f'{name}="'
+        self.docs_prefix: str = f"| `{name}` | "
+        self.docs_suffix: str = f" | {_docs_value(default, secret)} | {', '.join(target.value for target in self.targets)} |"
+        # Headings written before this variable when it starts a (sub)section, see `_build_headings()`
+        self.env_heading: str = ""
+        self.docs_heading: str = ""
+
+
+def _section(title: str, variables: List[Env_Var], subsection: Optional[str] = None) -> List[Env_Var]:
+    for variable in variables:
+        variable.section = title
+        variable.subsection = subsection
+    return variables
+
+
+def _docs_value(value: Any, secret: bool) -> str:
+    if value is None:
+        return "not set"
+    if secret:
+        return "*hidden*"
+    return f"`{value}`"
+
+
+ENV_HEADER = """
+# See Vars at https://docs.n8n.io/hosting/configuration/environment-variables/
+# File setup by an automated script by liam@teraprise.io found here https://github.com/liamdmcgarrigle/n8n-auto-install"""
+
+DOCS_HEADER = """# n8n configuration
+
+Generated by n8n-auto-install. See https://docs.n8n.io/hosting/configuration/environment-variables/ for what every variable does.
+Variables that are not set use the n8n default."""
+
+_DOCS_TABLE_HEADER = "| Variable | Value | Default | Files |\n|---|---|---|---|"
+
+
+ENV_REGISTRY: List[Env_Var] = [
+    *_section("N8N VERSION", variables=[
+        Env_Var("N8N_VERSION", "latest", targets=[Env_Target.ENV]),
+    ]),
+    # Not an n8n variable, read by the worker services in docker-compose.yaml
+    *_section("QUEUE MODE WORKERS (used by docker-compose.yaml)", variables=[
+        Env_Var("N8N_WORKER_CONCURRENCY", "10", targets=[Env_Target.ENV]),
+    ]),
+    # Not an n8n variable, read by the grafana service in docker-compose.yaml
+    *_section("MONITORING (used by docker-compose.yaml)", variables=[
+        Env_Var("GRAFANA_ADMIN_PASSWORD", secret=True, targets=[Env_Target.ENV]),
+    ]),
+    *_section("CREDENTIALS VARIABLES", variables=[
+        Env_Var("CREDENTIALS_DEFAULT_NAME", "My credentials"),
+    ]),
+    *_section("DATABASE VARIABLES", variables=[
+        Env_Var("DB_TYPE", "sqlite"),
+        Env_Var("DB_TABLE_PREFIX"),
+        Env_Var("DB_SQLITE_VACUUM_ON_STARTUP", "false"),
+        Env_Var("DB_SQLITE_POOL_SIZE"),
+        Env_Var("DB_SQLITE_DATABASE"),
+        Env_Var("DB_POSTGRESDB_DATABASE"),
+        Env_Var("DB_POSTGRESDB_HOST"),
+        Env_Var("DB_POSTGRESDB_PORT"),
+        Env_Var("DB_POSTGRESDB_USER"),
+        Env_Var("DB_POSTGRESDB_PASSWORD", secret=True),
+        Env_Var("DB_POSTGRESDB_SCHEMA"),
+        Env_Var("DB_POSTGRESDB_POOL_SIZE"),
+    ]),
+    *_section("DEPLOYMENT VARIABLES", variables=[
+        Env_Var("N8N_EDITOR_BASE_URL"),
+        Env_Var("N8N_PERSONALIZATION_ENABLED", "false"),
+        Env_Var("N8N_CONFIG_FILES"),
+        Env_Var("N8N_DISABLE_UI"),
+        Env_Var("N8N_PREVIEW_MODE"),
+        Env_Var("N8N_TEMPLATES_ENABLED", "false"),
+        Env_Var("N8N_TEMPLATES_HOST"),
+        Env_Var("N8N_ENCRYPTION_KEY", secret=True),
+        Env_Var("N8N_GRACEFUL_SHUTDOWN_TIMEOUT", "30"),
+        Env_Var("N8N_PUBLIC_API_DISABLED"),
+        Env_Var("N8N_HIRING_BANNER_ENABLED"),
+    ]),
+    *_section("BINARY DATA", variables=[
+        Env_Var("N8N_AVAILABLE_BINARY_DATA_MODES"),
+        Env_Var("N8N_BINARY_DATA_STORAGE_PATH"),
+        Env_Var("N8N_DEFAULT_BINARY_DATA_MODE"),
+    ]),
+    *_section("USER MANAGEMENT", subsection="SMTP EMAIL", variables=[
+        Env_Var("N8N_EMAIL_MODE", "smtp"),
+        Env_Var("N8N_SMTP_HOST"),
+        Env_Var("N8N_SMTP_PORT"),
+        Env_Var("N8N_SMTP_USER"),
+        Env_Var("N8N_SMTP_PASS", secret=True),
+    ]),
+    *_section("USER MANAGEMENT", subsection="SERVICE ACCOUNT EMAIL", variables=[
+        Env_Var("N8N_SMTP_OAUTH_SERVICE_CLIENT"),
+        Env_Var("N8N_SMTP_OAUTH_PRIVATE_KEY", secret=True),
+        Env_Var("N8N_SMTP_SENDER"),
+        Env_Var("N8N_SMTP_SSL", "true"),
+    ]),
+    *_section("USER MANAGEMENT", subsection="Templates", variables=[
+        Env_Var("N8N_UM_EMAIL_TEMPLATES_INVITE"),
+        Env_Var("N8N_UM_EMAIL_TEMPLATES_PWRESET"),
+        Env_Var("N8N_UM_EMAIL_TEMPLATES_WORKFLOW_SHARED"),
+        Env_Var("N8N_UM_EMAIL_TEMPLATES_CREDENTIALS_SHARED"),
+    ]),
+    *_section("USER MANAGEMENT", subsection="Token options", variables=[
+        Env_Var("N8N_USER_MANAGEMENT_JWT_SECRET", secret=True),
+        Env_Var("N8N_USER_MANAGEMENT_JWT_DURATION_HOURS"),
+        Env_Var("N8N_USER_MANAGEMENT_JWT_REFRESH_TIMEOUT_HOURS"),
+        Env_Var("N8N_MFA_ENABLED"),
+    ]),
+    *_section("ENDPOINTS", variables=[
+        Env_Var("N8N_PAYLOAD_SIZE_MAX", "16"),
+        Env_Var("N8N_METRICS", "false"),
+        Env_Var("N8N_METRICS_PREFIX", "n8n_"),
+        Env_Var("N8N_METRICS_INCLUDE_DEFAULT_METRICS", "true"),
+        Env_Var("N8N_METRICS_INCLUDE_CACHE_METRICS", "false"),
+        Env_Var("N8N_METRICS_INCLUDE_MESSAGE_EVENT_BUS_METRICS", "false"),
+        Env_Var("N8N_METRICS_INCLUDE_WORKFLOW_ID_LABEL", "false"),
+        Env_Var("N8N_METRICS_INCLUDE_NODE_TYPE_LABEL", "false"),
+        Env_Var("N8N_METRICS_INCLUDE_CREDENTIAL_TYPE_LABEL", "false"),
+        Env_Var("N8N_METRICS_INCLUDE_API_ENDPOINTS", "false"),
+        Env_Var("N8N_METRICS_INCLUDE_API_PATH_LABEL", "false"),
+        Env_Var("N8N_METRICS_INCLUDE_API_METHOD_LABEL", "false"),
+        Env_Var("N8N_METRICS_INCLUDE_API_STATUS_CODE_LABEL", "false"),
+        Env_Var("N8N_METRICS_INCLUDE_QUEUE_METRICS", "false"),
+        Env_Var("N8N_ENDPOINT_REST", "rest"),
+        Env_Var("N8N_ENDPOINT_WEBHOOK", "webhook"),
+        Env_Var("N8N_ENDPOINT_WEBHOOK_TEST", "webhook-test"),
+        Env_Var("N8N_ENDPOINT_WEBHOOK_WAIT", "webhook-waiting"),
+        Env_Var("WEBHOOK_URL"),
+        Env_Var("N8N_DISABLE_PRODUCTION_MAIN_PROCESS", "false"),
+    ]),
+    *_section("EXTERNAL HOOKS", variables=[
+        Env_Var("EXTERNAL_HOOK_FILES"),
+        Env_Var("EXTERNAL_FRONTEND_HOOKS_URLS"),
+    ]),
+    *_section("EXECUTION", variables=[
+        Env_Var("EXECUTIONS_MODE", "regular"),
+        Env_Var("EXECUTIONS_TIMEOUT", "-1"),
+        Env_Var("EXECUTIONS_TIMEOUT_MAX", "3600"),
+        Env_Var("EXECUTIONS_DATA_SAVE_ON_ERROR", "all"),
+        Env_Var("EXECUTIONS_DATA_SAVE_ON_SUCCESS", "all"),
+        Env_Var("EXECUTIONS_DATA_SAVE_ON_PROGRESS", "false"),
+        Env_Var("EXECUTIONS_DATA_SAVE_MANUAL_EXECUTIONS", "true"),
+        Env_Var("EXECUTIONS_DATA_PRUNE", "true"),
+        Env_Var("EXECUTIONS_DATA_MAX_AGE", "336"),
+        Env_Var("EXECUTIONS_DATA_PRUNE_MAX_COUNT", "10000"),
+        Env_Var("EXECUTIONS_DATA_HARD_DELETE_BUFFER", "1"),
+        Env_Var("EXECUTIONS_DATA_PRUNE_HARD_DELETE_INTERVAL", "15"),
+        Env_Var("EXECUTIONS_DATA_PRUNE_SOFT_DELETE_INTERVAL", "60"),
+        Env_Var("N8N_CONCURRENCY_PRODUCTION_LIMIT", "-1"),
+    ]),
+    *_section("LOGS", variables=[
+        Env_Var("N8N_LOG_LEVEL", "info"),
+        Env_Var("N8N_LOG_OUTPUT", "console"),
+        Env_Var("N8N_LOG_FILE_COUNT_MAX"),
+        Env_Var("N8N_LOG_FILE_SIZE_MAX"),
+        Env_Var("N8N_LOG_FILE_LOCATION"),
+        Env_Var("DB_LOGGING_ENABLED", "false"),
+        Env_Var("DB_LOGGING_OPTIONS"),
+        Env_Var("DB_LOGGING_MAX_EXECUTION_TIME"),
+        Env_Var("CODE_ENABLE_STDOUT", "false"),
+    ]),
+    *_section("LOG STREAMING", variables=[
+        Env_Var("N8N_EVENTBUS_CHECKUNSENTINTERVAL", "0", targets=[Env_Target.ENV_COMMENTED]),
+        Env_Var("N8N_EVENTBUS_LOGWRITER_SYNCFILEACCESS", "false", targets=[Env_Target.ENV_COMMENTED]),
+        Env_Var("N8N_EVENTBUS_LOGWRITER_KEEPLOGCOUNT", "3", targets=[Env_Target.ENV_COMMENTED]),
+        Env_Var("N8N_EVENTBUS_LOGWRITER_MAXFILESIZEINKB", "10240", targets=[Env_Target.ENV_COMMENTED]),
+        Env_Var("N8N_EVENTBUS_LOGWRITER_LOGBASENAME", "n8nEventLog", targets=[Env_Target.ENV_COMMENTED]),
+    ]),
+    *_section("EXTERNAL DATA STORAGE", variables=[
+        Env_Var("N8N_EXTERNAL_STORAGE_S3_HOST"),
+        Env_Var("N8N_EXTERNAL_STORAGE_S3_PROTOCOL"),
+        Env_Var("N8N_EXTERNAL_STORAGE_S3_BUCKET_NAME"),
+        Env_Var("N8N_EXTERNAL_STORAGE_S3_BUCKET_REGION"),
+        Env_Var("N8N_EXTERNAL_STORAGE_S3_ACCESS_KEY"),
+        Env_Var("N8N_EXTERNAL_STORAGE_S3_ACCESS_SECRET", secret=True),
+    ]),
+    *_section("NODES", variables=[
+        Env_Var("NODES_INCLUDE"),
+        Env_Var("NODES_EXCLUDE"),
+        Env_Var("NODE_FUNCTION_ALLOW_BUILTIN"),
+        Env_Var("NODE_FUNCTION_ALLOW_EXTERNAL"),
+        Env_Var("NODES_ERROR_TRIGGER_TYPE", "n8n-nodes-base.errorTrigger"),
+        Env_Var("N8N_CUSTOM_EXTENSIONS"),
+        Env_Var("N8N_COMMUNITY_PACKAGES_ENABLED", "true"),
+        Env_Var("N8N_COMMUNITY_PACKAGES_REGISTRY", "https://registry.npmjs.org"),
+    ]),
+    *_section("QUEUE MODE", variables=[
+        Env_Var("QUEUE_BULL_PREFIX"),
+        Env_Var("QUEUE_BULL_REDIS_DB"),
+        Env_Var("QUEUE_BULL_REDIS_HOST", "localhost"),
+        Env_Var("QUEUE_BULL_REDIS_PORT", "6379"),
+        Env_Var("QUEUE_BULL_REDIS_USERNAME"),
+        Env_Var("QUEUE_BULL_REDIS_PASSWORD", secret=True),
+        Env_Var("QUEUE_BULL_REDIS_TIMEOUT_THRESHOLD", "1000"),
+        Env_Var("QUEUE_BULL_REDIS_CLUSTER_NODES"),
+        Env_Var("QUEUE_BULL_REDIS_TLS"),
+        Env_Var("QUEUE_RECOVERY_INTERVAL"),
+        Env_Var("QUEUE_HEALTH_CHECK_ACTIVE", "false"),
+        Env_Var("QUEUE_HEALTH_CHECK_PORT"),
+        Env_Var("QUEUE_WORKER_LOCK_DURATION", "30000"),
+        Env_Var("QUEUE_WORKER_LOCK_RENEW_TIME", "15000"),
+        Env_Var("QUEUE_WORKER_STALLED_INTERVAL", "30000"),
+        Env_Var("QUEUE_WORKER_MAX_STALLED_COUNT", "1"),
+    ]),
+    *_section("SECURITY", variables=[
+        Env_Var("N8N_BLOCK_ENV_ACCESS_IN_NODE", "false"),
+        Env_Var("N8N_RESTRICT_FILE_ACCESS_TO"),
+        Env_Var("N8N_BLOCK_FILE_ACCESS_TO_N8N_FILES", "true"),
+        Env_Var("N8N_SECURITY_AUDIT_DAYS_ABANDONED_WORKFLOW", "90"),
+        Env_Var("N8N_SECURE_COOKIE", "true"),
+    ]),
+    *_section("GIT", variables=[
+        Env_Var("N8N_SOURCECONTROL_DEFAULT_SSH_KEY_TYPE", "ed25519"),
+    ]),
+    *_section("EXTERNAL SECRETS", variables=[
+        Env_Var("N8N_EXTERNAL_SECRETS_UPDATE_INTERVAL"),
+    ]),
+    *_section("LOCAL", variables=[
+        Env_Var("GENERIC_TIMEZONE"),
+        Env_Var("N8N_DEFAULT_LOCALE"),
+    ]),
+    *_section("WORKFLOWS", variables=[
+        Env_Var("WORKFLOWS_DEFAULT_NAME", "My workflow"),
+        Env_Var("N8N_ONBOARDING_FLOW_DISABLED", "false"),
+        Env_Var("N8N_WORKFLOW_TAGS_DISABLED", "false"),
+        Env_Var("N8N_WORKFLOW_CALLER_POLICY_DEFAULT_OPTION", "workflowsFromSameOwner"),
+    ]),
+    *_section("LICENSE", variables=[
+        Env_Var("N8N_HIDE_USAGE_PAGE", "false"),
+        Env_Var("N8N_LICENSE_ACTIVATION_KEY", secret=True),
+        Env_Var("N8N_LICENSE_AUTO_RENEW_ENABLED", "true"),
+        Env_Var("N8N_LICENSE_AUTO_RENEW_OFFSET"),
+        Env_Var("N8N_LICENSE_SERVER_URL"),
+        Env_Var("HTTP_PROXY_LICENSE_SERVER"),
+        Env_Var("HTTPS_PROXY_LICENSE_SERVER"),
+    ]),
+]
+
+
+def _build_headings(registry: List[Env_Var]):
+    section = subsection = None
+    for variable in registry:
+        variable.env_heading = variable.docs_heading = ""
+        if variable.section != section:
+            variable.env_heading += f"\n# {variable.section}\n"
+            variable.docs_heading += f"\n## {variable.section}\n"
+            if variable.subsection is None:
+                variable.docs_heading += f"\n{_DOCS_TABLE_HEADER}\n"
+        if variable.subsection is not None and (variable.section, variable.subsection) != (section, subsection):
+            variable.env_heading += f"#  {variable.subsection}\n"
+            variable.docs_heading += f"\n### {variable.subsection}\n\n{_DOCS_TABLE_HEADER}\n"
+        section, subsection = variable.section, variable.subsection
+
+
+_build_headings(ENV_REGISTRY)
+
+
+def default_env_vars(registry: List[Env_Var] = ENV_REGISTRY) -> Dict[str, Any]:
+    """
+    Get the default value of every variable in the registry.
+
+    Returns:
+        dict: The default values keyed by variable name, in registry order.
+    """
+    return {variable.name: variable.default for variable in registry}
+
+
+def secret_names(registry: List[Env_Var] = ENV_REGISTRY) -> set:
+    """
+    Get the names of the variables with secret values.
+
+    Returns:
+        set: The names of every variable marked as secret in the registry.
+    """
+    return {variable.name for variable in registry if variable.secret}
+
+
+def render_config(env_vars: Dict[str, Any], registry: List[Env_Var] = ENV_REGISTRY) -> Dict[str, str]:
+    """
+    Render the config files from the values of the variables, in a single pass over the registry.
+
+    Variables missing from `env_vars` or set to None are written commented out in the .env file.
+    Unset and empty variables are left out of docker-compose.yaml so n8n uses its own default.
+    Values in `env_vars` that are not in the registry are ignored.
+
+    Args:
+        env_vars: The value of every variable, keyed by name.
+        registry: The variables to render, `ENV_REGISTRY` by default.
+
+    Returns:
+        dict: With the keys:
+            - "env": The content of the .env file.
+            - "compose": The `environment:` lines of docker-compose.yaml, indented for the `x-n8n` block.
+            - "docs": A markdown reference of the configuration, with the secrets hidden.
+    """
+    env_lines = [ENV_HEADER]
+    compose_lines = []
+    docs_lines = [DOCS_HEADER]
+    get = env_vars.get
+
+    for variable in registry:
+        value = get(variable.name)
+
+        if value is None:
+            env_lines.append(variable.env_heading + variable.env_unset_line)
+            docs_lines.append(variable.docs_heading + variable.docs_prefix + "not set" + variable.docs_suffix)
+            continue
+
+        value = str(value)
+        env_lines.append(f'{variable.env_heading}{variable.env_prefix}{value}"')
+        if variable.in_compose and value:
+            compose_lines.append(variable.compose_line)
+        docs_value = "*hidden*" if variable.secret else f"`{value}`"
+        docs_lines.append(variable.docs_heading + variable.docs_prefix + docs_value + variable.docs_suffix)
+
+    return {
+        "env": "\n".join(env_lines) + "\n",
+        "compose": "\n".join(compose_lines),
+        "docs": "\n".join(docs_lines) + "\n",
+    }
+
+
+def read_env_file(path: str) -> Dict[str, str]:
+    """
+    Read the values of a .env file written by `render_config()`.
+
+    Args:
+        path: Path to the .env file, like "n8n/.env".
+
+    Returns:
+        dict: The value of every variable that is set, keyed by name. Commented out variables are left out.
+    """
+    values = {}
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#") or "=" not in line:
+                continue
+            name, value = line.split("=", 1)
+            if len(value) >= 2 and value[0] == value[-1] == '"':
+                value = value[1:-1]
+            values[name] = value
+    return values
+
+
+def update_env_file(path: str, values: Dict[str, Any]):
+    """
+    Set variables in a .env file written by `render_config()`, keeping the rest of the file.
+
+    A variable that is commented out is set in place, one that is missing is added at the end.
+    A value of None comments the variable out again, like `render_config()` writes unset ones.
+
+    Args:
+        path: Path to the .env file, like "n8n/.env".
+        values: The new value of every variable to set (or None to unset), keyed by name.
+    """
+    with open(path) as f:
+        lines = f.read().splitlines()
+
+    remaining = dict(values)
+    for index, line in enumerate(lines):
+        name = line.lstrip("# ").split("=", 1)[0]
+        if "=" in line and name in remaining:
+            value = remaining.pop(name)
+            lines[index] = f"# {name}=" if value is None else f'{name}="{value}"'
+    lines += [f'{name}="{value}"' for name, value in remaining.items() if value is not None]
+
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
@@ -19,11 +19,14 @@ Requirements:
 Note:
     On macOS, the script will attempt to install Homebrew if it's not already installed.
 """
-from utils import run_command
+from utils import run_command, wait_until
+from docker_api import Docker_Client, Docker_Error, Pull_Progress, get_client
+import json
+import os
 import platform
 import subprocess
 import sys
-import requests
+import threading
 import time
 
 
@@ -31,6 +34,7 @@ def _command_exists(cmd):
     return subprocess.call(f"type {cmd}", shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE) == 0
 
 def _get_latest_docker_compose_version():
+    import requests
     url = "https://api.github.com/repos/docker/compose/releases/latest"
     try:
         response = requests.get(url)
@@ -42,7 +46,13 @@ def _get_latest_docker_compose_version():
 
 def _is_docker_installed():
     print("\nChecking if docker is installed...")
-    return _command_exists("docker") and subprocess.call("docker info >/dev/null 2>&1", shell=True) == 0
+    return _command_exists("docker") and _is_docker_running()
+
+def _is_docker_running():
+    # The socket answers without forking the CLI, but might only be accessible to root
+    if Docker_Client().ping():
+        return True
+    return subprocess.call("docker info >/dev/null 2>&1", shell=True) == 0
 
 def _install_docker_linux():
     if _is_docker_installed():
@@ -50,7 +60,7 @@ def _install_docker_linux():
     else:
         print("Installing Docker...")
         run_command("curl -fsSL https://get.docker.com -o get-docker.sh")
-        run_command("sudo sh get-docker.sh")
+        run_command("sudo sh get-docker.sh", show_output=True)
         run_command("rm get-docker.sh")
     
     if _command_exists("docker-compose"):
@@ -78,11 +88,10 @@ def _install_docker_mac():
         _install_homebrew()
     
     print("Installing Docker via homebrew... (this will take a few minutes and will require a password)")
-    run_command("brew install --cask docker")
+    run_command("brew install --cask docker", show_output=True)
     print("Docker Desktop has been installed.")
     
     print("Launching Docker Desktop...")
-    time.sleep(5)
     run_command("open /Applications/Docker.app")
     
     print("\nIMPORTANT: To complete the setup, please do the following:")
@@ -95,19 +104,279 @@ def _install_docker_mac():
 
 def _wait_for_docker_daemon():
     print("Waiting for Docker daemon to start...")
-    max_attempts = 60
-    for attempt in range(max_attempts):
-        if _is_docker_installed():
-            print("Docker daemon is now running.")
-            return
-        if attempt % 10 == 0 and attempt > 0:
-            print(f"Still waiting for Docker daemon... (Attempt {attempt}/{max_attempts})")
-        time.sleep(5)
+    start = time.monotonic()
+    if wait_until(_is_docker_running, timeout=300, initial_delay=0.5):
+        print(f"Docker daemon is now running ({time.monotonic() - start:.0f}s).")
+        return
     print("Warning: Docker daemon didn't start within the expected time.")
     print("Ensure that docker desktop opened and the engine is running.")
     print("Once it is restart the script.")
     exit()
 
+
+def wait_for_compose_services(project_dir: str, timeout: float = 300, max_restarts: int = 3) -> float:
+    """
+    Wait until every service of a compose project is ready.
+
+    A service is ready when its container is running and, if it has a healthcheck, healthy.
+    One-off containers (restart policy "no") are ready once they exited successfully. The
+    containers are checked again on every docker event of the project (a container starting,
+    exiting or changing health), so the wait ends the moment the last service becomes ready.
+    Without access to the docker socket they are polled with a backoff that starts at a quarter
+    second instead.
+
+    A container that restarted `max_restarts` times since the wait started, exited with an
+    error or is unhealthy is crash-looping. The wait stops straight away and prints the end of its logs.
+
+    Args:
+        project_dir: Folder with the docker-compose.yaml file.
+        timeout: Seconds to wait at most.
+        max_restarts: Restarts during the wait after which a container counts as crash-looping.
+
+    Returns:
+        float: Seconds it took for every service to be ready.
+
+    Raises:
+        SystemExit: If a service is crash-looping or not ready within the timeout.
+    """
+    start = time.monotonic()
+    last_waiting_on = None
+    restarts_at_start = None
+
+    def evaluate(containers):
+        nonlocal last_waiting_on, restarts_at_start
+        if restarts_at_start is None:
+            restarts_at_start = {container["id"]: container["restarts"] for container in containers}
+        state, containers = compose_status(containers, max_restarts, restarts_at_start)
+        if state != "waiting":
+            return (state, containers)
+
+        waiting_on = sorted(f"{container['service']} ({container['health'] or container['status']})" for container in containers)
+        if waiting_on and waiting_on != last_waiting_on:
+            print(f"Waiting for {', '.join(waiting_on)}...")
+            last_waiting_on = waiting_on
+        return None
+
+    client = get_client()
+    if client:
+        result = _wait_on_events(client, project_dir, evaluate, timeout)
+    else:
+        result = wait_until(lambda: evaluate(_inspect_compose_containers(project_dir)), timeout)
+
+    if result is None:
+        print(f"\nError: the containers were not ready within {timeout:.0f}s.")
+        for container in _inspect_compose_containers(project_dir):
+            if not _container_ready(container):
+                _print_service_logs(project_dir, container["service"])
+        exit(1)
+
+    state, failed = result
+    if state == "failed":
+        for container in failed:
+            print(f"\nError: {container['service']} is not starting ({container['status']}, {container['health'] or 'no healthcheck'}, restarted {container['restarts']} times).")
+            _print_service_logs(project_dir, container["service"])
+        exit(1)
+
+    return time.monotonic() - start
+
+
+def _wait_on_events(client: Docker_Client, project_dir: str, evaluate, timeout: float):
+    # Like `wait_until(check, timeout)`, but checks the containers again on every event of the
+    # project instead of polling. A health change only needs the health of that one container.
+    deadline = time.monotonic() + timeout
+    project = os.path.basename(os.path.abspath(project_dir)).lower()
+    filters = {
+        "type": ["container"],
+        "label": [f"com.docker.compose.project={project}"],
+        "event": ["create", "start", "restart", "die", "destroy", "health_status"],
+    }
+    # Events from before the first check are replayed, so nothing happening in between is missed
+    since = time.time()
+    containers = _inspect_compose_containers(project_dir)
+    result = evaluate(containers)
+    if result:
+        return result
+
+    try:
+        for event in client.events(filters, since=since, until=since + timeout):
+            container_id = event.get("Actor", {}).get("ID")
+            known = next((container for container in containers if container["id"] == container_id), None)
+            if known and event.get("Action", "").startswith("health_status"):
+                known["health"] = client.health(container_id)
+            else:
+                containers = _inspect_compose_containers(project_dir)
+            result = evaluate(containers)
+            if result:
+                return result
+    except (OSError, Docker_Error):
+        # The event stream broke off, poll for the rest of the timeout
+        return wait_until(lambda: evaluate(_inspect_compose_containers(project_dir)), max(deadline - time.monotonic(), 0))
+    return evaluate(_inspect_compose_containers(project_dir))
+
+
+def compose_status(containers: list[dict], max_restarts: int = 3, restarts_at_start: dict | None = None) -> tuple:
+    """
+    Decide if the containers of a compose project are ready, see `wait_for_compose_services()`.
+
+    Docker counts the restarts of a container over its whole life, so a container that is kept
+    by `docker compose up -d` may have restarted long before this run.
+
+    Args:
+        containers: The state of every container, see `container_states()`.
+        max_restarts: Restarts after which a container counts as crash-looping.
+        restarts_at_start: Restart count of every container when the wait started, keyed by ID.
+            Only the restarts since then are counted, containers created later count all of theirs.
+
+    Returns:
+        tuple: ("failed", the failed containers), ("ready", []) or ("waiting", the containers
+            that are not ready). Without any containers the project is still starting.
+    """
+    if not containers:
+        return ("waiting", [])
+    restarts_at_start = restarts_at_start or {}
+    containers = [{**container, "restarts": container["restarts"] - restarts_at_start.get(container["id"], 0)} for container in containers]
+    failed = [container for container in containers if _container_failed(container, max_restarts)]
+    if failed:
+        return ("failed", failed)
+    waiting = [container for container in containers if not _container_ready(container)]
+    return ("waiting", waiting) if waiting else ("ready", [])
+
+
+def container_states(inspect_output: str) -> list[dict]:
+    """
+    Get the state of the containers in the output of `docker inspect`.
+
+    Args:
+        inspect_output: The json printed by `docker inspect <ids>`, also from another host.
+
+    Returns:
+        list[dict]: The ID, service, status, exit code, health, restarts and restart policy of every container.
+    """
+    try:
+        details = json.loads(inspect_output or "[]")
+    except ValueError:
+        return []
+    return [_container_state(container) for container in details]
+
+
+def _inspect_compose_containers(project_dir: str) -> list[dict]:
+    client = get_client()
+    if client:
+        project = os.path.basename(os.path.abspath(project_dir)).lower()
+        try:
+            summaries = client.containers(labels=[f"com.docker.compose.project={project}"])
+            details = [client.inspect(summary["Id"]) for summary in summaries]
+        except Docker_Error:
+            return []
+        return [_container_state(container) for container in details]
+
+    ids = subprocess.run("docker compose ps -q -a", shell=True, cwd=project_dir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True).stdout.split()
+    if not ids:
+        return []
+    output = subprocess.run(["docker", "inspect", *ids], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True).stdout
+    return container_states(output)
+
+
+def _container_state(container: dict) -> dict:
+    state = container.get("State", {})
+    return {
+        "id": container.get("Id"),
+        "service": container.get("Config", {}).get("Labels", {}).get("com.docker.compose.service", container.get("Name", "").lstrip("/")),
+        "status": state.get("Status"),
+        "exit_code": state.get("ExitCode", 0),
+        "health": (state.get("Health") or {}).get("Status"),
+        "restarts": container.get("RestartCount", 0),
+        "restart_policy": container.get("HostConfig", {}).get("RestartPolicy", {}).get("Name") or "no",
+    }
+
+
+def _container_ready(container: dict) -> bool:
+    if container["status"] == "exited":
+        return container["restart_policy"] == "no" and container["exit_code"] == 0
+    return container["status"] == "running" and container["health"] in (None, "healthy")
+
+
+def _container_failed(container: dict, max_restarts: int) -> bool:
+    if container["restarts"] >= max_restarts or container["health"] == "unhealthy" or container["status"] == "dead":
+        return True
+    return container["status"] == "exited" and not _container_ready(container)
+
+
+def _print_service_logs(project_dir: str, service: str, lines: int = 30):
+    print(f"Last {lines} log lines of {service}:")
+    subprocess.call(f"docker compose logs --no-color --tail {lines} {service}", shell=True, cwd=project_dir)
+
+
+class Image_Prefetcher:
+    """
+    Pulls docker images in background threads so downloads overlap with the questionnaire.
+
+    Images are pulled through the Docker Engine API as soon as they are requested (or with
+    `docker pull` when the docker socket is not accessible). Pulling is best effort, if a pull
+    fails `docker compose up` will simply try again later.
+
+    Examples:
+        >>> prefetcher = Image_Prefetcher()
+        >>> prefetcher.pull("docker.n8n.io/n8nio/n8n:latest")
+        ... # ask questions
+        >>> prefetcher.wait()
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._threads: dict[str, threading.Thread] = {}
+        self._results: dict[str, tuple[bool, float]] = {}
+        self._progress: dict[str, Pull_Progress] = {}
+
+    def pull(self, image: str):
+        with self._lock:
+            if image in self._threads:
+                return
+            thread = threading.Thread(target=self._pull_image, args=(image,), daemon=True)
+            self._threads[image] = thread
+        thread.start()
+
+    def status(self) -> str:
+        with self._lock:
+            status = f"{len(self._results)}/{len(self._threads)} images downloaded"
+            progress = list(self._progress.values())
+        total = sum(p.total for p in progress)
+        if total:
+            status += f", {sum(p.downloaded for p in progress) / 1024 ** 2:.0f}/{total / 1024 ** 2:.0f}MB"
+        return status
+
+    def wait(self):
+        with self._lock:
+            pending = [image for image in self._threads if image not in self._results]
+
+        if pending:
+            print(f"\nWaiting for image downloads to finish ({self.status()})...")
+        for image in pending:
+            self._threads[image].join()
+
+        for image, (succeeded, duration) in self._results.items():
+            if succeeded:
+                print(f"Pulled {image} ({duration:.1f}s)")
+            else:
+                print(f"Warning: could not pre-pull {image}, it will be pulled when the container starts")
+
+    def _pull_image(self, image: str):
+        start = time.monotonic()
+        client = get_client()
+        if client:
+            progress = Pull_Progress()
+            with self._lock:
+                self._progress[image] = progress
+            try:
+                client.pull(image, progress.update)
+                succeeded = True
+            except Docker_Error:
+                succeeded = False
+        else:
+            succeeded = subprocess.call(f"docker pull -q {image}", shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) == 0
+        with self._lock:
+            self._results[image] = (succeeded, time.monotonic() - start)
+
+
 def install_docker():
     """
     Install Docker and Docker Compose based on the detected operating system.
@@ -0,0 +1,342 @@
+"""
+Thin client for the Docker Engine API over the docker unix socket.
+
+Talking to the daemon directly saves forking a shell and a docker CLI process for every
+operation, and gives structured progress and errors instead of text to parse. Only what the
+installer needs is covered: ping, pull, run, start, inspect, list, events and health. Building and
+starting the compose stack still goes through `docker compose`, which has no API.
+
+The socket is usually only accessible to root and the docker group. `get_client()` returns
+None when it can't be used, and callers fall back to the docker CLI.
+
+Usage:
+    >>> client = get_client()
+    >>> if client:
+    ...     client.pull("cloudflare/cloudflared:latest")
+    ...     container_id = client.run("cloudflare/cloudflared:latest", ["tunnel", "run"])
+    ...     client.health(container_id)
+
+For testing, point `Docker_Client` at any unix socket that serves the same endpoints (see
+tests/test_docker_api.py):
+    >>> client = Docker_Client("/tmp/fake-docker.sock")
+"""
+import http.client
+import json
+import os
+import socket
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from urllib.parse import quote, urlencode
+
+
+DOCKER_SOCKET_PATH = os.environ.get("DOCKER_SOCKET_PATH", "/var/run/docker.sock")
+
+
+class Docker_Error(Exception):
+    """
+    Raised when a Docker Engine API call fails.
+
+    Attributes:
+        status_code (int | None): HTTP status of the response, None if no response was received.
+    """
+    def __init__(self, message: str, status_code: int | None = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class _Unix_Connection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float | None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class Docker_Client:
+    """
+    Client for the Docker Engine API.
+
+    Every request opens its own connection to the socket (which costs microseconds, unlike a
+    TCP+TLS handshake), so one client can be shared between threads.
+
+    Attributes:
+        socket_path (str): Path of the docker unix socket.
+        timeout (float): Seconds to wait for a response, streamed responses (pull, events) wait forever.
+    """
+    def __init__(self, socket_path: str = DOCKER_SOCKET_PATH, timeout: float = 60):
+        self.socket_path: str = socket_path
+        self.timeout: float = timeout
+
+    def ping(self) -> bool:
+        """
+        Check if the daemon is up and the socket is accessible.
+
+        Returns:
+            bool: Whether the daemon answered.
+        """
+        try:
+            return self._request("GET", "/_ping", parse=False) == b"OK"
+        except (OSError, Docker_Error):
+            return False
+
+    def pull(self, image: str, progress: Optional[Callable[[Dict[str, Any]], None]] = None):
+        """
+        Pull an image, streaming the progress.
+
+        Args:
+            image: The image, with or without a tag (defaults to latest).
+            progress: Called with every progress message of the daemon, like
+                {"status": "Downloading", "id": "a1b2c3", "progressDetail": {"current": 1024, "total": 4096}}.
+
+        Raises:
+            Docker_Error: If the pull fails, including errors reported half way through the stream.
+        """
+        repository, tag = split_image(image)
+        for message in self._stream("POST", "/images/create", params={"fromImage": repository, "tag": tag}):
+            if "error" in message:
+                raise Docker_Error(f"Pulling {image} failed: {message['error']}")
+            if progress:
+                progress(message)
+
+    def run(self, image: str, command: Optional[List[str]] = None, name: Optional[str] = None, env: Optional[Dict[str, str]] = None, restart_policy: Optional[str] = None) -> str:
+        """
+        Create and start a container in the background, like `docker run -d`.
+
+        The image is pulled first if it is not on the host.
+
+        Args:
+            image: The image to run.
+            command: The command (arguments to the entrypoint) to run.
+            name: Name of the container.
+            env: Environment variables of the container.
+            restart_policy: Like "unless-stopped", no restarts by default.
+
+        Returns:
+            str: The ID of the started container.
+
+        Raises:
+            Docker_Error: If the container could not be created or started.
+        """
+        body = {
+            "Image": image,
+            "Cmd": command,
+            "Env": [f"{key}={value}" for key, value in (env or {}).items()],
+            "HostConfig": {"RestartPolicy": {"Name": restart_policy or "no"}},
+        }
+        params = {"name": name} if name else None
+
+        try:
+            container = self._request("POST", "/containers/create", params=params, body=body)
+        except Docker_Error as e:
+            if e.status_code != 404:
+                raise
+            self.pull(image)
+            container = self._request("POST", "/containers/create", params=params, body=body)
+
+        self.start(container["Id"])
+        return container["Id"]
+
+    def start(self, container: str):
+        """
+        Start a created or stopped container, like `docker start`.
+
+        Args:
+            container: ID or name of the container.
+
+        Raises:
+            Docker_Error: If the container does not exist or could not be started.
+        """
+        self._request("POST", f"/containers/{quote(container)}/start", parse=False)
+
+    def inspect(self, container: str) -> Dict[str, Any]:
+        """
+        Get the details of a container, like `docker inspect`.
+
+        Args:
+            container: ID or name of the container.
+
+        Returns:
+            dict: The container details.
+        """
+        return self._request("GET", f"/containers/{quote(container)}/json")
+
+    def containers(self, labels: Optional[List[str]] = None, all: bool = True) -> List[Dict[str, Any]]:
+        """
+        List containers, like `docker ps`.
+
+        Args:
+            labels: Only containers with these labels, like ["com.docker.compose.project=n8n"].
+            all: Also list stopped containers.
+
+        Returns:
+            List[dict]: A summary of every container.
+        """
+        params = {"all": "1" if all else "0"}
+        if labels:
+            params["filters"] = json.dumps({"label": labels})
+        return self._request("GET", "/containers/json", params=params)
+
+    def health(self, container: str) -> str | None:
+        """
+        Get the health of a container.
+
+        Args:
+            container: ID or name of the container.
+
+        Returns:
+            str | None: "starting", "healthy" or "unhealthy", None if the container has no healthcheck.
+        """
+        return (self.inspect(container)["State"].get("Health") or {}).get("Status")
+
+    def events(self, filters: Optional[Dict[str, List[str]]] = None, since: Optional[float] = None, until: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Stream daemon events, like `docker events`.
+
+        Without `until` the stream is endless, stop iterating to close it.
+
+        Args:
+            filters: Like {"type": ["container"], "event": ["health_status"]}.
+            since: Only events after this unix time.
+            until: Stop at this unix time.
+
+        Yields:
+            dict: Every event, with "Type", "Action", "Actor" and "time".
+        """
+        params = {}
+        if filters:
+            params["filters"] = json.dumps(filters)
+        if since is not None:
+            params["since"] = f"{since:.3f}"
+        if until is not None:
+            params["until"] = f"{until:.3f}"
+        yield from self._stream("GET", "/events", params=params)
+
+    def _request(self, method: str, path: str, params: Optional[dict] = None, body: Any = None, parse: bool = True) -> Any:
+        connection = _Unix_Connection(self.socket_path, self.timeout)
+        try:
+            response = self._send(connection, method, path, params, body)
+            data = response.read()
+        finally:
+            connection.close()
+
+        if response.status >= 400:
+            raise Docker_Error(f"{method} {path} failed with status {response.status}: {_error_message(data)}", response.status)
+        if not parse:
+            return data
+        return json.loads(data) if data else None
+
+    def _stream(self, method: str, path: str, params: Optional[dict] = None) -> Iterator[Dict[str, Any]]:
+        connection = _Unix_Connection(self.socket_path, None)
+        try:
+            response = self._send(connection, method, path, params, None)
+            if response.status >= 400:
+                raise Docker_Error(f"{method} {path} failed with status {response.status}: {_error_message(response.read())}", response.status)
+            # The daemon sends one json object per line
+            for line in response:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        finally:
+            connection.close()
+
+    def _send(self, connection: _Unix_Connection, method: str, path: str, params: Optional[dict], body: Any) -> http.client.HTTPResponse:
+        if params:
+            path = f"{path}?{urlencode(params)}"
+        headers = {"Host": "docker"}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        try:
+            connection.request(method, path, body=payload, headers=headers)
+            return connection.getresponse()
+        except OSError as e:
+            raise Docker_Error(f"{method} {path} failed: {e}") from e
+
+
+class Pull_Progress:
+    """
+    Adds up the progress messages of a pull into downloaded and total bytes.
+
+    Examples:
+        >>> progress = Pull_Progress()
+        >>> client.pull("redis:7-alpine", progress.update)
+        >>> progress.downloaded, progress.total
+    """
+    def __init__(self):
+        self._layers: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def update(self, message: Dict[str, Any]):
+        detail = message.get("progressDetail") or {}
+        if message.get("status") == "Downloading" and detail.get("total"):
+            with self._lock:
+                self._layers[message["id"]] = (detail.get("current", 0), detail["total"])
+        elif message.get("status") in ("Download complete", "Already exists", "Pull complete") and message.get("id") in self._layers:
+            with self._lock:
+                total = self._layers[message["id"]][1]
+                self._layers[message["id"]] = (total, total)
+
+    @property
+    def downloaded(self) -> int:
+        with self._lock:
+            return sum(current for current, _ in self._layers.values())
+
+    @property
+    def total(self) -> int:
+        with self._lock:
+            return sum(total for _, total in self._layers.values())
+
+
+def split_image(image: str) -> tuple:
+    """
+    Split an image into the repository and tag.
+
+    Args:
+        image: Like "redis:7-alpine", "localhost:5000/n8n" or "n8nio/n8n@sha256:...".
+
+    Returns:
+        tuple: (repository, tag), the tag defaults to "latest". A digest is returned as the tag.
+    """
+    if "@" in image:
+        repository, digest = image.split("@", 1)
+        return repository, digest
+    name_start = image.rfind("/") + 1
+    if ":" in image[name_start:]:
+        repository, tag = image.rsplit(":", 1)
+        return repository, tag
+    return image, "latest"
+
+
+_client: Docker_Client | None = None
+_client_checked = False
+_client_lock = threading.Lock()
+
+
+def get_client() -> Docker_Client | None:
+    """
+    Get the shared client, if the docker socket can be used.
+
+    The check is only done once, so call it after the daemon was started (see `docker.install_docker()`).
+
+    Returns:
+        Docker_Client | None: The client, or None when the socket does not exist, is not
+            accessible to this user or the daemon does not answer.
+    """
+    global _client, _client_checked
+    with _client_lock:
+        if not _client_checked:
+            client = Docker_Client()
+            _client = client if os.path.exists(client.socket_path) and client.ping() else None
+            _client_checked = True
+        return _client
+
+
+def _error_message(data: bytes) -> str:
+    try:
+        return json.loads(data).get("message", "")
+    except (ValueError, AttributeError):
+        return data.decode(errors="replace").strip()
@@ -0,0 +1,127 @@
+"""
+Fleet mode: set up Cloudflare Tunnels for many n8n hostnames in one run.
+
+Every hostname gets its own tunnel, ingress config and proxied CNAME record. Hostnames are
+provisioned in parallel on a bounded pool of threads and every zone ID is only looked up
+once. Tunnels and DNS records that already exist are updated instead of duplicated, so the
+same file can be run again after adding hostnames to it.
+
+Usage:
+    python3 fleet.py hostnames.txt [--max-workers 8] [--run-connectors]
+
+The hostnames file has one hostname per line, optionally followed by the service the
+tunnel should send traffic to (defaults to n8n on port 5678 of this machine):
+
+    n8n.client-a.com
+    n8n.client-b.com http://10.0.0.12:5678
+    # lines starting with # are ignored
+
+The Cloudflare account ID and API token are read from the CLOUDFLARE_ACCOUNT_ID and
+CLOUDFLARE_API_TOKEN environment variables, or asked for if they are not set.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from cloudflare import Cloudflare_Client, Cloudflare_Error, Zone_Cache, provision_cf_tunnel, start_cf_connector
+from docker_api import Docker_Error
+from utils import Question, Input_Type
+
+
+def read_hostnames(path):
+    """
+    Read the hostnames file.
+
+    Args:
+        path: Path to the hostnames file.
+
+    Returns:
+        List[tuple]: (hostname, service or None) for every hostname in the file.
+    """
+    hostnames = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            parts = line.split()
+            hostnames.append((parts[0], parts[1] if len(parts) > 1 else None))
+    return hostnames
+
+
+def provision_fleet(hostnames, account_id, token, max_workers = 8, run_connectors = False):
+    """
+    Create or update the tunnels for every hostname in parallel.
+
+    Args:
+        hostnames: (hostname, service or None) pairs, see `read_hostnames()`.
+        account_id: The Cloudflare account ID.
+        token: A Cloudflare API token with the Tunnel and DNS edit scopes.
+        max_workers: Maximum number of hostnames provisioned at the same time.
+        run_connectors: Also start a cloudflared container for every tunnel on this machine.
+
+    Returns:
+        dict: The `provision_cf_tunnel()` result for every hostname that succeeded, and the
+            exception for every hostname that failed: a `Cloudflare_Error`, a
+            `docker_api.Docker_Error` if its connector did not start, or any other error (like
+            the local IP of this machine not being found).
+    """
+    client = Cloudflare_Client(token)
+    zone_cache = Zone_Cache(client, account_id)
+    results = {}
+    start = time.monotonic()
+
+    def provision(hostname, service):
+        result = provision_cf_tunnel(client, hostname, account_id, zone_cache, service)
+        # Also starts the connectors of existing tunnels that are not running
+        if run_connectors:
+            start_cf_connector(result["token"], result["id"])
+        return result
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(provision, hostname, service): hostname for hostname, service in hostnames}
+        for future in as_completed(futures):
+            hostname = futures[future]
+            try:
+                result = future.result()
+            except Cloudflare_Error as e:
+                results[hostname] = e
+                print(f"FAILED   {hostname}: {e} {e.errors}")
+                continue
+            except Docker_Error as e:
+                results[hostname] = e
+                print(f"FAILED   {hostname}: the tunnel is set up but its connector did not start: {e}")
+                continue
+            except Exception as e:
+                # Like the local IP not being found or the API not answering, the other hostnames go on
+                results[hostname] = e
+                print(f"FAILED   {hostname}: {e}")
+                continue
+            results[hostname] = result
+            print(f"{'CREATED' if result['created'] else 'UPDATED':<8} {hostname} (tunnel {result['id']})")
+
+    failed = sum(isinstance(result, Exception) for result in results.values())
+    print(f"\n{len(results) - failed}/{len(results)} hostnames provisioned in {time.monotonic() - start:.1f}s")
+    client.print_timings()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Set up Cloudflare Tunnels for many n8n hostnames.")
+    parser.add_argument("hostnames_file", help="file with one hostname (and optional service url) per line")
+    parser.add_argument("--max-workers", type=int, default=8, help="hostnames provisioned at the same time")
+    parser.add_argument("--run-connectors", action="store_true", help="start a cloudflared container on this machine for every tunnel without a running one")
+    args = parser.parse_args()
+
+    account_id = os.environ.get("CLOUDFLARE_ACCOUNT_ID") or Question(
+        "Cloudflare Account ID?:",
+        Input_Type.INPUT,
+    ).answer
+    token = os.environ.get("CLOUDFLARE_API_TOKEN") or Question(
+        "What's your CloudFlare Token? (must have Cloudflare Tunnel & DNS Scopes):",
+        Input_Type.PASSWORD,
+    ).answer
+
+    results = provision_fleet(read_hostnames(args.hostnames_file), account_id, token, args.max_workers, args.run_connectors)
+    if any(isinstance(result, Exception) for result in results.values()):
+        exit(1)
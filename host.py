@@ -0,0 +1,204 @@
+"""
+Detects the resources of the host the stack is installed on.
+
+The values are used to size the generated stack, like how many queue mode workers to run
+and how much memory to give postgres, and to set the cgroup limits of every container.
+"""
+import os
+import platform
+import subprocess
+
+
+def get_cpu_count() -> int:
+    """
+    Get the number of CPU cores this process is allowed to use.
+
+    Returns:
+        int: The number of usable cores, at least 1.
+    """
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except AttributeError:
+        # sched_getaffinity is not available on macOS
+        return max(1, os.cpu_count() or 1)
+
+
+def get_memory_bytes() -> int:
+    """
+    Get the total memory of the host in bytes.
+
+    On Linux a cgroup memory limit lower than the physical memory is respected.
+
+    Returns:
+        int: Total memory in bytes, or 2GB if it could not be detected.
+    """
+    memory = None
+    system = platform.system()
+
+    try:
+        if system == "Linux":
+            with open("/proc/meminfo") as f:
+                for line in f:
+                    if line.startswith("MemTotal:"):
+                        memory = int(line.split()[1]) * 1024
+                        break
+            memory = min(filter(None, [memory, _get_cgroup_memory_limit()]), default=None)
+        elif system == "Darwin":
+            memory = int(subprocess.check_output(["sysctl", "-n", "hw.memsize"], universal_newlines=True).strip())
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        memory = None
+
+    return memory or 2 * 1024 ** 3
+
+
+def _get_cgroup_memory_limit() -> int | None:
+    for path in ["/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"]:
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit():
+            return int(value)
+    return None
+
+
+def default_worker_count() -> int:
+    """
+    Number of queue mode workers to run by default.
+
+    One core is left for the main n8n instance and redis, every other core gets a worker.
+
+    Returns:
+        int: The default number of worker containers, at least 1.
+    """
+    return max(1, get_cpu_count() - 1)
+
+
+def default_sqlite_pool_size() -> int:
+    """
+    Number of SQLite read connections to open in WAL mode by default.
+
+    SQLite queries run on node's libuv thread pool, which has 4 threads, so more
+    connections than that only wait for a thread.
+
+    Returns:
+        int: The default pool size, between 2 and 4.
+    """
+    return max(2, min(4, get_cpu_count()))
+
+
+class Resource_Limits:
+    """
+    The cgroup limits and reservations of one container.
+
+    Attributes:
+        cpus (float): Maximum number of CPU cores the container can use.
+        cpu_shares (int): Relative CPU weight when the host is busy, 1024 is docker's default.
+        memory_bytes (int): Hard memory limit, the container is OOM killed above it.
+        memory_reservation_bytes (int): Memory the container is guaranteed when the host runs low.
+        pids (int): Maximum number of processes and threads.
+    """
+    def __init__(self, cpus: float, cpu_shares: int, memory_bytes: int, memory_reservation_bytes: int, pids: int):
+        self.cpus: float = cpus
+        self.cpu_shares: int = cpu_shares
+        self.memory_bytes: int = memory_bytes
+        self.memory_reservation_bytes: int = memory_reservation_bytes
+        self.pids: int = pids
+
+
+# Sizing policy. Every container gets a share of the host relative to the weight of its kind of
+# service. The memory limit is at least the minimum, the reservation is half the limit. CPU
+# limits add up to twice the cores (each at least the minimum, at most every core), so a busy
+# container can use what idle ones don't, while cpu_shares decide who wins when all are busy.
+SERVICE_WEIGHTS = {
+    "n8n": 2,
+    "n8n-worker": 2,
+    "n8n-webhook": 1,
+    "postgres": 3,
+    "redis": 0.5,
+    "load-balancer": 0.25,
+    "minio": 1,
+    "prometheus": 0.5,
+    "grafana": 0.5,
+}
+SERVICE_MIN_MEMORY_MB = {
+    "n8n": 512,
+    "n8n-worker": 512,
+    "n8n-webhook": 256,
+    "postgres": 256,
+    "redis": 64,
+    "load-balancer": 32,
+    "minio": 256,
+    "prometheus": 256,
+    "grafana": 128,
+}
+SERVICE_MIN_CPUS = {
+    "n8n": 1,
+    "n8n-worker": 1,
+    "n8n-webhook": 0.5,
+    "postgres": 0.5,
+    "redis": 0.25,
+    "load-balancer": 0.25,
+    "minio": 0.5,
+    "prometheus": 0.25,
+    "grafana": 0.25,
+}
+SERVICE_PIDS = {
+    "n8n": 1024,
+    "n8n-worker": 1024,
+    "n8n-webhook": 512,
+    "postgres": 512,
+    "redis": 128,
+    "load-balancer": 128,
+    "minio": 256,
+    "prometheus": 256,
+    "grafana": 256,
+}
+# Left for the OS, docker and the cloudflared container
+HOST_RESERVED_MEMORY_MB = 512
+CPU_OVERCOMMIT = 2
+
+
+def size_services(service_counts: dict, cpu_count: int, memory_bytes: int, overrides: dict | None = None) -> dict:
+    """
+    Size the containers of the stack from the host's resources.
+
+    Args:
+        service_counts: Number of containers of every kind of service, like {"n8n": 1, "n8n-worker": 3}.
+            The kinds are the keys of `SERVICE_WEIGHTS`.
+        cpu_count: CPU cores of the host.
+        memory_bytes: Memory of the host in bytes.
+        overrides: Fixed values for some kinds, like {"n8n": {"cpus": 2, "memory_mb": 2048}}.
+
+    Returns:
+        dict: The `Resource_Limits` of one container of every kind in `service_counts`.
+    """
+    mb = 1024 ** 2
+    overrides = overrides or {}
+    service_counts = {kind: count for kind, count in service_counts.items() if count > 0}
+
+    reserved = max(HOST_RESERVED_MEMORY_MB * mb, memory_bytes // 10)
+    usable_memory = max(256 * mb, memory_bytes - reserved)
+    total_weight = sum(SERVICE_WEIGHTS[kind] * count for kind, count in service_counts.items())
+
+    limits = {}
+    for kind in service_counts:
+        share = SERVICE_WEIGHTS[kind] / total_weight
+        memory_limit = max(SERVICE_MIN_MEMORY_MB[kind] * mb, int(usable_memory * share))
+        cpus = min(float(cpu_count), max(SERVICE_MIN_CPUS[kind], cpu_count * share * CPU_OVERCOMMIT))
+
+        override = overrides.get(kind, {})
+        if override.get("memory_mb"):
+            memory_limit = int(override["memory_mb"]) * mb
+        if override.get("cpus"):
+            cpus = float(override["cpus"])
+
+        limits[kind] = Resource_Limits(
+            cpus=round(cpus, 2),
+            cpu_shares=int(1024 * SERVICE_WEIGHTS[kind]),
+            memory_bytes=memory_limit // mb * mb,
+            memory_reservation_bytes=memory_limit // 2 // mb * mb,
+            pids=SERVICE_PIDS[kind],
+        )
+    return limits
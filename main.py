@@ -1,12 +1,46 @@
-from docker import install_docker
-from cloudflare import create_cf_tunnel
-from n8n import start_n8n_container
-from utils import env_vars, Question, Input_Type, timezones, local_timezone, Workflow_call_Policy, Database_Log_Level, Log_Level, Log_Location, Save_Modes, Reverse_Proxy_Type, Database_Options, Binary_Modes, Email_Modes
-from utils import run_command
-
+from docker import install_docker, Image_Prefetcher
+from registry import use_registry_mirror, print_mirror_stats
+from cloudflare import cf_tunnel_tasks, Cloudflare_Client, Cloudflare_Error, CLOUDFLARED_IMAGE
+from docker_api import Docker_Error
+from n8n import n8n_container_tasks, use_postgres, use_redis, use_local_s3, use_sqlite_profile, use_monitoring, get_n8n_image, get_resource_limits, BINARY_DATA_PATH, MINIO_IMAGE, MINIO_CLIENT_IMAGE, PROMETHEUS_IMAGE, GRAFANA_IMAGE, N8N_BASE_IMAGE, REDIS_IMAGE, POSTGRES_IMAGE, NGINX_IMAGE
+from host import default_worker_count, default_sqlite_pool_size
+from state import Install_State, keep_existing_settings, same_database
+from config import read_env_file
+from retention import Retention_Settings, saved_per_day, recommend_retention, simulate, print_simulation
+from utils import env_vars, stack_options, Question, Input_Type, timezones, get_local_timezone, Workflow_call_Policy, Database_Log_Level, Log_Level, Log_Location, Save_Modes, Reverse_Proxy_Type, Database_Options, Binary_Modes, Redis_Persistence, Email_Modes
+from utils import run_command, load_answers, save_answers, print_command_timings
+from tasks import Task, run_tasks
+import argparse
+import os
+import secrets
+
+
+parser = argparse.ArgumentParser(description="Install and configure n8n with docker.")
+parser.add_argument("--answers", default=os.environ.get("N8N_INSTALL_ANSWERS"), help="JSON or YAML file with answers to the questions, only missing answers are prompted")
+parser.add_argument("--save-answers", help="save the answers given in this run (except passwords and keys) to a JSON or YAML file")
+parser.add_argument("--registry-mirror", default=os.environ.get("N8N_INSTALL_REGISTRY_MIRROR"), help="pull images through this registry mirror, like http://10.0.0.5:5000 (see registry.py)")
+args = parser.parse_args()
+
+if args.answers:
+    load_answers(args.answers)
+
+# Running again in the same folder only applies what changed to the existing installation
+install_state = Install_State.load()
+previous_env = read_env_file("n8n/.env") if os.path.exists("n8n/.env") else {}
+if install_state.existed or previous_env:
+    print("\nExisting installation found in ./n8n, only the changes will be applied to it.")
 
 # INSTALL DOCKER (if needed) 
 install_docker()
+
+# Pull images through the registry mirror on the LAN (if one is given)
+if args.registry_mirror:
+    stack_options["registry_mirror"] = args.registry_mirror
+    use_registry_mirror(args.registry_mirror)
+
+# Start downloading images while the questions are answered
+image_prefetcher = Image_Prefetcher()
+image_prefetcher.pull(f"{get_n8n_image(stack_options)}:{env_vars['N8N_VERSION']}")
 print("""
 There is no undo functionality. If you enter a question wrong and submit it you must run the script again with the original command.
 
@@ -27,7 +61,8 @@ detailed_setup = Question(
     "How customized would you like your n8n Install?:",
     Input_Type.CHOICE,
     None,
-    ["Simple and Quick", "Detailed and Long"]
+    ["Simple and Quick", "Detailed and Long"],
+    key = "setup_type"
 ).answer == "Detailed and Long"
 
 
@@ -39,7 +74,8 @@ domain = Question(
      None,
      lambda selection: selection.count("/") == 0,
      "do not include 'https://' or any trailing '/'.",
-     "https://"
+     "https://",
+     key = "domain"
 ).answer
 
 Question(
@@ -47,7 +83,7 @@ Question(
     Input_Type.CHOICE,
     "GENERIC_TIMEZONE",
     timezones,
-    default = str(local_timezone) or "America/New_York"
+    default = get_local_timezone() or "America/New_York"
 )
 
 # \/ Jon let me know that the ai is disabled at the moment \/
@@ -77,18 +113,22 @@ reverse_proxy_option = Question(
     Input_Type.CHOICE,
     None,
     list(e.value for e in Reverse_Proxy_Type),
+    key = "reverse_proxy"
 ).answer
 
 if reverse_proxy_option == Reverse_Proxy_Type.CLOUDFLARE.value:
+    image_prefetcher.pull(CLOUDFLARED_IMAGE)
     cloudflare_id = Question(
         "Cloudflare Account ID?:",
         Input_Type.INPUT,
         None,
+        key = "cloudflare_account_id"
     ).answer
     cloudflare_token = Question(
         "What's your CloudFlare Token? (must have Cloudflare Tunnel & DNS Scopes):",
         Input_Type.PASSWORD,
         None,
+        key = "cloudflare_token"
     ).answer
 
 
@@ -127,8 +167,47 @@ Visit https://docs.n8n.io/hosting/configuration/environment-variables/ to see mo
             "Run vacuum on startup:",
             Input_Type.CONFIRM,
             ).answer.lower()
+            stack_options["sqlite_profile"] = Question(
+                "Use the tuned SQLite profile? (WAL mode with a pool of read connections and the database on its own volume, much faster writes)",
+                Input_Type.CONFIRM,
+            ).answer == "True"
+
+            if stack_options["sqlite_profile"]:
+                Question(
+                    "Number of SQLite read connections",
+                    Input_Type.INPUT,
+                    "DB_SQLITE_POOL_SIZE",
+                    validate = lambda selection: selection.isdigit() and int(selection) > 0,
+                    validate_message = "Please enter a whole number above 0",
+                    default = str(default_sqlite_pool_size())
+                )
+                stack_options["sqlite_host_path"] = Question(
+                    "Host folder to store the database in, on a local disk (WAL mode does not work on network shares, leave empty for a docker volume):",
+                    Input_Type.INPUT,
+                    validate = lambda selection: selection == "" or selection.startswith("/"),
+                    validate_message = "Please enter an absolute path, starting with /",
+                    key = "sqlite_host_path"
+                ).answer or None
         else:
-            print("\n I did not add postgres db options. Please go into the .env and docker-compose.yaml file after setup to manually configure postgres \n Feel free to add a PR adding this functionality")
+            Question(
+                "Postgres database name",
+                Input_Type.INPUT,
+                "DB_POSTGRESDB_DATABASE",
+                default = "n8n"
+            )
+            Question(
+                "Postgres user",
+                Input_Type.INPUT,
+                "DB_POSTGRESDB_USER",
+                default = "n8n"
+            )
+            Question(
+                "Postgres password (leave blank to generate one)",
+                Input_Type.PASSWORD,
+                "DB_POSTGRESDB_PASSWORD"
+            )
+            use_postgres(env_vars)
+            image_prefetcher.pull(POSTGRES_IMAGE)
 
     # -------------------------- DEPLOYMENT questions --------------------------
 
@@ -218,27 +297,39 @@ Visit https://docs.n8n.io/hosting/configuration/environment-variables/ to see mo
 
     # -------------------------- BINARY DATA questions --------------------------
 
-    # custom storage path
-    keep_default_storage_path = Question(
-        "Do you want to keep the default binary data storage path?:",
-        Input_Type.CONFIRM,
-    ).answer == "True"
-    if not keep_default_storage_path:
+    binary_mode = Binary_Modes(
         Question(
-            "Input custom binary storage path:",
-            Input_Type.INPUT,
-            "N8N_BINARY_DATA_STORAGE_PATH",
-        )
-        
-    env_vars["N8N_DEFAULT_BINARY_DATA_MODE"] = Binary_Modes( 
-        Question(
-            "Choose a binary mode:",
+            "Choose a binary mode (memory keeps whole files in RAM, use filesystem or s3 for large files):",
             Input_Type.CHOICE,
             None,
             list(e.value for e in Binary_Modes),
             default = Binary_Modes.default.value,
         ).answer
-    ).name
+    )
+    env_vars["N8N_DEFAULT_BINARY_DATA_MODE"] = binary_mode.name
+
+    if binary_mode == Binary_Modes.filesystem:
+        # Binary data gets its own volume, or a folder on the host
+        env_vars["N8N_BINARY_DATA_STORAGE_PATH"] = BINARY_DATA_PATH
+        stack_options["binary_data_host_path"] = Question(
+            "Host folder to store binary data in, like on a fast disk (leave empty for a docker volume):",
+            Input_Type.INPUT,
+            validate = lambda selection: selection == "" or selection.startswith("/"),
+            validate_message = "Please enter an absolute path, starting with /",
+            key = "binary_data_host_path"
+        ).answer or None
+
+    if binary_mode == Binary_Modes.s3:
+        env_vars["N8N_AVAILABLE_BINARY_DATA_MODES"] = "filesystem,s3"
+        stack_options["local_s3"] = Question(
+            "Run a local S3-compatible store (MinIO) for binary data? (no to use an existing bucket, s3 mode needs an n8n enterprise license)",
+            Input_Type.CONFIRM,
+        ).answer == "True"
+
+        if stack_options["local_s3"]:
+            use_local_s3(env_vars)
+            image_prefetcher.pull(MINIO_IMAGE)
+            image_prefetcher.pull(MINIO_CLIENT_IMAGE)
 
 
     # -------------------------- EMAIL questions --------------------------
@@ -385,6 +476,20 @@ Visit https://docs.n8n.io/hosting/configuration/environment-variables/ to see mo
             "Include api status code label in metrics",
             Input_Type.CONFIRM,
         ).answer.lower()
+        env_vars["N8N_METRICS_INCLUDE_QUEUE_METRICS"] = Question(
+            "Include queue metrics (queue mode only)",
+            Input_Type.CONFIRM,
+        ).answer.lower()
+
+        # The metrics are only useful if something collects them
+        stack_options["monitoring"] = Question(
+            "Run Prometheus and Grafana with an n8n dashboard? (Grafana on port 3000, the password is in the .env file)",
+            Input_Type.CONFIRM,
+        ).answer == "True"
+
+        if stack_options["monitoring"]:
+            image_prefetcher.pull(PROMETHEUS_IMAGE)
+            image_prefetcher.pull(GRAFANA_IMAGE)
     
 
     # -------------------------- EXTERNAL HOOKS questions --------------------------
@@ -462,13 +567,57 @@ Visit https://docs.n8n.io/hosting/configuration/environment-variables/ to see mo
         Input_Type.CONFIRM,
     ).answer.lower()
 
+    # Defaults of the pruning questions, replaced by the calculated settings if the calculator is used
+    retention_defaults = Retention_Settings().env_vars()
+    use_retention_calculator = env_vars["EXECUTIONS_DATA_PRUNE"] == "true" and Question(
+        "Calculate the pruning settings from your expected load? (keeps the database under a size you choose)",
+        Input_Type.CONFIRM,
+    ).answer == "True"
+
+    if use_retention_calculator:
+        executions_per_day = float(Question(
+            "Expected production executions per day",
+            Input_Type.INPUT,
+            validate = lambda selection: selection.isdigit(),
+            validate_message = "Please enter a whole number",
+            default = "10000"
+        ).answer)
+        payload_kb = float(Question(
+            "Average size of the data of an execution in KB",
+            Input_Type.INPUT,
+            validate = lambda selection: selection.replace(".", "", 1).isdigit(),
+            validate_message = "Please enter a number",
+            default = "20"
+        ).answer)
+        target_gb = float(Question(
+            "Size the execution data should stay under in GB",
+            Input_Type.INPUT,
+            validate = lambda selection: selection.replace(".", "", 1).isdigit() and float(selection) > 0,
+            validate_message = "Please enter a number above 0",
+            default = "5"
+        ).answer)
+
+        target_bytes = int(target_gb * 1024 ** 3)
+        executions_saved_per_day = saved_per_day(
+            executions_per_day,
+            env_vars["EXECUTIONS_DATA_SAVE_ON_SUCCESS"] == Save_Modes.all.name,
+            env_vars["EXECUTIONS_DATA_SAVE_ON_ERROR"] == Save_Modes.all.name,
+        )
+        retention_settings = recommend_retention(executions_saved_per_day, payload_kb, target_bytes)
+        if retention_settings is None:
+            print("\nThe executions waiting to be deleted alone don't fit in that size. Consider not saving successful executions, or allow a bigger database.\n")
+        else:
+            print_simulation(retention_settings, simulate(retention_settings, executions_saved_per_day, payload_kb), target_bytes)
+            print("These are the defaults of the next questions.\n")
+            retention_defaults = retention_settings.env_vars()
+
     Question(
         "Execution data max age in hours",
         Input_Type.INPUT,
         "EXECUTIONS_DATA_MAX_AGE",
         validate = lambda selection: not "," in selection,
         validate_message= "Please dont add commas",
-        default = "336"
+        default = retention_defaults["EXECUTIONS_DATA_MAX_AGE"]
     )
 
     Question(
@@ -477,7 +626,7 @@ Visit https://docs.n8n.io/hosting/configuration/environment-variables/ to see mo
         "EXECUTIONS_DATA_PRUNE_MAX_COUNT",
         validate = lambda selection: not "," in selection,
         validate_message= "Please dont add commas",
-        default = "10000"
+        default = retention_defaults["EXECUTIONS_DATA_PRUNE_MAX_COUNT"]
     )
 
     Question(
@@ -486,7 +635,7 @@ Visit https://docs.n8n.io/hosting/configuration/environment-variables/ to see mo
         "EXECUTIONS_DATA_HARD_DELETE_BUFFER",
         validate = lambda selection: not "," in selection,
         validate_message= "Please dont add commas",
-        default = "1"
+        default = retention_defaults["EXECUTIONS_DATA_HARD_DELETE_BUFFER"]
     )
 
     Question(
@@ -495,7 +644,7 @@ Visit https://docs.n8n.io/hosting/configuration/environment-variables/ to see mo
         "EXECUTIONS_DATA_PRUNE_HARD_DELETE_INTERVAL",
         validate = lambda selection: not "," in selection,
         validate_message= "Please dont add commas",
-        default = "15"
+        default = retention_defaults["EXECUTIONS_DATA_PRUNE_HARD_DELETE_INTERVAL"]
     )
 
     Question(
@@ -504,11 +653,11 @@ Visit https://docs.n8n.io/hosting/configuration/environment-variables/ to see mo
         "EXECUTIONS_DATA_PRUNE_SOFT_DELETE_INTERVAL",
         validate = lambda selection: not "," in selection,
         validate_message= "Please dont add commas",
-        default = "60"
+        default = retention_defaults["EXECUTIONS_DATA_PRUNE_SOFT_DELETE_INTERVAL"]
     )
 
     Question(
-        "Max production executions allowed to run concurrently. Add -1 for no limit",
+        "Max production executions allowed to run concurrently. Add -1 for no limit (run autotune.py after the install to measure the best value)",
         Input_Type.INPUT,
         "N8N_CONCURRENCY_PRODUCTION_LIMIT",
         validate = lambda selection: not "," in selection,
@@ -638,12 +787,8 @@ Visit https://docs.n8n.io/hosting/configuration/environment-variables/ to see mo
 
     # -------------------------- External data storage questions --------------------------
 
-    keep_external_data_disabled = Question(
-        "Disable external data storage (disabled by default)",
-        Input_Type.CONFIRM,
-    ).answer == "True"
-
-    if not keep_external_data_disabled:
+    # Asked for s3 binary data without a local store, otherwise external storage stays off
+    if binary_mode == Binary_Modes.s3 and not stack_options["local_s3"]:
         Question(
             "Host of the n8n bucket in S3-compatible external storage. For example, s3.us-east-1.amazonaws.com:",
             Input_Type.INPUT,
@@ -717,7 +862,67 @@ Visit https://docs.n8n.io/hosting/configuration/environment-variables/ to see mo
     ).answer == "True"
 
     if not keep_queue_mode_disabled:
-        print(" i have not made this yes because i want to do it right. Let me know if you want it! For now please configure this manually, i have the queue mode env vars commented out in there already.")
+        env_vars["EXECUTIONS_MODE"] = "queue"
+        use_redis(env_vars)
+        image_prefetcher.pull(REDIS_IMAGE)
+
+        stack_options["redis_persistence"] = Redis_Persistence(
+            Question(
+                "How should redis keep the queue on disk?",
+                Input_Type.CHOICE,
+                None,
+                list(e.value for e in Redis_Persistence),
+                default = Redis_Persistence.aof.value,
+            ).answer
+        ).name
+
+        stack_options["worker_count"] = int(Question(
+            "How many worker containers? (defaults to one per CPU core, minus one for the main instance)",
+            Input_Type.INPUT,
+            validate = lambda selection: selection.isdigit() and int(selection) > 0,
+            validate_message = "Please enter a whole number above 0",
+            default = str(default_worker_count())
+        ).answer)
+        stack_options["publish_address"] = Question(
+            "Address of this host that workers on other hosts can reach it at, to run more workers there with remote.py (leave empty to only run workers here):",
+            Input_Type.INPUT,
+            validate = lambda selection: "/" not in selection and " " not in selection,
+            validate_message = "Please enter only an IP address or hostname, like 10.0.0.5",
+            key = "publish_address"
+        ).answer or None
+        Question(
+            "Max executions each worker runs at the same time (--concurrency)",
+            Input_Type.INPUT,
+            "N8N_WORKER_CONCURRENCY",
+            validate = lambda selection: selection.isdigit() and int(selection) > 0,
+            validate_message = "Please enter a whole number above 0",
+            default = "10"
+        )
+
+        keep_webhooks_on_main = Question(
+            "Keep production webhooks on the main instance? (say no to run dedicated webhook processors behind a load balancer)",
+            Input_Type.CONFIRM,
+        ).answer == "True"
+
+        if not keep_webhooks_on_main:
+            stack_options["webhook_count"] = int(Question(
+                "How many webhook processor containers?",
+                Input_Type.INPUT,
+                validate = lambda selection: selection.isdigit() and int(selection) > 0,
+                validate_message = "Please enter a whole number above 0",
+                default = "2"
+            ).answer)
+            env_vars["N8N_DISABLE_PRODUCTION_MAIN_PROCESS"] = "true"
+            image_prefetcher.pull(NGINX_IMAGE)
+
+        if env_vars["DB_TYPE"] == Database_Options.SQLITE.value:
+            print("\n n8n does not support queue mode with SQLite, a postgres container will be set up instead \n")
+            use_postgres(env_vars)
+            image_prefetcher.pull(POSTGRES_IMAGE)
+
+        # Workers have to decrypt credentials saved by the main instance
+        if env_vars["N8N_ENCRYPTION_KEY"] in (None, ""):
+            env_vars["N8N_ENCRYPTION_KEY"] = secrets.token_hex(32)
 
     # -------------------------- Security questions --------------------------
 
@@ -805,6 +1010,44 @@ Visit https://docs.n8n.io/hosting/configuration/environment-variables/ to see mo
             default = "300"
         )
     
+    # -------------------------- Resource limit questions --------------------------
+
+    resource_limits = get_resource_limits(env_vars, stack_options)
+    print("\nEvery container gets CPU and memory limits sized from this host:")
+    for kind, limits in resource_limits.items():
+        print(f"  {kind:<14} {limits.cpus} CPUs, {limits.memory_bytes // 1024 ** 2}MB memory")
+
+    keep_resource_limits_default = Question(
+        "Keep these resource limits?",
+        Input_Type.CONFIRM,
+    ).answer == "True"
+
+    if not keep_resource_limits_default:
+        stack_options["resource_limits"] = Question(
+            "Limit the CPU and memory of the containers? (without limits one busy container can slow down everything else on the host)",
+            Input_Type.CONFIRM,
+        ).answer == "True"
+
+        if stack_options["resource_limits"]:
+            for kind, limits in resource_limits.items():
+                cpus = Question(
+                    f"CPU limit for {kind} (cores, decimals allowed)",
+                    Input_Type.INPUT,
+                    validate = lambda selection: selection.replace(".", "", 1).isdigit() and float(selection) > 0,
+                    validate_message = "Please enter a number above 0",
+                    default = str(limits.cpus),
+                    key = f"{kind}_cpus"
+                ).answer
+                memory_mb = Question(
+                    f"Memory limit for {kind} (MB)",
+                    Input_Type.INPUT,
+                    validate = lambda selection: selection.isdigit() and int(selection) >= 64,
+                    validate_message = "Please enter a whole number of at least 64",
+                    default = str(limits.memory_bytes // 1024 ** 2),
+                    key = f"{kind}_memory_mb"
+                ).answer
+                stack_options["resource_overrides"][kind] = {"cpus": float(cpus), "memory_mb": int(memory_mb)}
+
 #     is_custom_image = Question(
 #         "Continue with default image? A custom image would be for extra dependencies like ffmpeg. This adds a build step which takes much longer than using the prebuilt image. (Y = default image)",
 #         Input_Type.CONFIRM,
@@ -828,15 +1071,66 @@ Visit https://docs.n8n.io/hosting/configuration/environment-variables/ to see mo
 
 
 
-print("\nstarting n8n...")
-start_n8n_container(env_vars, is_custom_image, list_of_packages)
-print("n8n started")
+# Turn on the metrics the dashboard needs (the queue metrics only exist in queue mode)
+if stack_options["monitoring"]:
+    use_monitoring(env_vars, stack_options)
+
+# Tune SQLite unless it was turned off (queue mode has already switched to postgres)
+if env_vars["DB_TYPE"] == Database_Options.SQLITE.value and stack_options["sqlite_profile"]:
+    use_sqlite_profile(env_vars)
+
+# The existing data is not moved to another database
+if previous_env and not same_database(env_vars, previous_env):
+    previous_database = previous_env.get("DB_TYPE") or Database_Options.SQLITE.value
+    if Question(
+        f"The existing installation uses a {previous_database} database and this one a {env_vars['DB_TYPE']} database. The workflows, credentials and executions are not moved to it. Continue?",
+        Input_Type.CONFIRM,
+        key = "switch_database"
+    ).answer != "True":
+        print("Stopped, nothing was changed.")
+        exit(1)
+
+# The database, MinIO and grafana were set up with the secrets of the existing installation, and
+# the data stays where it is
+keep_existing_settings(env_vars, stack_options, previous_env)
+
+if args.save_answers:
+    save_answers(args.save_answers)
+    print(f"\nAnswers saved to {args.save_answers}")
 
+if is_custom_image:
+    image_prefetcher.pull(N8N_BASE_IMAGE)
+
+# Everything from here runs as a graph of steps, independent steps run at the same time
+provisioning_tasks = [Task("images", lambda results: image_prefetcher.wait())]
+provisioning_tasks += n8n_container_tasks(env_vars, is_custom_image, list_of_packages, stack_options, after=["images"], state=install_state)
 
 # Start cloudflare tunnel (if selected)
 if reverse_proxy_option == Reverse_Proxy_Type.CLOUDFLARE.value:
-    create_cf_tunnel(domain, cloudflare_id, cloudflare_token)
+    cloudflare_client = Cloudflare_Client(cloudflare_token)
+    provisioning_tasks += cf_tunnel_tasks(domain, cloudflare_id, cloudflare_client, after=["images"], state=install_state)
+
+print("\nstarting n8n...")
+try:
+    run_tasks(provisioning_tasks)
+except Cloudflare_Error as e:
+    print(f"Cloudflare setup failed: {e}")
+    print(e.errors)
+    exit(1)
+except Docker_Error as e:
+    print(f"Error starting the cloudflared container: {e}")
+    exit(1)
+install_state.save()
+print("n8n started")
+
+if reverse_proxy_option == Reverse_Proxy_Type.CLOUDFLARE.value:
+    cloudflare_client.print_timings()
+    print(f"visit https://{domain} to test it out\n")
+
+if stack_options["registry_mirror"]:
+    print_mirror_stats(stack_options["registry_mirror"])
 
+print_command_timings()
 
 
 print("""
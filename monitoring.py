@@ -0,0 +1,155 @@
+"""
+Prometheus and Grafana config for the optional monitoring services of the stack.
+
+Every n8n process serves its own /metrics endpoint on port 5678 once N8N_METRICS is true:
+the main instance, every queue mode worker (on QUEUE_HEALTH_CHECK_PORT) and every webhook
+processor. Prometheus scrapes all of them, Grafana gets Prometheus as its datasource and a
+provisioned n8n dashboard with the event loop lag, heap, execution rate and queue depth.
+
+The files are written to n8n/monitoring and mounted read-only into the containers, see
+`n8n._prometheus_service()` and `n8n._grafana_service()`.
+"""
+import json
+from typing import List
+
+
+SCRAPE_INTERVAL = "15s"
+DATASOURCE_UID = "prometheus"
+
+
+def scrape_targets(env_vars, worker_count = 0, webhook_count = 0) -> List[tuple]:
+    """
+    Get the metrics endpoint of every n8n process in the stack.
+
+    Args:
+        env_vars: The environment variables, for the port of the workers.
+        worker_count: Number of queue mode workers.
+        webhook_count: Number of webhook processors.
+
+    Returns:
+        List[tuple]: (role, "host:port") of every n8n process, role is "main", "worker" or "webhook".
+    """
+    worker_port = env_vars.get("QUEUE_HEALTH_CHECK_PORT") or "5678"
+    targets = [("main", "n8n:5678")]
+    targets += [("worker", f"n8n-worker-{number}:{worker_port}") for number in range(1, worker_count + 1)]
+    targets += [("webhook", f"n8n-webhook-{number}:5678") for number in range(1, webhook_count + 1)]
+    return targets
+
+
+def create_prometheus_config(env_vars, worker_count = 0, webhook_count = 0) -> str:
+    # One static config per role, so the dashboard can tell the processes apart
+    targets_by_role = {}
+    for role, target in scrape_targets(env_vars, worker_count, webhook_count):
+        targets_by_role.setdefault(role, []).append(target)
+
+    static_configs = "\n".join(
+        f"""\
+      - targets: {json.dumps(targets)}
+        labels:
+          role: {role}"""
+        for role, targets in targets_by_role.items()
+    )
+
+    return f"""\
+global:
+  scrape_interval: {SCRAPE_INTERVAL}
+  evaluation_interval: {SCRAPE_INTERVAL}
+
+scrape_configs:
+  - job_name: n8n
+    metrics_path: /metrics
+    static_configs:
+{static_configs}
+"""
+
+
+def create_grafana_datasource_config() -> str:
+    return f"""\
+apiVersion: 1
+
+datasources:
+  - name: Prometheus
+    uid: {DATASOURCE_UID}
+    type: prometheus
+    access: proxy
+    url: http://prometheus:9090
+    isDefault: true
+"""
+
+
+def create_grafana_dashboard_config() -> str:
+    return """\
+apiVersion: 1
+
+providers:
+  - name: n8n
+    type: file
+    disableDeletion: true
+    options:
+      path: /etc/grafana/dashboards
+"""
+
+
+def create_grafana_dashboard(env_vars) -> str:
+    """
+    Build the n8n dashboard.
+
+    Args:
+        env_vars: The environment variables, for the prefix of the metric names.
+
+    Returns:
+        str: The dashboard json.
+    """
+    prefix = env_vars.get("N8N_METRICS_PREFIX") or "n8n_"
+    panels = [
+        _panel("Event loop lag (p99)", "s", [
+            (f"{prefix}nodejs_eventloop_lag_p99_seconds", "{{instance}}"),
+        ]),
+        _panel("Heap used", "bytes", [
+            (f"{prefix}nodejs_heap_size_used_bytes", "{{instance}}"),
+        ]),
+        # The workflow counters are only there with N8N_METRICS_INCLUDE_MESSAGE_EVENT_BUS_METRICS
+        _panel("Executions per second", "ops", [
+            (f"sum(rate({prefix}workflow_started_total[5m]))", "started"),
+            (f"sum(rate({prefix}workflow_success_total[5m]))", "succeeded"),
+            (f"sum(rate({prefix}workflow_failed_total[5m]))", "failed"),
+        ]),
+        # Only served by the main instance in queue mode with N8N_METRICS_INCLUDE_QUEUE_METRICS
+        _panel("Queue depth", "short", [
+            (f"{prefix}scaling_mode_queue_jobs_waiting", "waiting"),
+            (f"{prefix}scaling_mode_queue_jobs_active", "active"),
+        ]),
+    ]
+    for index, panel in enumerate(panels):
+        panel["id"] = index + 1
+        panel["gridPos"] = {"h": 8, "w": 12, "x": index % 2 * 12, "y": index // 2 * 8}
+
+    dashboard = {
+        "uid": "n8n",
+        "title": "n8n",
+        "tags": ["n8n"],
+        "timezone": "browser",
+        "refresh": "30s",
+        "time": {"from": "now-6h", "to": "now"},
+        "schemaVersion": 39,
+        "panels": panels,
+    }
+    return json.dumps(dashboard, indent=2) + "\n"
+
+
+def _panel(title, unit, queries):
+    return {
+        "type": "timeseries",
+        "title": title,
+        "datasource": {"type": "prometheus", "uid": DATASOURCE_UID},
+        "fieldConfig": {"defaults": {"unit": unit}, "overrides": []},
+        "targets": [
+            {
+                "refId": chr(ord("A") + index),
+                "datasource": {"type": "prometheus", "uid": DATASOURCE_UID},
+                "expr": expression,
+                "legendFormat": legend,
+            }
+            for index, (expression, legend) in enumerate(queries)
+        ],
+    }
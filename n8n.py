@@ -1,373 +1,909 @@
-import re
-from utils import run_command, create_file
+import json
+import secrets
+import time
+from typing import List
+from utils import run_command, stream_command, Command_Error
+from config import render_config
+from tasks import Task, run_tasks
+from host import get_cpu_count, get_memory_bytes, size_services, default_sqlite_pool_size
+from docker import wait_for_compose_services
+from state import Install_State, affected_services, image_changed
+from monitoring import create_prometheus_config, create_grafana_datasource_config, create_grafana_dashboard_config, create_grafana_dashboard
+
+
+N8N_IMAGE = "docker.n8n.io/n8nio/n8n"
+# The same image on Docker Hub, used when pulling through a registry mirror (which only caches Docker Hub)
+N8N_HUB_IMAGE = "n8nio/n8n"
+N8N_BASE_IMAGE = "n8nio/base:18"
+N8N_CUSTOM_IMAGE = "n8n-custom"
+REDIS_IMAGE = "redis:7-alpine"
+POSTGRES_IMAGE = "postgres:16-alpine"
+NGINX_IMAGE = "nginx:alpine"
+MINIO_IMAGE = "minio/minio:latest"
+MINIO_CLIENT_IMAGE = "minio/mc:latest"
+PROMETHEUS_IMAGE = "prom/prometheus:latest"
+GRAFANA_IMAGE = "grafana/grafana:latest"
+
+# Where binary data is stored in the n8n containers in filesystem mode, a volume or host folder is mounted there
+BINARY_DATA_PATH = "/home/node/binaryData"
+# Folder of the SQLite database with the SQLite profile, a volume or host folder is mounted there.
+# The WAL and shared memory files are created next to the database, so the whole folder is mounted.
+SQLITE_PATH = "/home/node/sqlite"
+SQLITE_DATABASE = f"{SQLITE_PATH}/database.sqlite"
+
+def start_n8n_container(env_vars, is_custom_image, list_of_packages = None, stack_options = None, state = None):
+    state = state or Install_State.load()
+    run_tasks(n8n_container_tasks(env_vars, is_custom_image, list_of_packages, stack_options, state=state))
+    state.save()
+
+
+def n8n_container_tasks(env_vars, is_custom_image, list_of_packages = None, stack_options = None, after = None, state = None) -> List[Task]:
+    """
+    Steps to create the n8n config files, build the image (if custom) and start the container.
+
+    With the state of an earlier run only the changed files are written, the image is only
+    built again if its files changed and only the services affected by the changes are
+    recreated or restarted.
+
+    Args:
+        env_vars: The environment variables to write to the .env file.
+        is_custom_image: Whether to build a custom image with extra packages.
+        list_of_packages: Comma separated list of apk packages for the custom image.
+        stack_options: Shape of the compose stack, see `utils.stack_options`.
+        after: Names of tasks that have to finish before the container is started.
+        state: The `state.Install_State` of the installation, save it once the tasks finished.
+
+    Returns:
+        List[Task]: The tasks to pass to `run_tasks()`. The last step is named "n8n_up".
+    """
+    state = state or Install_State()
+    tasks = [Task("n8n_files", lambda results: _create_n8n_files(env_vars, is_custom_image, list_of_packages, stack_options, state))]
+    up_depends_on = ["n8n_files"] + (after or [])
+
+    if is_custom_image:
+        tasks.append(Task("n8n_build", lambda results: _build_n8n_image(env_vars["N8N_VERSION"], state), ["n8n_files"]))
+        up_depends_on.append("n8n_build")
+
+    tasks.append(Task("n8n_up", lambda results: _run_n8n_container(state), up_depends_on))
+    return tasks
 
 
-def start_n8n_container(env_vars, is_custom_image, list_of_packages = None):
+def _create_n8n_files(env_vars, is_custom_image, list_of_packages = None, stack_options = None, state = None):
+    state = state or Install_State()
 
     print("\nCreating config files...")
-    # Creates n8n folder one folder back
-    run_command("mkdir n8n")
+    # Creates n8n folder one folder back (it is already there when the installer runs again)
+    run_command("mkdir -p n8n")
 
-    # Creates .env file with all our vars
-    vars = _create_env_file(env_vars)
+    # Renders the .env file, the compose environment and the docs from the variable registry
+    files = render_config(env_vars)
 
     # Create .env file
-    create_file("n8n/.env", vars["env_vars"])
+    state.write_file("n8n/.env", files["env"])
+    # Create the reference of the configuration, with the secrets hidden
+    state.write_file("n8n/configuration.md", files["docs"])
 
     # Create docker-compose.yaml file based on custom image
     if not is_custom_image:
         # Create docker compose file with default image
-        create_file("n8n/docker-compose.yaml", _create_dockercompose_file(vars["dockercompose_vars"], False))
+        state.write_file("n8n/docker-compose.yaml", _create_dockercompose_file(files["compose"], False, env_vars, stack_options))
     else:
         # create docker compose file with custom image
-        create_file("n8n/docker-compose.yaml", _create_dockercompose_file(vars["dockercompose_vars"], True))
+        state.write_file("n8n/docker-compose.yaml", _create_dockercompose_file(files["compose"], True, env_vars, stack_options))
         # create docker file to build the image
-        create_file("n8n/dockerfile", _create_dockerfile(list_of_packages or ""))
-        # create docker entrypoint file
-        create_file("n8n/docker-entrypoint.sh", _create_docker_entrypoint())
-        # make docker entrypoint file executable
-        run_command("cd n8n && sudo chmod +x docker-entrypoint.sh")
+        state.write_file("n8n/dockerfile", _create_dockerfile(list_of_packages or ""))
+        # create docker entrypoint file, executable
+        state.write_file("n8n/docker-entrypoint.sh", _create_docker_entrypoint(), mode=0o755)
+
+    # create load balancer config for the webhook processors
+    if (stack_options or {}).get("webhook_count", 0) > 0:
+        state.write_file("n8n/nginx.conf", _create_nginx_config(env_vars, stack_options["webhook_count"]))
+
+    # prometheus scrape config and the grafana datasource and dashboard
+    if (stack_options or {}).get("monitoring"):
+        state.write_file("n8n/monitoring/prometheus.yml", create_prometheus_config(env_vars, stack_options.get("worker_count", 0), stack_options.get("webhook_count", 0)))
+        state.write_file("n8n/monitoring/grafana/datasources.yaml", create_grafana_datasource_config())
+        state.write_file("n8n/monitoring/grafana/dashboards.yaml", create_grafana_dashboard_config())
+        state.write_file("n8n/monitoring/grafana/n8n-dashboard.json", create_grafana_dashboard(env_vars))
+
+    # Files of options that were turned off since the last run
+    removed = state.remove_stale_files()
+
+    if not state.changed and not removed:
+        print("Files unchanged")
+        return
+    for path in sorted(state.changed):
+        print(f"  changed {path}")
+    for path in removed:
+        print(f"  removed {path}")
     print("Files created")
 
-    # Build image
-    if is_custom_image:
-        print("\nBuilding image. This might take a few minutes...")
-        run_command("cd n8n &&  docker compose build")
-        print("\nImage build complete.")
 
-    # Run container
-    print("\nStarting container. This might take a minute...")
-    run_command("cd n8n &&  docker compose up -d")
-    print("Container started. It should now be locally avalible at http://localhost:5678")
-
-
-
-def _create_env_file(env_vars):
-
-    env_template = f"""
-# See Vars at https://docs.n8n.io/hosting/configuration/environment-variables/
-# File setup by an automated script by liam@teraprise.io found here https://github.com/liamdmcgarrigle/n8n-auto-install
-
-# N8N VERSION
-N8N_VERSION="latest"
-
-# AI VARIABLES
-
-
-# CREDENTIALS VARIABLES
-CREDENTIALS_DEFAULT_NAME="{env_vars['CREDENTIALS_DEFAULT_NAME']}"
-
-# DATABASE VARIABLES
-DB_TYPE="{env_vars['DB_TYPE']}"
-DB_TABLE_PREFIX="{env_vars['DB_TABLE_PREFIX']}"
-DB_SQLITE_VACUUM_ON_STARTUP="{env_vars['DB_SQLITE_VACUUM_ON_STARTUP']}"
-
-# DEPLOYMENT VARIABLES
-N8N_EDITOR_BASE_URL="{env_vars['N8N_EDITOR_BASE_URL']}"
-N8N_PERSONALIZATION_ENABLED="{env_vars['N8N_PERSONALIZATION_ENABLED']}"
-N8N_CONFIG_FILES="{env_vars['N8N_CONFIG_FILES']}"
-N8N_DISABLE_UI="{env_vars['N8N_DISABLE_UI']}"
-N8N_PREVIEW_MODE="{env_vars['N8N_PREVIEW_MODE']}"
-N8N_TEMPLATES_ENABLED="{env_vars['N8N_TEMPLATES_ENABLED']}"
-N8N_TEMPLATES_HOST="{env_vars.get('N8N_TEMPLATES_HOST')}"
-N8N_ENCRYPTION_KEY="{env_vars['N8N_ENCRYPTION_KEY']}"
-N8N_GRACEFUL_SHUTDOWN_TIMEOUT="{env_vars['N8N_GRACEFUL_SHUTDOWN_TIMEOUT']}"
-N8N_PUBLIC_API_DISABLED="{env_vars['N8N_PUBLIC_API_DISABLED']}"
-N8N_HIRING_BANNER_ENABLED="{env_vars['N8N_HIRING_BANNER_ENABLED']}"
-
-# BINARY DATA 
-N8N_AVAILABLE_BINARY_DATA_MODES="{env_vars['N8N_AVAILABLE_BINARY_DATA_MODES']}"
-N8N_BINARY_DATA_STORAGE_PATH="{env_vars['N8N_BINARY_DATA_STORAGE_PATH']}"
-N8N_DEFAULT_BINARY_DATA_MODE="{env_vars['N8N_DEFAULT_BINARY_DATA_MODE']}"
-
-# USER MANAGEMENT 
-#  SMTP EMAIL
-N8N_EMAIL_MODE="{env_vars['N8N_EMAIL_MODE']}"
-N8N_SMTP_HOST="{env_vars['N8N_SMTP_HOST']}"
-N8N_SMTP_PORT="{env_vars['N8N_SMTP_PORT']}"
-N8N_SMTP_USER="{env_vars['N8N_SMTP_USER']}"
-N8N_SMTP_PASS="{env_vars['N8N_SMTP_PASS']}"
-#  SERVICE ACCOUNT EMAIL
-N8N_SMTP_OAUTH_SERVICE_CLIENT="{env_vars['N8N_SMTP_OAUTH_SERVICE_CLIENT']}"
-N8N_SMTP_OAUTH_PRIVATE_KEY="{env_vars['N8N_SMTP_OAUTH_PRIVATE_KEY']}"
-N8N_SMTP_SENDER="{env_vars['N8N_SMTP_SENDER']}"
-#  Templates
-N8N_UM_EMAIL_TEMPLATES_INVITE="{env_vars['N8N_UM_EMAIL_TEMPLATES_INVITE']}"
-N8N_UM_EMAIL_TEMPLATES_PWRESET="{env_vars['N8N_UM_EMAIL_TEMPLATES_PWRESET']}"
-N8N_UM_EMAIL_TEMPLATES_WORKFLOW_SHARED="{env_vars['N8N_UM_EMAIL_TEMPLATES_WORKFLOW_SHARED']}"
-N8N_UM_EMAIL_TEMPLATES_CREDENTIALS_SHARED="{env_vars['N8N_UM_EMAIL_TEMPLATES_CREDENTIALS_SHARED']}"
-#  Token options
-N8N_USER_MANAGEMENT_JWT_SECRET="{env_vars['N8N_USER_MANAGEMENT_JWT_SECRET']}"
-N8N_USER_MANAGEMENT_JWT_DURATION_HOURS="{env_vars['N8N_USER_MANAGEMENT_JWT_DURATION_HOURS']}"
-N8N_USER_MANAGEMENT_JWT_REFRESH_TIMEOUT_HOURS="{env_vars['N8N_USER_MANAGEMENT_JWT_REFRESH_TIMEOUT_HOURS']}"
-N8N_MFA_ENABLED="{env_vars['N8N_MFA_ENABLED']}"
-
-# ENDPOINTS
-N8N_PAYLOAD_SIZE_MAX="{env_vars['N8N_PAYLOAD_SIZE_MAX']}"
-N8N_METRICS="{env_vars['N8N_METRICS']}"
-N8N_METRICS_PREFIX="{env_vars['N8N_METRICS_PREFIX']}"
-N8N_METRICS_INCLUDE_DEFAULT_METRICS="{env_vars['N8N_METRICS_INCLUDE_DEFAULT_METRICS']}"
-N8N_METRICS_INCLUDE_CACHE_METRICS="{env_vars['N8N_METRICS_INCLUDE_CACHE_METRICS']}"
-N8N_METRICS_INCLUDE_MESSAGE_EVENT_BUS_METRICS="{env_vars['N8N_METRICS_INCLUDE_MESSAGE_EVENT_BUS_METRICS']}"
-N8N_METRICS_INCLUDE_WORKFLOW_ID_LABEL="{env_vars['N8N_METRICS_INCLUDE_WORKFLOW_ID_LABEL']}"
-N8N_METRICS_INCLUDE_NODE_TYPE_LABEL="{env_vars['N8N_METRICS_INCLUDE_NODE_TYPE_LABEL']}"
-N8N_METRICS_INCLUDE_CREDENTIAL_TYPE_LABEL="{env_vars['N8N_METRICS_INCLUDE_CREDENTIAL_TYPE_LABEL']}"
-N8N_METRICS_INCLUDE_API_ENDPOINTS="{env_vars['N8N_METRICS_INCLUDE_API_ENDPOINTS']}"
-N8N_METRICS_INCLUDE_API_PATH_LABEL="{env_vars['N8N_METRICS_INCLUDE_API_PATH_LABEL']}"
-N8N_METRICS_INCLUDE_API_METHOD_LABEL="{env_vars['N8N_METRICS_INCLUDE_API_METHOD_LABEL']}"
-N8N_METRICS_INCLUDE_API_STATUS_CODE_LABEL="{env_vars['N8N_METRICS_INCLUDE_API_STATUS_CODE_LABEL']}"
-N8N_ENDPOINT_REST="{env_vars['N8N_ENDPOINT_REST']}"
-N8N_ENDPOINT_WEBHOOK="{env_vars['N8N_ENDPOINT_WEBHOOK']}"
-N8N_ENDPOINT_WEBHOOK_TEST="{env_vars['N8N_ENDPOINT_WEBHOOK_TEST']}"
-N8N_ENDPOINT_WEBHOOK_WAIT="{env_vars['N8N_ENDPOINT_WEBHOOK_WAIT']}"
-WEBHOOK_URL="{env_vars['WEBHOOK_URL']}"
-N8N_DISABLE_PRODUCTION_MAIN_PROCESS="{env_vars['N8N_DISABLE_PRODUCTION_MAIN_PROCESS']}"
-
-# EXTERNAL HOOKS
-EXTERNAL_HOOK_FILES="{env_vars['EXTERNAL_HOOK_FILES']}"
-EXTERNAL_FRONTEND_HOOKS_URLS="{env_vars['EXTERNAL_FRONTEND_HOOKS_URLS']}"
-
-# EXECUTION
-EXECUTIONS_MODE="{env_vars['EXECUTIONS_MODE']}"
-EXECUTIONS_TIMEOUT="{env_vars['EXECUTIONS_TIMEOUT']}"
-EXECUTIONS_TIMEOUT_MAX="{env_vars['EXECUTIONS_TIMEOUT_MAX']}"
-EXECUTIONS_DATA_SAVE_ON_ERROR="{env_vars['EXECUTIONS_DATA_SAVE_ON_ERROR']}"
-EXECUTIONS_DATA_SAVE_ON_SUCCESS="{env_vars['EXECUTIONS_DATA_SAVE_ON_SUCCESS']}"
-EXECUTIONS_DATA_SAVE_ON_PROGRESS="{env_vars['EXECUTIONS_DATA_SAVE_ON_PROGRESS']}"
-EXECUTIONS_DATA_SAVE_MANUAL_EXECUTIONS="{env_vars['EXECUTIONS_DATA_SAVE_MANUAL_EXECUTIONS']}"
-EXECUTIONS_DATA_PRUNE="{env_vars['EXECUTIONS_DATA_PRUNE']}"
-EXECUTIONS_DATA_MAX_AGE="{env_vars['EXECUTIONS_DATA_MAX_AGE']}"
-EXECUTIONS_DATA_PRUNE_MAX_COUNT="{env_vars['EXECUTIONS_DATA_PRUNE_MAX_COUNT']}"
-EXECUTIONS_DATA_HARD_DELETE_BUFFER="{env_vars['EXECUTIONS_DATA_HARD_DELETE_BUFFER']}"
-EXECUTIONS_DATA_PRUNE_HARD_DELETE_INTERVAL="{env_vars['EXECUTIONS_DATA_PRUNE_HARD_DELETE_INTERVAL']}"
-EXECUTIONS_DATA_PRUNE_SOFT_DELETE_INTERVAL="{env_vars['EXECUTIONS_DATA_PRUNE_SOFT_DELETE_INTERVAL']}"
-N8N_CONCURRENCY_PRODUCTION_LIMIT="{env_vars['N8N_CONCURRENCY_PRODUCTION_LIMIT']}"
-
-# LOGS
-N8N_LOG_LEVEL="{env_vars['N8N_LOG_LEVEL']}"
-N8N_LOG_OUTPUT="{env_vars['N8N_LOG_OUTPUT']}"
-N8N_LOG_FILE_COUNT_MAX="{env_vars['N8N_LOG_FILE_COUNT_MAX']}"
-N8N_LOG_FILE_SIZE_MAX="{env_vars['N8N_LOG_FILE_SIZE_MAX']}"
-N8N_LOG_FILE_LOCATION="{env_vars['N8N_LOG_FILE_LOCATION']}"
-DB_LOGGING_ENABLED="{env_vars['DB_LOGGING_ENABLED']}"
-DB_LOGGING_OPTIONS="{env_vars['DB_LOGGING_OPTIONS']}"
-DB_LOGGING_MAX_EXECUTION_TIME="{env_vars['DB_LOGGING_MAX_EXECUTION_TIME']}"
-CODE_ENABLE_STDOUT="{env_vars['CODE_ENABLE_STDOUT']}"
-
-# LOG STREAMING
-# N8N_EVENTBUS_CHECKUNSENTINTERVAL="{env_vars['N8N_EVENTBUS_CHECKUNSENTINTERVAL']}"
-# N8N_EVENTBUS_LOGWRITER_SYNCFILEACCESS="{env_vars['N8N_EVENTBUS_LOGWRITER_SYNCFILEACCESS']}"
-# N8N_EVENTBUS_LOGWRITER_KEEPLOGCOUNT="{env_vars['N8N_EVENTBUS_LOGWRITER_KEEPLOGCOUNT']}"
-# N8N_EVENTBUS_LOGWRITER_MAXFILESIZEINKB="{env_vars['N8N_EVENTBUS_LOGWRITER_MAXFILESIZEINKB']}"
-# N8N_EVENTBUS_LOGWRITER_LOGBASENAME="{env_vars['N8N_EVENTBUS_LOGWRITER_LOGBASENAME']}"
-
-# EXTERNAL DATA STORAGE
-# N8N_EXTERNAL_STORAGE_S3_HOST="{env_vars['N8N_EXTERNAL_STORAGE_S3_HOST']}"
-# N8N_EXTERNAL_STORAGE_S3_BUCKET_NAME="{env_vars['N8N_EXTERNAL_STORAGE_S3_BUCKET_NAME']}"
-# N8N_EXTERNAL_STORAGE_S3_BUCKET_REGION="{env_vars['N8N_EXTERNAL_STORAGE_S3_BUCKET_REGION']}"
-# N8N_EXTERNAL_STORAGE_S3_ACCESS_KEY="{env_vars['N8N_EXTERNAL_STORAGE_S3_ACCESS_KEY']}"
-# N8N_EXTERNAL_STORAGE_S3_ACCESS_SECRET="{env_vars['N8N_EXTERNAL_STORAGE_S3_ACCESS_SECRET']}"
-
-# NODES
-NODES_INCLUDE="{env_vars['NODES_INCLUDE']}"
-NODES_EXCLUDE="{env_vars['NODES_EXCLUDE']}"
-NODE_FUNCTION_ALLOW_BUILTIN="{env_vars['NODE_FUNCTION_ALLOW_BUILTIN']}"
-NODE_FUNCTION_ALLOW_EXTERNAL="{env_vars['NODE_FUNCTION_ALLOW_EXTERNAL']}"
-NODES_ERROR_TRIGGER_TYPE="{env_vars['NODES_ERROR_TRIGGER_TYPE']}"
-N8N_CUSTOM_EXTENSIONS="{env_vars['N8N_CUSTOM_EXTENSIONS']}"
-N8N_COMMUNITY_PACKAGES_ENABLED="{env_vars['N8N_COMMUNITY_PACKAGES_ENABLED']}"
-N8N_COMMUNITY_PACKAGES_REGISTRY="{env_vars['N8N_COMMUNITY_PACKAGES_REGISTRY']}"
-
-# QUEUE MODE
-QUEUE_BULL_PREFIX="{env_vars['QUEUE_BULL_PREFIX']}"
-QUEUE_BULL_REDIS_DB="{env_vars['QUEUE_BULL_REDIS_DB']}"
-QUEUE_BULL_REDIS_HOST="{env_vars['QUEUE_BULL_REDIS_HOST']}"
-QUEUE_BULL_REDIS_PORT="{env_vars['QUEUE_BULL_REDIS_PORT']}"
-QUEUE_BULL_REDIS_USERNAME="{env_vars['QUEUE_BULL_REDIS_USERNAME']}"
-QUEUE_BULL_REDIS_PASSWORD="{env_vars['QUEUE_BULL_REDIS_PASSWORD']}"
-QUEUE_BULL_REDIS_TIMEOUT_THRESHOLD="{env_vars['QUEUE_BULL_REDIS_TIMEOUT_THRESHOLD']}"
-QUEUE_BULL_REDIS_CLUSTER_NODES="{env_vars['QUEUE_BULL_REDIS_CLUSTER_NODES']}"
-QUEUE_BULL_REDIS_TLS="{env_vars['QUEUE_BULL_REDIS_TLS']}"
-QUEUE_RECOVERY_INTERVAL="{env_vars['QUEUE_RECOVERY_INTERVAL']}"
-QUEUE_HEALTH_CHECK_ACTIVE="{env_vars['QUEUE_HEALTH_CHECK_ACTIVE']}"
-QUEUE_HEALTH_CHECK_PORT="{env_vars['QUEUE_HEALTH_CHECK_PORT']}"
-QUEUE_WORKER_LOCK_DURATION="{env_vars['QUEUE_WORKER_LOCK_DURATION']}"
-QUEUE_WORKER_LOCK_RENEW_TIME="{env_vars['QUEUE_WORKER_LOCK_RENEW_TIME']}"
-QUEUE_WORKER_STALLED_INTERVAL="{env_vars['QUEUE_WORKER_STALLED_INTERVAL']}"
-QUEUE_WORKER_MAX_STALLED_COUNT="{env_vars['QUEUE_WORKER_MAX_STALLED_COUNT']}"
-
-# SECURITY
-N8N_BLOCK_ENV_ACCESS_IN_NODE="{env_vars['N8N_BLOCK_ENV_ACCESS_IN_NODE']}"
-N8N_RESTRICT_FILE_ACCESS_TO="{env_vars['N8N_RESTRICT_FILE_ACCESS_TO']}"
-N8N_BLOCK_FILE_ACCESS_TO_N8N_FILES="{env_vars['N8N_BLOCK_FILE_ACCESS_TO_N8N_FILES']}"
-N8N_SECURITY_AUDIT_DAYS_ABANDONED_WORKFLOW="{env_vars['N8N_SECURITY_AUDIT_DAYS_ABANDONED_WORKFLOW']}"
-N8N_SECURE_COOKIE="{env_vars['N8N_SECURE_COOKIE']}"
-
-# GIT
-N8N_SOURCECONTROL_DEFAULT_SSH_KEY_TYPE="{env_vars['N8N_SOURCECONTROL_DEFAULT_SSH_KEY_TYPE']}"
-
-# EXTERNAL SECRETS
-N8N_EXTERNAL_SECRETS_UPDATE_INTERVAL="{env_vars['N8N_EXTERNAL_SECRETS_UPDATE_INTERVAL']}"
-
-# LOCAL
-GENERIC_TIMEZONE="{env_vars['GENERIC_TIMEZONE']}"
-N8N_DEFAULT_LOCALE="{env_vars['N8N_DEFAULT_LOCALE']}"
-
-# WORKFLOWS
-WORKFLOWS_DEFAULT_NAME="{env_vars['WORKFLOWS_DEFAULT_NAME']}"
-N8N_ONBOARDING_FLOW_DISABLED="{env_vars['N8N_ONBOARDING_FLOW_DISABLED']}"
-N8N_WORKFLOW_TAGS_DISABLED="{env_vars['N8N_WORKFLOW_TAGS_DISABLED']}"
-N8N_WORKFLOW_CALLER_POLICY_DEFAULT_OPTION="{env_vars['N8N_WORKFLOW_CALLER_POLICY_DEFAULT_OPTION']}"
-
-# LICENSE
-N8N_HIDE_USAGE_PAGE="{env_vars['N8N_HIDE_USAGE_PAGE']}"
-N8N_LICENSE_ACTIVATION_KEY="{env_vars['N8N_LICENSE_ACTIVATION_KEY']}"
-N8N_LICENSE_AUTO_RENEW_ENABLED="{env_vars['N8N_LICENSE_AUTO_RENEW_ENABLED']}"
-N8N_LICENSE_AUTO_RENEW_OFFSET="{env_vars['N8N_LICENSE_AUTO_RENEW_OFFSET']}"
-N8N_LICENSE_SERVER_URL="{env_vars['N8N_LICENSE_SERVER_URL']}"
-HTTP_PROXY_LICENSE_SERVER="{env_vars['HTTP_PROXY_LICENSE_SERVER']}"
-HTTPS_PROXY_LICENSE_SERVER="{env_vars['HTTPS_PROXY_LICENSE_SERVER']}"
-"""
+def _build_n8n_image(n8n_version, state = None):
+    image = f"{N8N_CUSTOM_IMAGE}:{n8n_version}"
+    # The image is built whenever it can't be found, also if docker could not be asked
+    if state is not None and not image_changed(state.changed) and _probe_command(f"docker images -q {image}"):
+        print(f"\nImage {image} is up to date, skipping the build.")
+        return
 
-    # Process each line
-    processed_lines = []
-    for line in env_template.split('\n'):
-        if '="None"' in line:
-            # Comment out the line and remove the "None" value
-            line = f"# {line.split('=')[0]}="
-        processed_lines.append(line)
+    print("\nBuilding image. This might take a few minutes...")
+    start = time.monotonic()
+    # BuildKit is needed for the cache mounts in the dockerfile
+    run_command("cd n8n && DOCKER_BUILDKIT=1 BUILDKIT_PROGRESS=plain docker compose build", show_output=True)
+    build_time = time.monotonic() - start
 
-    env_vars = '\n'.join(processed_lines)
+    size = _probe_command(f"docker image inspect --format '{{{{.Size}}}}' {image}") or ""
+    size = f"{int(size) / 1024 ** 2:.0f}MB" if size.isdigit() else "unknown size"
+    print(f"\nImage build complete in {build_time:.0f}s ({image}, {size}).")
 
 
-    docker_file_env_lines = []
+def _probe_command(command):
+    # Output of a command that only gathers information, None if it fails instead of exiting the installer
+    try:
+        return "\n".join(stream_command(command)).strip()
+    except Command_Error:
+        return None
 
-    for line in env_template.split('\n'):
-        if '="None"' in line:
-            continue # dont add at all
-        if '=""' in line:
-            continue # dont add at all
-        if line.startswith("#"):
-            continue
-        elif not '=' in line:
-            continue
-        elif 'N8N_VERSION' in line:
-            continue
-        docker_file_env_lines.append(f"      - {_replace_env_vars(line)}")
 
+def _run_n8n_container(state = None):
+    print("\nStarting container. This might take a minute...")
+    # Only the services whose config changed are recreated, services of options that were
+    # turned off are removed
+    run_command("cd n8n && docker compose up -d --remove-orphans", show_output=True, timeout=600)
+
+    # Files mounted into a container are read when it starts, new containers already read them
+    restarts = affected_services(state.changed) if state is not None and state.existed else []
+    if restarts:
+        print(f"Restarting {', '.join(restarts)} for the changed config files...")
+        run_command(f"cd n8n && docker compose restart {' '.join(restarts)}", timeout=300)
+
+    ready_after = wait_for_compose_services("n8n")
+    print(f"n8n is up and healthy ({ready_after:.0f}s). It should now be locally avalible at http://localhost:5678")
+
+
+def get_n8n_image(stack_options = None) -> str:
+    """
+    Get the n8n image to use, without the tag.
+
+    Args:
+        stack_options: Shape of the compose stack, see `utils.stack_options`.
+
+    Returns:
+        str: The Docker Hub image when a registry mirror is used, the docker.n8n.io image otherwise.
+    """
+    if (stack_options or {}).get("registry_mirror"):
+        return N8N_HUB_IMAGE
+    return N8N_IMAGE
+
+
+def use_postgres(env_vars):
+    """
+    Switch the install to a postgres container, filling in any connection details not set yet.
+
+    A random password is generated if none was given.
+
+    Args:
+        env_vars: The environment variables to update.
+    """
+    env_vars["DB_TYPE"] = "postgresdb"
+    defaults = {
+        "DB_POSTGRESDB_DATABASE": "n8n",
+        "DB_POSTGRESDB_HOST": "postgres",
+        "DB_POSTGRESDB_PORT": "5432",
+        "DB_POSTGRESDB_USER": "n8n",
+        "DB_POSTGRESDB_PASSWORD": secrets.token_urlsafe(24),
+        "DB_POSTGRESDB_SCHEMA": "public",
+        "DB_POSTGRESDB_POOL_SIZE": "4",
+    }
+    for key, value in defaults.items():
+        if env_vars.get(key) in (None, ""):
+            env_vars[key] = value
+
+
+
+def use_local_s3(env_vars):
+    """
+    Store binary data in a MinIO container in the stack, filling in any details not set yet.
+
+    The access key and secret are also MinIO's root credentials, a random secret is generated
+    if none was given. The bucket is created by a one-off container before n8n starts.
+
+    Args:
+        env_vars: The environment variables to update.
+    """
+    env_vars["N8N_DEFAULT_BINARY_DATA_MODE"] = "s3"
+    env_vars["N8N_AVAILABLE_BINARY_DATA_MODES"] = "filesystem,s3"
+    defaults = {
+        "N8N_EXTERNAL_STORAGE_S3_HOST": "minio:9000",
+        "N8N_EXTERNAL_STORAGE_S3_PROTOCOL": "http",
+        "N8N_EXTERNAL_STORAGE_S3_BUCKET_NAME": "n8n",
+        "N8N_EXTERNAL_STORAGE_S3_BUCKET_REGION": "us-east-1",
+        "N8N_EXTERNAL_STORAGE_S3_ACCESS_KEY": "n8n",
+        "N8N_EXTERNAL_STORAGE_S3_ACCESS_SECRET": secrets.token_urlsafe(24),
+    }
+    for key, value in defaults.items():
+        if env_vars.get(key) in (None, ""):
+            env_vars[key] = value
+
+
+def use_redis(env_vars):
+    """
+    Point n8n at the redis container of the stack, filling in any connection details not set yet.
+
+    A random password is generated if none was given.
+
+    Args:
+        env_vars: The environment variables to update.
+    """
+    env_vars["QUEUE_BULL_REDIS_HOST"] = "redis"
+    # How long n8n keeps trying to reach redis before it exits, a second is shorter than a
+    # slow fsync or a restart of the container
+    env_vars["QUEUE_BULL_REDIS_TIMEOUT_THRESHOLD"] = "10000"
+    # Workers serve /healthz for the compose healthcheck
+    env_vars["QUEUE_HEALTH_CHECK_ACTIVE"] = "true"
+    defaults = {
+        "QUEUE_BULL_REDIS_PORT": "6379",
+        "QUEUE_BULL_REDIS_PASSWORD": secrets.token_urlsafe(24),
+        "QUEUE_HEALTH_CHECK_PORT": "5678",
+    }
+    for key, value in defaults.items():
+        if env_vars.get(key) in (None, ""):
+            env_vars[key] = value
+
+
+def use_sqlite_profile(env_vars, pool_size = None):
+    """
+    Tune SQLite for a single node install, filling in any settings not set yet.
+
+    A pool size above 0 opens the database in WAL mode instead of the rollback journal:
+    writes no longer block reads, and a commit appends to the WAL instead of rewriting pages
+    and syncing twice. The pool size is the number of read connections next to the single
+    writer. The database is moved to its own folder, which gets a volume or host folder.
+
+    Args:
+        env_vars: The environment variables to update.
+        pool_size: Number of read connections, sized from the host's CPUs if not given.
+    """
+    env_vars["DB_TYPE"] = "sqlite"
+    defaults = {
+        "DB_SQLITE_POOL_SIZE": str(pool_size or default_sqlite_pool_size()),
+        "DB_SQLITE_DATABASE": SQLITE_DATABASE,
+    }
+    for key, value in defaults.items():
+        if env_vars.get(key) in (None, ""):
+            env_vars[key] = value
+
+
+def use_monitoring(env_vars, stack_options):
+    """
+    Turn on the metrics the monitoring dashboard is built from, and a grafana password if none was set.
+
+    Call it once the stack is decided, the queue metrics are only turned on in queue mode.
+
+    Args:
+        env_vars: The environment variables to update.
+        stack_options: Shape of the compose stack, see `utils.stack_options`.
+    """
+    stack_options["monitoring"] = True
+    env_vars["N8N_METRICS"] = "true"
+    # Event loop lag and heap are default metrics, the execution counters come from the event bus
+    env_vars["N8N_METRICS_INCLUDE_DEFAULT_METRICS"] = "true"
+    env_vars["N8N_METRICS_INCLUDE_MESSAGE_EVENT_BUS_METRICS"] = "true"
+    env_vars["N8N_METRICS_INCLUDE_QUEUE_METRICS"] = str(stack_options.get("worker_count", 0) > 0).lower()
+    if env_vars.get("GRAFANA_ADMIN_PASSWORD") in (None, ""):
+        env_vars["GRAFANA_ADMIN_PASSWORD"] = secrets.token_urlsafe(24)
+
+
+def _create_dockercompose_file(dockercompose_vars, is_custom_image, env_vars, stack_options = None):
+    stack_options = stack_options or {}
+    worker_count = stack_options.get("worker_count", 0)
+    webhook_count = stack_options.get("webhook_count", 0)
+    is_postgres = env_vars["DB_TYPE"] == "postgresdb"
+    is_local_s3 = stack_options.get("local_s3", False)
+    is_filesystem_binary_data = env_vars.get("N8N_DEFAULT_BINARY_DATA_MODE") == "filesystem"
+    binary_data_host_path = stack_options.get("binary_data_host_path")
+    is_sqlite_profile = env_vars["DB_TYPE"] == "sqlite" and env_vars.get("DB_SQLITE_DATABASE") == SQLITE_DATABASE
+    sqlite_host_path = stack_options.get("sqlite_host_path")
+    # Address redis, postgres and minio are published on, for workers on other hosts (see remote.py)
+    publish_address = stack_options.get("publish_address")
+
+    # Binary data gets its own volume (or a host folder, like on a fast disk) shared by every n8n process
+    n8n_volumes = ["n8n_storage:/home/node/.n8n"]
+    if is_filesystem_binary_data:
+        n8n_volumes.append(f"{binary_data_host_path or 'n8n_binary_data'}:{BINARY_DATA_PATH}")
+    # The same for the SQLite database with the SQLite profile
+    if is_sqlite_profile:
+        n8n_volumes.append(f"{sqlite_host_path or 'n8n_sqlite'}:{SQLITE_PATH}")
+
+    # Settings shared by every n8n service (main and workers) through a yaml anchor
+    if is_custom_image:
+        image = f"{N8N_CUSTOM_IMAGE}:${{N8N_VERSION}}"
+    else:
+        image = f"{get_n8n_image(stack_options)}:${{N8N_VERSION}}"
+
+    shared_n8n_settings = _shared_n8n_settings(image, dockercompose_vars, n8n_volumes)
+
+    # Backing services every n8n process waits for
+    backing_services = []
+    if worker_count > 0:
+        backing_services.append("redis")
+    if is_postgres:
+        backing_services.append("postgres")
+    if is_local_s3:
+        backing_services.append("minio-init")
+    # Mounts after n8n_storage are owned by root until chowned
+    if len(n8n_volumes) > 1:
+        backing_services.append("volume-init")
+
+    # cgroup limits of every container, sized from the host (empty if limits are turned off)
+    limits = get_resource_limits(env_vars, stack_options)
+
+    volumes = ["n8n_storage"]
+    if is_filesystem_binary_data and not binary_data_host_path:
+        volumes.append("n8n_binary_data")
+    if is_sqlite_profile and not sqlite_host_path:
+        volumes.append("n8n_sqlite")
+    services_before_n8n = [_volume_init_service(image, n8n_volumes[1:])] if len(n8n_volumes) > 1 else []
+    # With webhook processors the load balancer is published on 5678 instead of the main instance
+    services = services_before_n8n + [_n8n_main_service(is_custom_image, backing_services, webhook_count == 0) + _resources(limits.get("n8n"))]
+
+    if worker_count > 0:
+        volumes.append("redis_storage")
+        worker_health_check = env_vars.get("QUEUE_HEALTH_CHECK_ACTIVE") == "true"
+        services += [_n8n_worker_service(number, backing_services + ["n8n"], worker_health_check) + _resources(limits.get("n8n-worker")) for number in range(1, worker_count + 1)]
+        # Without limits redis is given the memory it would get with them
+        redis_memory = limits["redis"].memory_bytes if "redis" in limits else 256 * 1024 ** 2
+        services.append(_redis_service(_redis_settings(redis_memory, stack_options.get("redis_persistence", "aof"), bool(env_vars.get("QUEUE_BULL_REDIS_PASSWORD")))) + _published_port(publish_address, 6379) + _resources(limits.get("redis")))
+
+    if webhook_count > 0:
+        services += [_n8n_webhook_service(number, backing_services) + _resources(limits.get("n8n-webhook")) for number in range(1, webhook_count + 1)]
+        services.append(_load_balancer_service(webhook_count) + _resources(limits.get("load-balancer")))
+
+    if is_postgres:
+        volumes.append("postgres_storage")
+        # every n8n process holds its own connection pool
+        n8n_process_count = 1 + worker_count + webhook_count
+        # Without limits postgres shares the host with n8n, so it is sized as if it had half the memory
+        db_memory = limits["postgres"].memory_bytes if "postgres" in limits else get_memory_bytes() // 2
+        services.append(_postgres_service(_postgres_settings(db_memory, get_cpu_count(), n8n_process_count)) + _published_port(publish_address, 5432) + _resources(limits.get("postgres")))
+
+    if is_local_s3:
+        volumes.append("minio_storage")
+        services.append(_minio_service() + _published_port(publish_address, 9000) + _resources(limits.get("minio")))
+        services.append(_minio_init_service())
+
+    if stack_options.get("monitoring"):
+        volumes += ["prometheus_storage", "grafana_storage"]
+        services.append(_prometheus_service() + _resources(limits.get("prometheus")))
+        services.append(_grafana_service() + _resources(limits.get("grafana")))
+
+    volumes_section = "volumes:\n" + "\n".join(f"  {volume}:" for volume in volumes)
 
+    dockercompose_file_list = [
+        shared_n8n_settings,
+        volumes_section,
+        "services:",
+        *services,
+    ]
 
-    dockercompose_vars = '\n'.join(docker_file_env_lines)
-    
+    return '\n'.join(dockercompose_file_list)
 
 
-    return_map = {
-        "env_vars": env_vars,
-        "dockercompose_vars": dockercompose_vars
+def create_worker_compose_file(dockercompose_vars, env_vars, worker_count, limits = None, stack_options = None) -> str:
+    """
+    Create a compose file with only queue mode workers, for a host next to the main one.
+
+    The workers connect to the database, redis and (if used) minio of the main host, the
+    addresses are in the environment. Only the stock n8n image is used, a custom image
+    would have to be built on every host.
+
+    Args:
+        dockercompose_vars: The `environment:` lines of the workers, from `config.render_config()`.
+        env_vars: The environment variables of the workers.
+        worker_count: Number of workers to run on the host.
+        limits: The `host.Resource_Limits` of a worker on that host, None for no limits.
+        stack_options: Shape of the compose stack, see `utils.stack_options`.
+
+    Returns:
+        str: The content of the docker-compose.yaml file.
+    """
+    image = f"{get_n8n_image(stack_options)}:${{N8N_VERSION}}"
+    health_check = env_vars.get("QUEUE_HEALTH_CHECK_ACTIVE") == "true"
+    services = [_n8n_worker_service(number, [], health_check) + _resources(limits) for number in range(1, worker_count + 1)]
+    return "\n".join([
+        _shared_n8n_settings(image, dockercompose_vars, ["n8n_storage:/home/node/.n8n"]),
+        "volumes:\n  n8n_storage:",
+        "services:",
+        *services,
+    ])
+
+
+def get_resource_limits(env_vars, stack_options = None) -> dict:
+    """
+    Size the containers of the stack from this host's CPU and memory.
+
+    Args:
+        env_vars: The environment variables, to know which database is used.
+        stack_options: Shape of the compose stack, see `utils.stack_options`. The
+            "resource_limits" option turns the limits off, "resource_overrides" fixes
+            the values of some kinds of service.
+
+    Returns:
+        dict: The `host.Resource_Limits` of every kind of service in the stack, like "n8n"
+            or "n8n-worker". Empty if the limits are turned off.
+    """
+    stack_options = stack_options or {}
+    if not stack_options.get("resource_limits", True):
+        return {}
+
+    worker_count = stack_options.get("worker_count", 0)
+    webhook_count = stack_options.get("webhook_count", 0)
+    service_counts = {
+        "n8n": 1,
+        "n8n-worker": worker_count,
+        "n8n-webhook": webhook_count,
+        "load-balancer": 1 if webhook_count > 0 else 0,
+        "redis": 1 if worker_count > 0 else 0,
+        "postgres": 1 if env_vars["DB_TYPE"] == "postgresdb" else 0,
+        "minio": 1 if stack_options.get("local_s3") else 0,
+        "prometheus": 1 if stack_options.get("monitoring") else 0,
+        "grafana": 1 if stack_options.get("monitoring") else 0,
     }
+    return size_services(service_counts, get_cpu_count(), get_memory_bytes(), stack_options.get("resource_overrides"))
+
+
+def _shared_n8n_settings(image, dockercompose_vars, n8n_volumes):
+    # Settings shared by every n8n service (main and workers) through a yaml anchor
+    return f"""\
+x-n8n: &n8n
+  image: {image}
+  restart: unless-stopped
+  environment:
+{dockercompose_vars}
+  volumes:
+{chr(10).join(f"    - {volume}" for volume in n8n_volumes)}
+{_healthcheck("wget -q --spider http://localhost:5678/healthz || exit 1", "  ", start_period="60s")}
+"""
 
-    return return_map
 
+def _published_port(address, port):
+    if not address:
+        return ""
+    return f"""
+    ports:
+      - {address}:{port}:{port}\
+"""
 
-def _create_dockercompose_file(dockercompose_vars, is_custom_image):
 
-    dockercompose_file_start = """\
-volumes:
-  n8n_storage:
-services:
-  n8n:\
+def _resources(limits):
+    if limits is None:
+        return ""
+    mb = 1024 ** 2
+    return f"""
+    cpus: {limits.cpus}
+    cpu_shares: {limits.cpu_shares}
+    mem_limit: {limits.memory_bytes // mb}m
+    mem_reservation: {limits.memory_reservation_bytes // mb}m
+    pids_limit: {limits.pids}\
+"""
+
+
+# One-off services that have to finish successfully before the services depending on them start
+_ONE_OFF_SERVICES = ["minio-init", "volume-init"]
+
+
+def _depends_on(services):
+    # Every other service that is depended on has a healthcheck, so start only once they are healthy
+    if not services:
+        return ""
+    conditions = ["service_completed_successfully" if service in _ONE_OFF_SERVICES else "service_healthy" for service in services]
+    return "\n    depends_on:" + "".join(f"\n      {service}:\n        condition: {condition}" for service, condition in zip(services, conditions))
+
+
+def _healthcheck(command, indent = "    ", start_period = "30s"):
+    lines = [
+        "healthcheck:",
+        f"  test: {json.dumps(['CMD-SHELL', command])}",
+        "  interval: 10s",
+        "  timeout: 5s",
+        "  retries: 5",
+        f"  start_period: {start_period}",
+    ]
+    return "\n".join(indent + line for line in lines)
+
+
+def _n8n_main_service(is_custom_image, depends_on, publish_port = True):
+    service = """\
+  n8n:
+    <<: *n8n\
 """
 
     if is_custom_image:
-        build_step = """\
+        service += """
     build:
       context: .
       args:
         N8N_VERSION: ${N8N_VERSION}\
 """
-    else:
-        build_step = "    image: docker.n8n.io/n8nio/n8n:${N8N_VERSION}"
 
-    dockercompose_file_after_build = """\
-    restart: unless-stopped
-    environment:\
+    if publish_port:
+        service += """
+    ports:
+      - 5678:5678\
 """
 
-    dockercompose_file_end = """\
+    return service + _depends_on(depends_on)
+
+
+def _n8n_worker_service(number, depends_on, health_check = False):
+    # Workers only serve /healthz when QUEUE_HEALTH_CHECK_ACTIVE is true, on their own port
+    if health_check:
+        healthcheck = _healthcheck("wget -q --spider http://localhost:${QUEUE_HEALTH_CHECK_PORT:-5678}/healthz || exit 1")
+    else:
+        healthcheck = "    healthcheck:\n      disable: true"
+    return f"""\
+  n8n-worker-{number}:
+    <<: *n8n
+    command: worker --concurrency=${{N8N_WORKER_CONCURRENCY}}
+{healthcheck}\
+""" + _depends_on(depends_on)
+
+
+def _n8n_webhook_service(number, depends_on):
+    return f"""\
+  n8n-webhook-{number}:
+    <<: *n8n
+    command: webhook\
+""" + _depends_on(depends_on + ["n8n"])
+
+
+def _load_balancer_service(webhook_count):
+    webhook_services = [f"n8n-webhook-{number}" for number in range(1, webhook_count + 1)]
+    return f"""\
+  load-balancer:
+    image: {NGINX_IMAGE}
+    restart: unless-stopped
     ports:
       - 5678:5678
     volumes:
-      - n8n_storage:/home/node/.n8n\
+      - ./nginx.conf:/etc/nginx/nginx.conf:ro\
+""" + _depends_on(["n8n"] + webhook_services)
+
+
+def _create_nginx_config(env_vars, webhook_count):
+    # Production webhooks go to the webhook processors, everything else (editor, REST API,
+    # test webhooks) goes to the main instance
+    webhook_servers = "\n".join(f"        server n8n-webhook-{number}:5678;" for number in range(1, webhook_count + 1))
+    webhook_path = env_vars["N8N_ENDPOINT_WEBHOOK"]
+    max_body_size = env_vars["N8N_PAYLOAD_SIZE_MAX"] or "16"
+
+    return f"""\
+worker_processes auto;
+
+events {{
+    worker_connections 4096;
+}}
+
+http {{
+    upstream n8n_main {{
+        server n8n:5678;
+        keepalive 16;
+    }}
+
+    upstream n8n_webhooks {{
+        least_conn;
+{webhook_servers}
+        keepalive 64;
+    }}
+
+    map $http_upgrade $connection_upgrade {{
+        default upgrade;
+        '' '';
+    }}
+
+    client_max_body_size {max_body_size}m;
+    proxy_http_version 1.1;
+    proxy_read_timeout 300s;
+
+    server {{
+        listen 5678;
+
+        # proxy_set_header is not inherited once a location sets its own, so every location sets all of them
+        location /{webhook_path}/ {{
+            proxy_set_header Host $host;
+            proxy_set_header X-Real-IP $remote_addr;
+            proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
+            proxy_set_header X-Forwarded-Proto $scheme;
+            proxy_set_header Connection "";
+            proxy_pass http://n8n_webhooks;
+        }}
+
+        location / {{
+            # the editor uses a websocket for live updates
+            proxy_set_header Host $host;
+            proxy_set_header X-Real-IP $remote_addr;
+            proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
+            proxy_set_header X-Forwarded-Proto $scheme;
+            proxy_set_header Upgrade $http_upgrade;
+            proxy_set_header Connection $connection_upgrade;
+            proxy_pass http://n8n_main;
+        }}
+    }}
+}}
 """
 
-    dockercompose_file_list = [
-        dockercompose_file_start,
-        build_step,
-        dockercompose_file_after_build,
-        dockercompose_vars,
-        dockercompose_file_end
-    ]
 
-    return '\n'.join(dockercompose_file_list)
+def _redis_service(settings):
+    command = "\n".join(f"      --{key} {value}" for key, value in settings.items())
+    # redis-cli in the healthcheck reads the password from REDISCLI_AUTH
+    environment = """
+    environment:
+      - REDISCLI_AUTH=${QUEUE_BULL_REDIS_PASSWORD}""" if "requirepass" in settings else ""
+    return f"""\
+  redis:
+    image: {REDIS_IMAGE}
+    restart: unless-stopped{environment}
+    command: >-
+      redis-server
+{command}
+    sysctls:
+      net.core.somaxconn: {settings["tcp-backlog"]}
+    volumes:
+      - redis_storage:/data
+{_healthcheck("redis-cli ping | grep -q PONG", start_period="10s")}\
+"""
 
 
-def _create_dockerfile(list_of_packages: str):
-    start_of_dockerfile = """\
-# Base image from n8n's base image (which is based on Alpine)
-FROM n8nio/base:18
+def _redis_settings(redis_memory, persistence = "aof", password = False):
+    # redis_memory is the memory redis can use (its container limit).
+    # Saving forks redis, and pages written during the save are copied, so with persistence
+    # only half the memory is given to the data.
+    mb = 1024 ** 2
+    data_share = 0.75 if persistence == "none" else 0.5
+
+    settings = {
+        "maxmemory": f"{max(32 * mb, int(redis_memory * data_share)) // mb}mb",
+        # Bull keeps jobs and locks in redis, evicting any of them loses or duplicates executions.
+        # Writes fail once maxmemory is reached instead, which n8n reports.
+        "maxmemory-policy": "noeviction",
+        # Every n8n process holds a few connections, and they all reconnect at once after a restart
+        "tcp-backlog": 4096,
+        "tcp-keepalive": 60,
+    }
+    if password:
+        settings["requirepass"] = "${QUEUE_BULL_REDIS_PASSWORD}"
+
+    if persistence == "aof":
+        settings.update({
+            "appendonly": "yes",
+            "appendfsync": "everysec",
+            # Skip the fsync while the AOF is rewritten, instead of stalling every write on the disk
+            "no-appendfsync-on-rewrite": "yes",
+            "aof-use-rdb-preamble": "yes",
+            "save": '""',
+        })
+    elif persistence == "rdb":
+        settings.update({
+            "appendonly": "no",
+            "save": '"300 100 60 10000"',
+        })
+    else:
+        settings.update({
+            "appendonly": "no",
+            "save": '""',
+        })
+    return settings
+
+
+def _volume_init_service(image, mounts):
+    # A new volume or host folder belongs to root, n8n runs as the node user (uid 1000)
+    targets = [mount.split(":")[1] for mount in mounts]
+    return f"""\
+  volume-init:
+    image: {image}
+    restart: "no"
+    user: root
+    entrypoint: {json.dumps(["chown", "1000:1000", *targets])}
+    volumes:
+{chr(10).join(f"      - {mount}" for mount in mounts)}
+    healthcheck:
+      disable: true\
+"""
 
-# INSTALL EXTRA PACKAGES HERE using Apline package installer (APK)
-#-------------------------------------------------------------------
-RUN apk update
+
+def _minio_service():
+    return f"""\
+  minio:
+    image: {MINIO_IMAGE}
+    restart: unless-stopped
+    command: server /data --console-address :9001
+    environment:
+      - MINIO_ROOT_USER=${{N8N_EXTERNAL_STORAGE_S3_ACCESS_KEY}}
+      - MINIO_ROOT_PASSWORD=${{N8N_EXTERNAL_STORAGE_S3_ACCESS_SECRET}}
+    volumes:
+      - minio_storage:/data
+{_healthcheck("mc ready local", start_period="10s")}\
 """
-# FFmpeg
-# apk add --no-cache ffmpeg
 
-    list_of_packages = [item.strip() for item in list_of_packages.split(',') if item.strip()]
 
-    install_text = []
+def _minio_init_service():
+    # Creates the bucket once minio is up, then exits
+    return f"""\
+  minio-init:
+    image: {MINIO_CLIENT_IMAGE}
+    restart: "no"
+    environment:
+      - MINIO_ROOT_USER=${{N8N_EXTERNAL_STORAGE_S3_ACCESS_KEY}}
+      - MINIO_ROOT_PASSWORD=${{N8N_EXTERNAL_STORAGE_S3_ACCESS_SECRET}}
+      - BUCKET=${{N8N_EXTERNAL_STORAGE_S3_BUCKET_NAME}}
+    entrypoint: >-
+      sh -c "mc alias set local http://minio:9000 $$MINIO_ROOT_USER $$MINIO_ROOT_PASSWORD &&
+      mc mb --ignore-existing local/$$BUCKET"\
+""" + _depends_on(["minio"])
+
+
+def _prometheus_service():
+    return f"""\
+  prometheus:
+    image: {PROMETHEUS_IMAGE}
+    restart: unless-stopped
+    command:
+      - --config.file=/etc/prometheus/prometheus.yml
+      - --storage.tsdb.path=/prometheus
+      - --storage.tsdb.retention.time=15d
+    ports:
+      - 127.0.0.1:9090:9090
+    volumes:
+      - ./monitoring/prometheus.yml:/etc/prometheus/prometheus.yml:ro
+      - prometheus_storage:/prometheus
+{_healthcheck("wget -q --spider http://localhost:9090/-/ready || exit 1", start_period="10s")}\
+""" + _depends_on(["n8n"])
 
-    for package in list_of_packages:
-        if package == '':
-            continue
-        install_text.append(f"""\
-# {package}
-RUN apk add {package}
-""")
-        
-    middle_of_dockerfile = "\n".join(install_text)
 
+def _grafana_service():
+    return f"""\
+  grafana:
+    image: {GRAFANA_IMAGE}
+    restart: unless-stopped
+    environment:
+      - GF_SECURITY_ADMIN_USER=admin
+      - GF_SECURITY_ADMIN_PASSWORD=${{GRAFANA_ADMIN_PASSWORD}}
+      - GF_USERS_ALLOW_SIGN_UP=false
+      - GF_DASHBOARDS_DEFAULT_HOME_DASHBOARD_PATH=/etc/grafana/dashboards/n8n.json
+    ports:
+      - 3000:3000
+    volumes:
+      - ./monitoring/grafana/datasources.yaml:/etc/grafana/provisioning/datasources/prometheus.yaml:ro
+      - ./monitoring/grafana/dashboards.yaml:/etc/grafana/provisioning/dashboards/n8n.yaml:ro
+      - ./monitoring/grafana/n8n-dashboard.json:/etc/grafana/dashboards/n8n.json:ro
+      - grafana_storage:/var/lib/grafana
+{_healthcheck("wget -q --spider http://localhost:3000/api/health || exit 1", start_period="30s")}\
+""" + _depends_on(["prometheus"])
+
+
+def _postgres_service(settings):
+    command = "\n".join(f"      -c {key}={value}" for key, value in settings.items())
+    return f"""\
+  postgres:
+    image: {POSTGRES_IMAGE}
+    restart: unless-stopped
+    shm_size: 256mb
+    environment:
+      - POSTGRES_USER=${{DB_POSTGRESDB_USER}}
+      - POSTGRES_PASSWORD=${{DB_POSTGRESDB_PASSWORD}}
+      - POSTGRES_DB=${{DB_POSTGRESDB_DATABASE}}
+    command: >-
+      postgres
+{command}
+    volumes:
+      - postgres_storage:/var/lib/postgresql/data
+{_healthcheck("pg_isready -U $${POSTGRES_USER} -d $${POSTGRES_DB}", start_period="20s")}\
+"""
 
-    end_of_dockerfile = """\
-#-------------------------------------------------------------------
 
+def _postgres_settings(db_memory, cpu_count, n8n_process_count):
+    # db_memory is the memory postgres can use (its container limit).
+    # The ratios follow the usual pgtune recommendations for a mixed workload on SSDs.
+    mb = 1024 ** 2
+
+    max_connections = max(50, 20 * n8n_process_count)
+    parallel_per_gather = max(1, min(4, cpu_count // 2))
+    shared_buffers = max(128 * mb, db_memory // 4)
+    effective_cache_size = db_memory * 3 // 4
+    maintenance_work_mem = max(64 * mb, min(2048 * mb, db_memory // 16))
+    work_mem = max(4 * mb, (db_memory - shared_buffers) // (max_connections * 3) // parallel_per_gather)
+    wal_buffers = min(16 * mb, max(mb, shared_buffers // 32))
+
+    return {
+        "max_connections": max_connections,
+        "shared_buffers": f"{shared_buffers // mb}MB",
+        "effective_cache_size": f"{effective_cache_size // mb}MB",
+        "maintenance_work_mem": f"{maintenance_work_mem // mb}MB",
+        "work_mem": f"{work_mem // mb}MB",
+        "wal_buffers": f"{wal_buffers // mb}MB",
+        "min_wal_size": "1GB",
+        "max_wal_size": "4GB",
+        "checkpoint_completion_target": "0.9",
+        "random_page_cost": "1.1",
+        "effective_io_concurrency": "200",
+        "max_worker_processes": max(8, cpu_count),
+        "max_parallel_workers": cpu_count,
+        "max_parallel_workers_per_gather": parallel_per_gather,
+        "max_parallel_maintenance_workers": parallel_per_gather,
+    }
+
+
+def _create_dockerfile(list_of_packages: str):
+    """
+    Create the dockerfile for the custom image.
+
+    The build is split in two stages. The builder stage installs n8n from npm, the runtime
+    stage installs the extra apk packages in a single layer and copies n8n over, so changing
+    the package list doesn't reinstall n8n and upgrading n8n doesn't reinstall the packages.
+    The apk and npm downloads are kept in BuildKit cache mounts between builds, outside of
+    the image layers.
+
+    Args:
+        list_of_packages: Comma separated list of apk packages to install.
+
+    Returns:
+        str: The content of the dockerfile.
+    """
+    list_of_packages = [item.strip() for item in list_of_packages.split(',') if item.strip()]
+
+    if list_of_packages:
+        install_packages = f"""\
+RUN --mount=type=cache,target=/var/cache/apk,sharing=locked \\
+        apk add --update-cache --cache-dir /var/cache/apk {' '.join(list_of_packages)}
+"""
+    else:
+        install_packages = "# (no extra packages selected)\n"
+
+    dockerfile = f"""\
+# syntax=docker/dockerfile:1
+
+# Builder stage, installs n8n from npm. The npm cache is kept between builds
+FROM {N8N_BASE_IMAGE} AS builder
 
 ARG N8N_VERSION
 
 RUN if [ -z "$N8N_VERSION" ] ; then echo "The N8N_VERSION argument is missing!" ; exit 1; fi
 
-ENV N8N_VERSION=${N8N_VERSION}
+RUN --mount=type=cache,target=/root/.npm \\
+        set -eux; \\
+        npm install -g --omit=dev n8n@${{N8N_VERSION}} --ignore-scripts && \\
+        npm rebuild --prefix=/usr/local/lib/node_modules/n8n sqlite3 && \\
+        rm -rf /usr/local/lib/node_modules/n8n/node_modules/@n8n/chat && \\
+        rm -rf /usr/local/lib/node_modules/n8n/node_modules/n8n-design-system && \\
+        rm -rf /usr/local/lib/node_modules/n8n/node_modules/n8n-editor-ui/node_modules && \\
+        find /usr/local/lib/node_modules/n8n -type f -name "*.ts" -o -name "*.js.map" -o -name "*.vue" | xargs rm -f
+
+
+# Runtime stage, n8n's base image (which is based on Alpine) with the extra packages and n8n
+FROM {N8N_BASE_IMAGE}
+
+# INSTALL EXTRA PACKAGES HERE using Apline package installer (APK), all in one layer
+# The apk cache is kept between builds and is not part of the image
+#-------------------------------------------------------------------
+{install_packages}#-------------------------------------------------------------------
+
+ARG N8N_VERSION
+ENV N8N_VERSION=${{N8N_VERSION}}
 ENV NODE_ENV=production
 ENV N8N_RELEASE_TYPE=stable
-RUN set -eux; \
-        npm install -g --omit=dev n8n@${N8N_VERSION} --ignore-scripts && \
-        npm rebuild --prefix=/usr/local/lib/node_modules/n8n sqlite3 && \
-        rm -rf /usr/local/lib/node_modules/n8n/node_modules/@n8n/chat && \
-        rm -rf /usr/local/lib/node_modules/n8n/node_modules/n8n-design-system && \
-        rm -rf /usr/local/lib/node_modules/n8n/node_modules/n8n-editor-ui/node_modules && \
-        find /usr/local/lib/node_modules/n8n -type f -name "*.ts" -o -name "*.js.map" -o -name "*.vue" | xargs rm -f && \
-        rm -rf /root/.npm
 
+COPY --from=builder /usr/local/lib/node_modules/n8n /usr/local/lib/node_modules/n8n
 COPY docker-entrypoint.sh /
 
-RUN \
-        mkdir .n8n && \
+RUN \\
+        ln -s ../lib/node_modules/n8n/bin/n8n /usr/local/bin/n8n && \\
+        mkdir .n8n && \\
         chown node:node .n8n
 ENV SHELL /bin/sh
 USER node
 ENTRYPOINT ["tini", "--", "/docker-entrypoint.sh"]
 """
-    return start_of_dockerfile + middle_of_dockerfile + end_of_dockerfile
+    return dockerfile
 
 
 def _create_docker_entrypoint():
@@ -382,9 +918,3 @@ else
 fi
 """
     return docker_entrypoint
-
-
-def _replace_env_vars(text):
-    pattern = r'(\w+)="([^"]*)"'
-    replacement = r'\1=${\1}'
-    return re.sub(pattern, replacement, text)
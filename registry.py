@@ -0,0 +1,199 @@
+"""
+Pull-through registry mirror for installs on many hosts.
+
+One node runs a `registry:2` container in proxy mode. It downloads every image from Docker
+Hub once and serves it to the other nodes from the LAN. The other installs point their docker
+daemon at it with `registry-mirrors` in /etc/docker/daemon.json. The mirror only caches
+Docker Hub, so when a mirror is used n8n is pulled as `n8nio/n8n` from Docker Hub instead
+of from docker.n8n.io.
+
+Hit and miss counts are read from the registry's debug server (expvar), which is published
+on port 5001.
+
+Usage:
+    python3 registry.py start [--port 5000]      # on the node that hosts the mirror
+    python3 registry.py stats http://10.0.0.5:5000
+
+    python3 main.py --registry-mirror http://10.0.0.5:5000   # on every other node
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+from urllib.parse import urlparse
+from utils import run_command
+
+
+REGISTRY_IMAGE = "registry:2"
+REGISTRY_CONTAINER_NAME = "n8n-registry-mirror"
+REGISTRY_VOLUME = "n8n_registry_mirror"
+REGISTRY_PORT = 5000
+REGISTRY_DEBUG_PORT = 5001
+DOCKER_HUB_URL = "https://registry-1.docker.io"
+DOCKER_DAEMON_CONFIG_PATH = "/etc/docker/daemon.json"
+
+
+def start_registry_mirror(port = REGISTRY_PORT, debug_port = REGISTRY_DEBUG_PORT, remote_url = DOCKER_HUB_URL):
+    """
+    Start the pull-through registry mirror container on this host.
+
+    The container restarts with the docker daemon and keeps the cached images in a named volume,
+    so starting it again (or after a reboot) keeps the cache.
+
+    Args:
+        port: Port the mirror is published on.
+        debug_port: Port the debug server with the hit and miss counts is published on.
+        remote_url: The registry that is mirrored.
+    """
+    running = subprocess.call(
+        f"docker inspect --format '{{{{.State.Running}}}}' {REGISTRY_CONTAINER_NAME} | grep -q true",
+        shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    ) == 0
+    if running:
+        print(f"Registry mirror is already running on port {port}.")
+        return
+
+    print("\nStarting registry mirror...")
+    subprocess.call(f"docker rm -f {REGISTRY_CONTAINER_NAME}", shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    run_command(
+        f"docker run -d --name {REGISTRY_CONTAINER_NAME} --restart always "
+        f"-p {port}:5000 -p {debug_port}:5001 "
+        f"-v {REGISTRY_VOLUME}:/var/lib/registry "
+        f"-e REGISTRY_PROXY_REMOTEURL={remote_url} "
+        f"-e REGISTRY_HTTP_DEBUG_ADDR=:5001 "
+        f"{REGISTRY_IMAGE}"
+    )
+    print(f"Registry mirror started. Point other installs at it with --registry-mirror http://<this host's LAN IP>:{port}")
+
+
+def use_registry_mirror(mirror_url: str):
+    """
+    Point this host's docker daemon at a registry mirror.
+
+    Adds the mirror to `registry-mirrors` in /etc/docker/daemon.json, keeping the rest of the
+    file, and restarts docker if anything changed. A mirror served over plain http is also
+    added to `insecure-registries`. On macOS the settings have to be changed in Docker Desktop,
+    so the required config is printed instead.
+
+    Args:
+        mirror_url: URL of the mirror, like http://10.0.0.5:5000.
+    """
+    daemon_config = _read_daemon_config()
+    changed = _add_mirror_to_config(daemon_config, mirror_url)
+
+    if not changed:
+        print(f"Docker is already using the registry mirror {mirror_url}.")
+        return
+
+    if platform.system() != "Linux":
+        print("\nAdd the following to Docker Desktop > Settings > Docker Engine to use the registry mirror:")
+        print(json.dumps(daemon_config, indent=2))
+        return
+
+    print(f"\nPointing docker at the registry mirror {mirror_url}...")
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump(daemon_config, f, indent=2)
+        temp_path = f.name
+    run_command(f"sudo mkdir -p {os.path.dirname(DOCKER_DAEMON_CONFIG_PATH)} && sudo cp {temp_path} {DOCKER_DAEMON_CONFIG_PATH}")
+    os.remove(temp_path)
+    run_command("sudo systemctl restart docker")
+    print("Docker restarted with the registry mirror.")
+
+
+def get_mirror_stats(mirror_url: str, debug_port = REGISTRY_DEBUG_PORT) -> dict | None:
+    """
+    Get the cache hit and miss counts of a registry mirror.
+
+    Args:
+        mirror_url: URL of the mirror, like http://10.0.0.5:5000.
+        debug_port: Port the mirror's debug server is published on.
+
+    Returns:
+        dict | None: For "blobs" and "manifests", the number of requests, hits and misses and the
+            bytes pulled from the remote registry and pushed to clients. None if the debug server
+            could not be reached.
+    """
+    import requests
+    host = urlparse(mirror_url).hostname
+    try:
+        response = requests.get(f"http://{host}:{debug_port}/debug/vars", timeout=5)
+        response.raise_for_status()
+        proxy_stats = response.json().get("registry", {}).get("proxy", {})
+    except (requests.RequestException, ValueError):
+        return None
+
+    return {kind: proxy_stats.get(kind, {}) for kind in ["blobs", "manifests"]}
+
+
+def print_mirror_stats(mirror_url: str):
+    stats = get_mirror_stats(mirror_url)
+    if stats is None:
+        print(f"Could not read the statistics of the registry mirror {mirror_url} (is port {REGISTRY_DEBUG_PORT} reachable?)")
+        return
+
+    print(f"\nRegistry mirror {mirror_url}:")
+    for kind, counts in stats.items():
+        requests_count = counts.get("Requests", 0)
+        hits = counts.get("Hits", 0)
+        hit_rate = f"{hits / requests_count:.0%}" if requests_count else "n/a"
+        print(
+            f"  {kind:<10} {requests_count:>6} requests  {hits:>6} hits  {counts.get('Misses', 0):>6} misses  "
+            f"({hit_rate} hit rate, {counts.get('BytesPulled', 0) / 1024 ** 2:.0f}MB pulled from the remote, "
+            f"{counts.get('BytesPushed', 0) / 1024 ** 2:.0f}MB served)"
+        )
+
+
+def _read_daemon_config() -> dict:
+    try:
+        with open(DOCKER_DAEMON_CONFIG_PATH) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError):
+        # Readable only by root, or not valid json
+        output = subprocess.run(f"sudo cat {DOCKER_DAEMON_CONFIG_PATH}", shell=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True).stdout
+        try:
+            return json.loads(output) if output.strip() else {}
+        except ValueError:
+            print(f"Error: {DOCKER_DAEMON_CONFIG_PATH} is not valid json, fix it or remove it and run the script again.")
+            exit(1)
+
+
+def _add_mirror_to_config(daemon_config: dict, mirror_url: str) -> bool:
+    changed = False
+    mirror_url = mirror_url.rstrip("/")
+
+    mirrors = daemon_config.setdefault("registry-mirrors", [])
+    if mirror_url not in mirrors:
+        mirrors.insert(0, mirror_url)
+        changed = True
+
+    parsed_url = urlparse(mirror_url)
+    if parsed_url.scheme == "http":
+        insecure_registries = daemon_config.setdefault("insecure-registries", [])
+        if parsed_url.netloc not in insecure_registries:
+            insecure_registries.append(parsed_url.netloc)
+            changed = True
+
+    return changed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run or inspect a pull-through registry mirror for n8n installs.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    start_parser = subparsers.add_parser("start", help="start the registry mirror on this host")
+    start_parser.add_argument("--port", type=int, default=REGISTRY_PORT)
+    start_parser.add_argument("--debug-port", type=int, default=REGISTRY_DEBUG_PORT)
+
+    stats_parser = subparsers.add_parser("stats", help="show the hit and miss counts of a registry mirror")
+    stats_parser.add_argument("mirror_url", help="URL of the mirror, like http://10.0.0.5:5000")
+
+    args = parser.parse_args()
+
+    if args.command == "start":
+        start_registry_mirror(args.port, args.debug_port)
+    else:
+        print_mirror_stats(args.mirror_url)
@@ -0,0 +1,246 @@
+"""
+Run queue mode workers on other hosts over SSH.
+
+Once the main host runs out of cores, more workers can run on other machines. They share
+the database, redis, the encryption key and (with a local MinIO) the binary data store of
+the main host, which publishes those ports on the address given to the installer.
+
+For every host in the hosts file, in parallel:
+1. probe its CPUs and memory over SSH, to size the workers like the installer does
+2. copy a worker-only docker-compose.yaml and a .env pointing at the main host
+3. pull the image and start the workers with `docker compose up -d`
+4. wait until every worker reports healthy
+
+Running it again updates the files and restarts only the workers whose config changed.
+
+Usage:
+    python3 remote.py hosts.txt --main-address 10.0.0.5 [--max-workers 8]
+
+The hosts file has one SSH target per line, optionally followed by the number of workers
+to run on it (defaults to one per CPU core):
+
+    ubuntu@10.0.0.21
+    ubuntu@10.0.0.22 4
+    # lines starting with # are ignored
+
+SSH must work without a password prompt (keys or an agent), and the user must be able to
+run docker on the host.
+"""
+import argparse
+import os
+import shlex
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config import read_env_file, render_config
+from docker import compose_status, container_states
+from host import size_services
+from n8n import create_worker_compose_file
+from utils import stream_command, wait_until, Command_Error
+
+
+PROJECT_DIR = "n8n"
+ENV_FILE_PATH = f"{PROJECT_DIR}/.env"
+REMOTE_DIR = "n8n-worker"
+SSH_OPTIONS = "-o BatchMode=yes -o ConnectTimeout=10 -o ServerAliveInterval=15"
+HEALTH_TIMEOUT = 300
+
+
+class Remote_Error(Exception):
+    """
+    Raised when a worker host could not be set up.
+
+    Attributes:
+        host (str): The SSH target.
+        tail (List[str]): The last lines of output of the failed command, if any.
+    """
+    def __init__(self, host: str, message: str, tail = None):
+        super().__init__(f"{host}: {message}")
+        self.host = host
+        self.tail = tail or []
+
+
+def read_hosts(path):
+    """
+    Read the hosts file.
+
+    Args:
+        path: Path to the hosts file.
+
+    Returns:
+        List[tuple]: (SSH target, number of workers or None) for every host in the file.
+    """
+    hosts = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            parts = line.split()
+            hosts.append((parts[0], int(parts[1]) if len(parts) > 1 else None))
+    return hosts
+
+
+def worker_env_vars(env_vars, main_address):
+    """
+    Get the environment of remote workers: the main host's, with the services it runs replaced by its address.
+
+    Args:
+        env_vars: The values of the main host's .env file.
+        main_address: Address of the main host that the worker hosts can reach.
+
+    Returns:
+        dict: The environment variables of the workers.
+    """
+    worker_env = dict(env_vars)
+    if worker_env.get("DB_POSTGRESDB_HOST") == "postgres":
+        worker_env["DB_POSTGRESDB_HOST"] = main_address
+    if worker_env.get("QUEUE_BULL_REDIS_HOST") == "redis":
+        worker_env["QUEUE_BULL_REDIS_HOST"] = main_address
+    if worker_env.get("N8N_EXTERNAL_STORAGE_S3_HOST") == "minio:9000":
+        worker_env["N8N_EXTERNAL_STORAGE_S3_HOST"] = f"{main_address}:9000"
+    # The workers' health is checked before they are counted as up
+    worker_env["QUEUE_HEALTH_CHECK_ACTIVE"] = "true"
+    return worker_env
+
+
+def check_main_stack(env_vars):
+    """
+    Check that the main stack can have workers on other hosts.
+
+    Returns:
+        str | None: What is wrong, None if workers can be added.
+    """
+    if env_vars.get("EXECUTIONS_MODE") != "queue":
+        return "the main stack is not in queue mode, run the installer again and turn on queue mode."
+    if env_vars.get("N8N_DEFAULT_BINARY_DATA_MODE") == "filesystem":
+        return "binary data is stored on the main host's filesystem, which workers on other hosts can't read. Use s3 (like the local MinIO) instead."
+    with open(f"{PROJECT_DIR}/docker-compose.yaml") as f:
+        compose_file = f.read()
+    if ":6379:6379" not in compose_file:
+        return "redis and postgres are not published, run the installer again and give the address workers on other hosts reach this host at."
+    return None
+
+
+def deploy_workers(hosts, env_vars, main_address, max_workers = 8):
+    """
+    Set up the workers on every host in parallel.
+
+    Args:
+        hosts: (SSH target, number of workers or None) pairs, see `read_hosts()`.
+        env_vars: The values of the main host's .env file.
+        main_address: Address of the main host that the worker hosts can reach.
+        max_workers: Maximum number of hosts set up at the same time.
+
+    Returns:
+        dict: The number of healthy workers for every host that succeeded, and the
+            `Remote_Error` for every host that failed.
+    """
+    worker_env = worker_env_vars(env_vars, main_address)
+    files = render_config(worker_env)
+    results = {}
+    start = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_deploy_host, host, worker_count, worker_env, files): host for host, worker_count in hosts}
+        for future in as_completed(futures):
+            host = futures[future]
+            try:
+                results[host] = future.result()
+            except Remote_Error as e:
+                results[host] = e
+                print(f"FAILED   {e}")
+                if e.tail:
+                    print("\n".join(f"  | {line}" for line in e.tail[-20:]))
+                continue
+            print(f"HEALTHY  {host} ({results[host]} workers)")
+
+    failed = sum(isinstance(result, Remote_Error) for result in results.values())
+    print(f"\n{len(results) - failed}/{len(results)} hosts running workers after {time.monotonic() - start:.1f}s")
+    return results
+
+
+def _deploy_host(host, worker_count, worker_env, files):
+    cpu_count, memory_bytes = _probe_host(host)
+    worker_count = worker_count or cpu_count
+    limits = size_services({"n8n-worker": worker_count}, cpu_count, memory_bytes)["n8n-worker"]
+    compose_file = create_worker_compose_file(files["compose"], worker_env, worker_count, limits)
+    print(f"{host}: {cpu_count} CPUs, {memory_bytes // 1024 ** 2}MB memory, starting {worker_count} workers...")
+
+    with tempfile.TemporaryDirectory() as folder:
+        for name, content in [(".env", files["env"]), ("docker-compose.yaml", compose_file)]:
+            with open(os.path.join(folder, name), "w") as f:
+                f.write(content)
+        _ssh(host, f"mkdir -p {REMOTE_DIR} && chmod 700 {REMOTE_DIR}")
+        _run(host, f"scp -q {SSH_OPTIONS} {folder}/.env {folder}/docker-compose.yaml {shlex.quote(host)}:{REMOTE_DIR}/")
+
+    # Workers removed from the hosts file are stopped too
+    _ssh(host, f"cd {REMOTE_DIR} && docker compose pull -q && docker compose up -d --remove-orphans", timeout=600)
+    _wait_for_workers(host)
+    return worker_count
+
+
+def _probe_host(host):
+    output = _ssh(host, "nproc && awk '/^MemTotal:/ {print $2 * 1024}' /proc/meminfo && docker compose version --short")
+    try:
+        cpu_count, memory_bytes = (int(float(value)) for value in output.split()[:2])
+    except ValueError:
+        raise Remote_Error(host, f"could not read the CPUs and memory of the host: {output}")
+    return cpu_count, memory_bytes
+
+
+def _wait_for_workers(host):
+    restarts_at_start = None
+
+    def check():
+        nonlocal restarts_at_start
+        output = _ssh(host, f"cd {REMOTE_DIR} && docker inspect $(docker compose ps -q -a)")
+        containers = container_states(output)
+        if restarts_at_start is None:
+            restarts_at_start = {container["id"]: container["restarts"] for container in containers}
+        state, containers = compose_status(containers, restarts_at_start=restarts_at_start)
+        return (state, containers) if state != "waiting" else None
+
+    result = wait_until(check, HEALTH_TIMEOUT, initial_delay=1)
+    if result is None:
+        raise Remote_Error(host, f"the workers were not healthy within {HEALTH_TIMEOUT}s")
+    state, failed = result
+    if state == "failed":
+        service = failed[0]["service"]
+        logs = _ssh(host, f"cd {REMOTE_DIR} && docker compose logs --no-color --tail 30 {service}")
+        raise Remote_Error(host, f"{service} is not starting ({failed[0]['status']}, {failed[0]['health'] or 'no healthcheck'})", logs.splitlines())
+
+
+def _ssh(host, command, timeout = 120):
+    return _run(host, f"ssh {SSH_OPTIONS} {shlex.quote(host)} {shlex.quote(command)}", timeout)
+
+
+def _run(host, command, timeout = 120):
+    try:
+        return "\n".join(stream_command(command, timeout))
+    except Command_Error as e:
+        raise Remote_Error(host, str(e), e.tail) from e
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run n8n queue mode workers on other hosts over SSH.")
+    parser.add_argument("hosts_file", help="file with one SSH target (and optional number of workers) per line")
+    parser.add_argument("--main-address", required=True, help="address the worker hosts reach this host at, like 10.0.0.5")
+    parser.add_argument("--max-workers", type=int, default=8, help="hosts set up at the same time")
+    args = parser.parse_args()
+
+    if not os.path.exists(ENV_FILE_PATH):
+        print(f"Error: {ENV_FILE_PATH} not found, run the installer first (or run this from the folder it was run in).")
+        exit(1)
+
+    env_vars = read_env_file(ENV_FILE_PATH)
+    problem = check_main_stack(env_vars)
+    if problem:
+        print(f"Error: {problem}")
+        exit(1)
+    if os.path.exists(f"{PROJECT_DIR}/dockerfile"):
+        print("Warning: the main host uses a custom image, the workers on other hosts use the stock n8n image.")
+
+    results = deploy_workers(read_hosts(args.hosts_file), env_vars, args.main_address, args.max_workers)
+    if any(isinstance(result, Remote_Error) for result in results.values()):
+        exit(1)
@@ -0,0 +1,259 @@
+"""
+Execution data retention calculator and database growth simulator.
+
+n8n keeps every saved execution until pruning removes it, in two steps:
+- soft delete, every EXECUTIONS_DATA_PRUNE_SOFT_DELETE_INTERVAL minutes: executions older
+  than EXECUTIONS_DATA_MAX_AGE hours, or past the newest EXECUTIONS_DATA_PRUNE_MAX_COUNT,
+  are marked as deleted
+- hard delete, every EXECUTIONS_DATA_PRUNE_HARD_DELETE_INTERVAL minutes: executions marked
+  more than EXECUTIONS_DATA_HARD_DELETE_BUFFER hours ago are removed with their data
+
+The simulator replays that schedule minute by minute for an expected load, which gives the
+size of the execution tables over time and how many rows every hard delete run removes.
+Neither SQLite nor postgres give the space of deleted rows back to the disk (they reuse it),
+so the peak size is what the database file grows to.
+
+Usage:
+    python3 retention.py --executions-per-day 20000 --payload-kb 30 --target-gb 5 [--days 30]
+"""
+import argparse
+import math
+from collections import deque
+from typing import List
+
+
+# Stored for every execution next to its run data: the execution_entity row, the indexes and
+# the snapshot of the workflow in execution_data
+ROW_OVERHEAD_BYTES = 2048
+# Hard delete runs removing more rows than this hold the database for too long (the editor
+# and running executions wait on it), the interval is shortened to stay under it
+MAX_ROWS_PER_HARD_DELETE = 5000
+# The share of executions that fail, if not given
+DEFAULT_ERROR_RATE = 0.05
+
+
+class Retention_Settings:
+    """
+    The pruning settings of n8n.
+
+    Attributes:
+        max_age_hours (int): EXECUTIONS_DATA_MAX_AGE.
+        max_count (int): EXECUTIONS_DATA_PRUNE_MAX_COUNT, 0 for no limit.
+        hard_delete_buffer_hours (int): EXECUTIONS_DATA_HARD_DELETE_BUFFER.
+        hard_delete_interval_minutes (int): EXECUTIONS_DATA_PRUNE_HARD_DELETE_INTERVAL.
+        soft_delete_interval_minutes (int): EXECUTIONS_DATA_PRUNE_SOFT_DELETE_INTERVAL.
+    """
+    def __init__(self, max_age_hours: int = 336, max_count: int = 10000, hard_delete_buffer_hours: int = 1, hard_delete_interval_minutes: int = 15, soft_delete_interval_minutes: int = 60):
+        self.max_age_hours: int = max_age_hours
+        self.max_count: int = max_count
+        self.hard_delete_buffer_hours: int = hard_delete_buffer_hours
+        self.hard_delete_interval_minutes: int = hard_delete_interval_minutes
+        self.soft_delete_interval_minutes: int = soft_delete_interval_minutes
+
+    def env_vars(self) -> dict:
+        return {
+            "EXECUTIONS_DATA_MAX_AGE": str(self.max_age_hours),
+            "EXECUTIONS_DATA_PRUNE_MAX_COUNT": str(self.max_count),
+            "EXECUTIONS_DATA_HARD_DELETE_BUFFER": str(self.hard_delete_buffer_hours),
+            "EXECUTIONS_DATA_PRUNE_HARD_DELETE_INTERVAL": str(self.hard_delete_interval_minutes),
+            "EXECUTIONS_DATA_PRUNE_SOFT_DELETE_INTERVAL": str(self.soft_delete_interval_minutes),
+        }
+
+
+class Simulation_Result:
+    """
+    The database growth of a simulated load.
+
+    Attributes:
+        peak_rows (int): Most executions in the database at once, including soft deleted ones.
+        peak_bytes (int): Size of the execution tables at the peak.
+        daily_bytes (List[int]): Size of the execution tables at the end of every day.
+        max_rows_per_hard_delete (int): Most rows removed by a single hard delete run.
+        hard_deletes_per_day (int): Number of hard delete runs per day.
+    """
+    def __init__(self, peak_rows: int, peak_bytes: int, daily_bytes: List[int], max_rows_per_hard_delete: int, hard_deletes_per_day: int):
+        self.peak_rows: int = peak_rows
+        self.peak_bytes: int = peak_bytes
+        self.daily_bytes: List[int] = daily_bytes
+        self.max_rows_per_hard_delete: int = max_rows_per_hard_delete
+        self.hard_deletes_per_day: int = hard_deletes_per_day
+
+
+def saved_per_day(executions_per_day: float, save_on_success: bool = True, save_on_error: bool = True, error_rate: float = DEFAULT_ERROR_RATE) -> float:
+    """
+    Number of executions per day that end up in the database.
+
+    Args:
+        executions_per_day: Production executions per day.
+        save_on_success: EXECUTIONS_DATA_SAVE_ON_SUCCESS is "all".
+        save_on_error: EXECUTIONS_DATA_SAVE_ON_ERROR is "all".
+        error_rate: Share of the executions that fail.
+
+    Returns:
+        float: Saved executions per day.
+    """
+    return executions_per_day * ((1 - error_rate) * save_on_success + error_rate * save_on_error)
+
+
+def simulate(settings: Retention_Settings, executions_per_day: float, payload_kb: float, days: int = 30) -> Simulation_Result:
+    """
+    Replay the pruning schedule of n8n minute by minute for a steady load.
+
+    Args:
+        settings: The pruning settings.
+        executions_per_day: Saved executions per day, see `saved_per_day()`.
+        payload_kb: Average size of the data of an execution in KB.
+        days: Number of days to simulate.
+
+    Returns:
+        Simulation_Result: The size of the execution tables over time and the prune load.
+    """
+    rows_per_minute = executions_per_day / 1440
+    bytes_per_row = payload_kb * 1024 + ROW_OVERHEAD_BYTES
+
+    # [minute, rows] buckets, oldest first
+    live = deque()
+    soft_deleted = deque()
+    live_rows = 0.0
+    soft_deleted_rows = 0.0
+
+    peak_rows = 0.0
+    daily_bytes = []
+    max_rows_per_hard_delete = 0.0
+
+    for minute in range(1, days * 1440 + 1):
+        live.append([minute, rows_per_minute])
+        live_rows += rows_per_minute
+
+        if minute % settings.soft_delete_interval_minutes == 0:
+            age_cutoff = minute - settings.max_age_hours * 60
+            while live and live[0][0] <= age_cutoff:
+                _, rows = live.popleft()
+                live_rows -= rows
+                soft_deleted.append([minute, rows])
+                soft_deleted_rows += rows
+            while settings.max_count and live_rows > settings.max_count:
+                # The oldest bucket may only be partly over the limit
+                rows = min(live[0][1], live_rows - settings.max_count)
+                live[0][1] -= rows
+                if live[0][1] <= 0:
+                    live.popleft()
+                live_rows -= rows
+                soft_deleted.append([minute, rows])
+                soft_deleted_rows += rows
+
+        if minute % settings.hard_delete_interval_minutes == 0:
+            buffer_cutoff = minute - settings.hard_delete_buffer_hours * 60
+            removed = 0.0
+            while soft_deleted and soft_deleted[0][0] <= buffer_cutoff:
+                removed += soft_deleted.popleft()[1]
+            soft_deleted_rows -= removed
+            max_rows_per_hard_delete = max(max_rows_per_hard_delete, removed)
+
+        peak_rows = max(peak_rows, live_rows + soft_deleted_rows)
+        if minute % 1440 == 0:
+            daily_bytes.append(round((live_rows + soft_deleted_rows) * bytes_per_row))
+
+    return Simulation_Result(
+        peak_rows=round(peak_rows),
+        peak_bytes=round(peak_rows * bytes_per_row),
+        daily_bytes=daily_bytes,
+        max_rows_per_hard_delete=round(max_rows_per_hard_delete),
+        hard_deletes_per_day=1440 // settings.hard_delete_interval_minutes,
+    )
+
+
+def recommend_retention(executions_per_day: float, payload_kb: float, target_bytes: int, max_age_hours: int = 336, days: int = 30) -> Retention_Settings | None:
+    """
+    Find pruning settings that keep the execution tables under a target size.
+
+    Executions are kept for `max_age_hours` if they fit, otherwise for as long as they fit.
+    The soft and hard delete intervals are shortened for busy instances, so every hard delete
+    run removes a bounded number of rows instead of one large batch. Soft delete marks all the
+    executions of its interval at once and they pass the buffer together, so shortening the hard
+    delete interval alone would not split them up.
+
+    Args:
+        executions_per_day: Saved executions per day, see `saved_per_day()`.
+        payload_kb: Average size of the data of an execution in KB.
+        target_bytes: Size the execution tables should stay under.
+        max_age_hours: The longest executions should be kept.
+        days: Number of days to simulate to check the settings.
+
+    Returns:
+        Retention_Settings | None: The settings, None if even the executions waiting to be
+            hard deleted don't fit (save fewer executions, or allow a bigger database).
+    """
+    settings = Retention_Settings(max_age_hours=max_age_hours)
+    if executions_per_day <= 0:
+        return settings
+
+    rows_per_minute = executions_per_day / 1440
+    interval = max(1, int(MAX_ROWS_PER_HARD_DELETE / rows_per_minute))
+    settings.hard_delete_interval_minutes = min(settings.hard_delete_interval_minutes, interval)
+    settings.soft_delete_interval_minutes = min(settings.soft_delete_interval_minutes, interval)
+
+    # Pruned executions stay in the database until the next soft delete run marks them, the
+    # buffer has passed and the next hard delete run removes them
+    waiting_minutes = settings.soft_delete_interval_minutes + settings.hard_delete_buffer_hours * 60 + settings.hard_delete_interval_minutes
+    capacity_rows = target_bytes / (payload_kb * 1024 + ROW_OVERHEAD_BYTES)
+    max_count = _round_down(capacity_rows - rows_per_minute * waiting_minutes)
+    if max_count < 1:
+        return None
+
+    while max_count >= 1:
+        settings.max_count = max_count
+        settings.max_age_hours = max(1, min(max_age_hours, int(max_count / (rows_per_minute * 60))))
+        result = simulate(settings, executions_per_day, payload_kb, days)
+        if result.peak_bytes <= target_bytes:
+            # Runs can still be over the limit where the intervals don't line up, shorter ones only
+            # lower the peak. Above MAX_ROWS_PER_HARD_DELETE executions a minute they can't get under it
+            while result.max_rows_per_hard_delete > MAX_ROWS_PER_HARD_DELETE and max(settings.soft_delete_interval_minutes, settings.hard_delete_interval_minutes) > 1:
+                settings.soft_delete_interval_minutes = max(1, settings.soft_delete_interval_minutes - 1)
+                settings.hard_delete_interval_minutes = max(1, settings.hard_delete_interval_minutes - 1)
+                result = simulate(settings, executions_per_day, payload_kb, days)
+            return settings
+        max_count = _round_down(max_count * 0.9)
+    return None
+
+
+def print_simulation(settings: Retention_Settings, result: Simulation_Result, target_bytes: int | None = None):
+    mb = 1024 ** 2
+    print("\nSimulated execution data:")
+    for day, size in enumerate(result.daily_bytes, start=1):
+        if day <= 7 or day % 7 == 0 or day == len(result.daily_bytes):
+            print(f"  day {day:>3}: {size / mb:>9.0f}MB")
+    target = f" (target {target_bytes / mb:.0f}MB)" if target_bytes else ""
+    print(f"  peak {result.peak_bytes / mb:.0f}MB{target}, {result.peak_rows} executions")
+    print(f"  {result.hard_deletes_per_day} hard delete runs per day, up to {result.max_rows_per_hard_delete} executions each")
+    print("Settings:")
+    for key, value in settings.env_vars().items():
+        print(f"  {key}={value}")
+
+
+def _round_down(value: float) -> int:
+    # To 2 significant digits, like 23817 -> 23000
+    if value < 1:
+        return 0
+    magnitude = 10 ** max(0, int(math.log10(value)) - 1)
+    return int(value // magnitude * magnitude)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recommend n8n execution data retention settings and simulate the database growth.")
+    parser.add_argument("--executions-per-day", type=float, required=True, help="production executions per day")
+    parser.add_argument("--payload-kb", type=float, required=True, help="average size of the data of an execution in KB")
+    parser.add_argument("--target-gb", type=float, required=True, help="size the execution data should stay under")
+    parser.add_argument("--max-age-hours", type=int, default=336, help="the longest executions should be kept")
+    parser.add_argument("--error-rate", type=float, default=DEFAULT_ERROR_RATE, help="share of the executions that fail")
+    parser.add_argument("--no-save-on-success", action="store_true", help="successful executions are not saved")
+    parser.add_argument("--days", type=int, default=30)
+    args = parser.parse_args()
+
+    target_bytes = int(args.target_gb * 1024 ** 3)
+    per_day = saved_per_day(args.executions_per_day, not args.no_save_on_success, True, args.error_rate)
+    settings = recommend_retention(per_day, args.payload_kb, target_bytes, args.max_age_hours, args.days)
+    if settings is None:
+        print("The executions waiting to be deleted alone don't fit in the target size. Don't save successful executions, or allow a bigger database.")
+        exit(1)
+    print_simulation(settings, simulate(settings, per_day, args.payload_kb, args.days), target_bytes)
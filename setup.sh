@@ -7,4 +7,4 @@ source n8n-auto-install/env/bin/activate
 n8n-auto-install/env/bin/pip install -r n8n-auto-install/requirements.txt -q
 
 # Run the Python script
-python3 n8n-auto-install/main.py
+python3 n8n-auto-install/main.py "$@"
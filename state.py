@@ -0,0 +1,295 @@
+"""
+State of an installation, so running the installer again only applies what changed.
+
+n8n/.install-state.json keeps the sha256 of every file the installer generated and the IDs of
+the remote resources it set up (the Cloudflare tunnel and DNS record). When the installer runs
+again in the same folder:
+- files with the same content are left alone, only changed ones are written
+- files that are no longer generated (like nginx.conf once the webhook processors are turned
+  off) are removed
+- only the services that use a changed file are restarted, see `affected_services()`
+- the Cloudflare tunnel and DNS record are updated instead of created again
+
+`docker compose up -d` already only recreates the services whose compose config (including the
+values it reads from .env) changed. The files mounted into containers (nginx.conf, the
+monitoring config) and the files baked into the custom image are not part of that config, so
+the state is what tells which of those services need a restart or a rebuild.
+"""
+import hashlib
+import json
+import os
+import threading
+from typing import List
+
+
+STATE_FILE_PATH = "n8n/.install-state.json"
+
+# Generated values the running stack already depends on. postgres, MinIO and grafana only read
+# them when their volume is first set up, and credentials saved in n8n are encrypted with the
+# key, so a new value would lock the stack out of its own data.
+KEPT_SECRETS = [
+    "N8N_ENCRYPTION_KEY",
+    "DB_POSTGRESDB_PASSWORD",
+    "N8N_EXTERNAL_STORAGE_S3_ACCESS_SECRET",
+    "QUEUE_BULL_REDIS_PASSWORD",
+    "GRAFANA_ADMIN_PASSWORD",
+]
+
+# Settings that decide where the data of the existing installation is. They are kept while it
+# uses the same database, a new value would start n8n on an empty database next to the old one
+KEPT_DATA_SETTINGS = [
+    "DB_SQLITE_DATABASE",
+    "DB_TABLE_PREFIX",
+    "DB_POSTGRESDB_DATABASE",
+    "DB_POSTGRESDB_USER",
+    "DB_POSTGRESDB_SCHEMA",
+]
+# Folders of the n8n containers that hold data, with the volume mounted there when no host folder
+# was given (see `n8n.SQLITE_PATH` and `n8n.BINARY_DATA_PATH`), keyed by their `utils.stack_options` key
+DATA_MOUNTS = {
+    "sqlite_host_path": ("/home/node/sqlite", "n8n_sqlite"),
+    "binary_data_host_path": ("/home/node/binaryData", "n8n_binary_data"),
+}
+
+# Services that read a generated file that is mounted into their container
+MOUNTED_FILES = {
+    "n8n/nginx.conf": ["load-balancer"],
+    "n8n/monitoring/prometheus.yml": ["prometheus"],
+    "n8n/monitoring/grafana/datasources.yaml": ["grafana"],
+    "n8n/monitoring/grafana/dashboards.yaml": ["grafana"],
+    "n8n/monitoring/grafana/n8n-dashboard.json": ["grafana"],
+}
+# Files copied into the custom image
+IMAGE_FILES = ["n8n/dockerfile", "n8n/docker-entrypoint.sh"]
+
+
+class Install_State:
+    """
+    The generated files and remote resources of an installation.
+
+    Files are written from the provisioning tasks, which run in parallel, so every method can
+    be called from any thread.
+
+    Attributes:
+        path (str): Path of the state file.
+        artifacts (dict): sha256 of every generated file, keyed by path.
+        resources (dict): IDs of remote resources, like {"cloudflare": {"tunnel_id": ..., "dns_record_id": ...}}.
+        existed (bool): Whether an earlier run had set up the installation.
+        changed (set): Files written in this run.
+    """
+    def __init__(self, path: str = STATE_FILE_PATH, artifacts: dict | None = None, resources: dict | None = None):
+        self.path: str = path
+        self.artifacts: dict = artifacts or {}
+        self.resources: dict = resources or {}
+        self.existed: bool = bool(self.artifacts)
+        self.changed: set = set()
+        self._generated: set = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str = STATE_FILE_PATH) -> "Install_State":
+        """
+        Load the state of an earlier run.
+
+        Returns:
+            Install_State: The saved state, an empty one if there was no earlier run.
+        """
+        if not os.path.exists(path):
+            return cls(path)
+        with open(path) as f:
+            saved = json.load(f)
+        return cls(path, saved.get("artifacts"), saved.get("resources"))
+
+    def write_file(self, path: str, content: str, mode: int | None = None) -> bool:
+        """
+        Write a generated file, unless it already has this content.
+
+        A file changed by hand since the last run is kept next to it as `<path>.bak`.
+
+        Args:
+            path: Path of the file.
+            content: The content of the file.
+            mode: Permissions to give the file, like 0o755.
+
+        Returns:
+            bool: Whether the file was written.
+        """
+        digest = content_hash(content)
+        with self._lock:
+            self._generated.add(path)
+            recorded = self.artifacts.get(path)
+
+        current = _file_hash(path)
+        if current == digest:
+            with self._lock:
+                self.artifacts[path] = digest
+                # Written by a run that stopped before the stack was updated
+                if recorded != digest:
+                    self.changed.add(path)
+            return False
+
+        if current is not None and recorded is not None and current != recorded:
+            print(f"Warning: {path} was changed by hand, the changes are kept in {path}.bak")
+            os.replace(path, f"{path}.bak")
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as f:
+            f.write(content)
+        if mode is not None:
+            os.chmod(temp_path, mode)
+        elif os.path.exists(path):
+            os.chmod(temp_path, os.stat(path).st_mode)
+        os.replace(temp_path, path)
+
+        with self._lock:
+            self.artifacts[path] = digest
+            self.changed.add(path)
+        return True
+
+    def remove_stale_files(self) -> List[str]:
+        """
+        Remove the files an earlier run generated that this run did not.
+
+        The services that used them are gone from the compose file as well, so they don't count
+        as changed.
+
+        Returns:
+            List[str]: The removed files.
+        """
+        with self._lock:
+            stale = [path for path in self.artifacts if path not in self._generated]
+            for path in stale:
+                del self.artifacts[path]
+
+        for path in stale:
+            if os.path.exists(path):
+                os.remove(path)
+        return stale
+
+    def set_resource(self, name: str, value: dict):
+        with self._lock:
+            self.resources[name] = value
+
+    def save(self):
+        with self._lock:
+            saved = {"artifacts": dict(sorted(self.artifacts.items())), "resources": self.resources}
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(saved, f, indent=2)
+            f.write("\n")
+        os.replace(temp_path, self.path)
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def _file_hash(path: str) -> str | None:
+    try:
+        with open(path) as f:
+            return content_hash(f.read())
+    except FileNotFoundError:
+        return None
+
+
+def affected_services(changed) -> List[str]:
+    """
+    Get the services to restart because a file mounted into them changed.
+
+    Args:
+        changed: The files written in this run, see `Install_State.changed`.
+
+    Returns:
+        List[str]: The names of the compose services, in a stable order.
+    """
+    services = set()
+    for path in changed:
+        services.update(MOUNTED_FILES.get(path, []))
+    return sorted(services)
+
+
+def image_changed(changed) -> bool:
+    # Whether the custom image has to be built again
+    return any(path in changed for path in IMAGE_FILES)
+
+
+def same_database(env_vars, previous_env) -> bool:
+    """
+    Check if this run uses the database of the existing installation.
+
+    Args:
+        env_vars: The environment variables of this run.
+        previous_env: The values of the existing .env file.
+
+    Returns:
+        bool: Whether the database type (and for postgres, the host) is the same.
+    """
+    if (previous_env.get("DB_TYPE") or "sqlite") != env_vars.get("DB_TYPE"):
+        return False
+    return env_vars.get("DB_TYPE") != "postgresdb" or previous_env.get("DB_POSTGRESDB_HOST") == env_vars.get("DB_POSTGRESDB_HOST")
+
+
+def keep_existing_settings(env_vars, stack_options, previous_env, compose_path = "n8n/docker-compose.yaml"):
+    """
+    Keep the generated secrets and the data locations of the existing installation.
+
+    The database is never moved: its settings, and the volume or host folder of the SQLite
+    database and the binary data, stay what they were as long as the same database is used.
+
+    Args:
+        env_vars: The environment variables of this run, updated in place.
+        stack_options: Shape of the compose stack of this run, updated in place.
+        previous_env: The values of the existing .env file.
+        compose_path: The existing docker-compose.yaml, for the volumes the data is on.
+    """
+    if not previous_env:
+        return
+    is_same_database = same_database(env_vars, previous_env)
+
+    for key in KEPT_SECRETS:
+        previous = previous_env.get(key)
+        current = env_vars.get(key)
+        if key == "DB_POSTGRESDB_PASSWORD" and not is_same_database:
+            continue
+        # The others are only kept while the service that uses them is still in the stack
+        if not previous or current == previous or (current in (None, "") and key != "N8N_ENCRYPTION_KEY"):
+            continue
+        if current not in (None, ""):
+            print(f"Keeping {key} of the existing installation, the stack was set up with it.")
+        env_vars[key] = previous
+
+    if not is_same_database:
+        return
+
+    for key in KEPT_DATA_SETTINGS:
+        # Unset stays None, `config.render_config()` comments it out so n8n keeps using its default
+        previous = previous_env.get(key) or None
+        if (env_vars.get(key) or None) != previous:
+            print(f"Keeping {key}={previous or '(n8n default)'} of the existing installation, its data is there.")
+            env_vars[key] = previous
+
+    mounts = _mount_sources(compose_path)
+    for option, (target, volume) in DATA_MOUNTS.items():
+        source = mounts.get(target)
+        if source is None:
+            continue
+        host_path = None if source == volume else source
+        if stack_options.get(option) != host_path:
+            print(f"Keeping the data in {source} of the existing installation.")
+            stack_options[option] = host_path
+
+
+def _mount_sources(compose_path) -> dict:
+    # The volume or host folder mounted on every folder of the n8n containers, like {"/home/node/sqlite": "n8n_sqlite"}
+    if not os.path.exists(compose_path):
+        return {}
+    sources = {}
+    with open(compose_path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("- ") and line.count(":") == 1:
+                source, target = line[2:].split(":")
+                if target.startswith("/home/node/"):
+                    sources[target] = source
+    return sources
@@ -0,0 +1,147 @@
+"""
+Dependency graph runner for the provisioning steps.
+
+Each step of the install is a `Task` with a name, a function to run and the names of the tasks
+it depends on. `run_tasks()` runs every task on a thread pool as soon as all of its
+dependencies have finished, so independent steps (like the Cloudflare API calls and the
+docker compose build) run at the same time and the install only takes as long as the
+longest chain of dependent steps.
+
+Usage:
+    >>> results = run_tasks([
+    ...     Task("tunnel", lambda results: create_tunnel()),
+    ...     Task("zone", lambda results: find_zone()),
+    ...     Task("dns", lambda results: add_dns(results["tunnel"], results["zone"]), ["tunnel", "zone"]),
+    ... ])
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, List, Optional
+
+
+class Task:
+    """
+    A single provisioning step.
+
+    Attributes:
+        name (str): Unique name of the task, used by other tasks to depend on it.
+        action (Callable): Function to run. It is called with a dict of the results of
+            every task that already finished, keyed by task name.
+        depends_on (List[str]): Names of the tasks that have to finish before this one starts.
+        duration (float | None): How long the task took to run in seconds, once it has run.
+    """
+    def __init__(self, name: str, action: Callable[[Dict[str, Any]], Any], depends_on: Optional[List[str]] = None):
+        self.name: str = name
+        self.action: Callable[[Dict[str, Any]], Any] = action
+        self.depends_on: List[str] = depends_on or []
+        self.duration: float | None = None
+
+
+def run_tasks(tasks: List[Task], max_workers: int = 4) -> Dict[str, Any]:
+    """
+    Run tasks on a thread pool, respecting their dependencies.
+
+    A task starts the moment all of its dependencies have finished. If a task fails no new
+    tasks are started, the running ones are allowed to finish and the error is raised again.
+    A timing summary is printed once every task has run.
+
+    Args:
+        tasks: The tasks to run.
+        max_workers: Maximum number of tasks running at the same time.
+
+    Returns:
+        dict: The return value of every task, keyed by task name.
+
+    Raises:
+        ValueError: If a dependency does not exist or the dependencies contain a cycle.
+    """
+    tasks_by_name = {task.name: task for task in tasks}
+    _check_graph(tasks_by_name)
+
+    results: Dict[str, Any] = {}
+    pending = dict(tasks_by_name)
+    running = {}
+    error: BaseException | None = None
+    start = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            if error is None:
+                ready = [task for task in pending.values() if all(dep in results for dep in task.depends_on)]
+                for task in ready:
+                    del pending[task.name]
+                    running[executor.submit(_run_task, task, dict(results))] = task
+
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                task = running.pop(future)
+                try:
+                    results[task.name] = future.result()
+                except BaseException as e:
+                    print(f"\nStep '{task.name}' failed")
+                    error = error or e
+
+    _print_timings(tasks, time.monotonic() - start)
+
+    if error is not None:
+        raise error
+
+    return results
+
+
+def _run_task(task: Task, results: Dict[str, Any]) -> Any:
+    start = time.monotonic()
+    try:
+        return task.action(results)
+    finally:
+        task.duration = time.monotonic() - start
+
+
+def _check_graph(tasks_by_name: Dict[str, Task]):
+    for task in tasks_by_name.values():
+        for dep in task.depends_on:
+            if dep not in tasks_by_name:
+                raise ValueError(f"Task '{task.name}' depends on unknown task '{dep}'")
+
+    # Depth first search, a task seen again while still on the stack means a cycle
+    state: Dict[str, str] = {}
+
+    def visit(name: str):
+        if state.get(name) == "done":
+            return
+        if state.get(name) == "visiting":
+            raise ValueError(f"Dependency cycle found at task '{name}'")
+        state[name] = "visiting"
+        for dep in tasks_by_name[name].depends_on:
+            visit(dep)
+        state[name] = "done"
+
+    for name in tasks_by_name:
+        visit(name)
+
+
+def _critical_path(tasks: List[Task]) -> float:
+    # Longest chain of finished tasks, following the dependencies
+    tasks_by_name = {task.name: task for task in tasks}
+    finish_times: Dict[str, float] = {}
+
+    def finish_time(name: str) -> float:
+        if name not in finish_times:
+            task = tasks_by_name[name]
+            finish_times[name] = (task.duration or 0) + max((finish_time(dep) for dep in task.depends_on), default=0)
+        return finish_times[name]
+
+    return max((finish_time(task.name) for task in tasks), default=0)
+
+
+def _print_timings(tasks: List[Task], wall_time: float):
+    print("\nStep timings:")
+    for task in tasks:
+        if task.duration is None:
+            print(f"  {task.name:<24} skipped")
+        else:
+            print(f"  {task.name:<24} {task.duration:6.1f}s")
+    print(f"  {'total':<24} {wall_time:6.1f}s (critical path {_critical_path(tasks):.1f}s)")
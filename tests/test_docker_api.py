@@ -0,0 +1,170 @@
+"""
+Tests of `docker_api.Docker_Client` against a fake daemon on a throwaway unix socket.
+
+Run from the repository root with `python -m unittest discover tests` (or pytest).
+"""
+import json
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from docker_api import Docker_Client, Docker_Error, _error_message
+
+
+class _Fake_Daemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path):
+        super().__init__(socket_path, _Handler)
+        # Routes as {(method, path): function(handler, query, body) -> (status, body or list of lines)}
+        self.routes = {}
+        self.requests = []
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def _handle(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        self.server.requests.append((self.command, url.path, body))
+
+        route = self.server.routes.get((self.command, url.path))
+        status, payload = route(parse_qs(url.query), body) if route else (404, {"message": "page not found"})
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if isinstance(payload, list):
+            # Streamed like the daemon does, one json object per line until the connection closes
+            self.end_headers()
+            for line in payload:
+                self.wfile.write(json.dumps(line).encode() + b"\r\n")
+                self.wfile.flush()
+            return
+        data = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Docker_Client_Test(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        socket_path = os.path.join(self.folder.name, "docker.sock")
+        self.daemon = _Fake_Daemon(socket_path)
+        threading.Thread(target=self.daemon.serve_forever, daemon=True).start()
+        self.client = Docker_Client(socket_path, timeout=5)
+
+    def tearDown(self):
+        self.daemon.shutdown()
+        self.daemon.server_close()
+        self.folder.cleanup()
+
+    def test_ping(self):
+        self.daemon.routes[("GET", "/_ping")] = lambda query, body: (200, b"OK")
+        self.assertTrue(self.client.ping())
+
+    def test_ping_without_daemon(self):
+        self.assertFalse(Docker_Client(os.path.join(self.folder.name, "missing.sock")).ping())
+
+    def test_pull_streams_progress(self):
+        messages = [
+            {"status": "Pulling from library/redis", "id": "7-alpine"},
+            {"status": "Downloading", "id": "a1", "progressDetail": {"current": 512, "total": 1024}},
+            {"status": "Pull complete", "id": "a1"},
+        ]
+        self.daemon.routes[("POST", "/images/create")] = lambda query, body: (200, messages)
+        received = []
+        self.client.pull("redis:7-alpine", received.append)
+        self.assertEqual(received, messages)
+
+    def test_pull_error_half_way_through_the_stream(self):
+        messages = [
+            {"status": "Downloading", "id": "a1", "progressDetail": {"current": 512, "total": 1024}},
+            {"error": "unexpected EOF", "errorDetail": {"message": "unexpected EOF"}},
+            {"status": "Pull complete", "id": "a1"},
+        ]
+        self.daemon.routes[("POST", "/images/create")] = lambda query, body: (200, messages)
+        received = []
+        with self.assertRaisesRegex(Docker_Error, "unexpected EOF"):
+            self.client.pull("redis:7-alpine", received.append)
+        self.assertEqual(received, messages[:1])
+
+    def test_run_pulls_a_missing_image(self):
+        pulled = []
+
+        def create(query, body):
+            if not pulled:
+                return (404, {"message": "No such image: redis:7-alpine"})
+            return (201, {"Id": "abc123", "Warnings": []})
+
+        def pull(query, body):
+            pulled.append((query["fromImage"][0], query["tag"][0]))
+            return (200, [{"status": "Pull complete", "id": "a1"}])
+
+        self.daemon.routes[("POST", "/containers/create")] = create
+        self.daemon.routes[("POST", "/images/create")] = pull
+        self.daemon.routes[("POST", "/containers/abc123/start")] = lambda query, body: (204, b"")
+
+        self.assertEqual(self.client.run("redis:7-alpine", ["redis-server"], restart_policy="always"), "abc123")
+        self.assertEqual(pulled, [("redis", "7-alpine")])
+        self.assertEqual([(method, path) for method, path, _ in self.daemon.requests], [
+            ("POST", "/containers/create"),
+            ("POST", "/images/create"),
+            ("POST", "/containers/create"),
+            ("POST", "/containers/abc123/start"),
+        ])
+        self.assertEqual(self.daemon.requests[0][2]["HostConfig"], {"RestartPolicy": {"Name": "always"}})
+
+    def test_run_does_not_pull_on_other_errors(self):
+        self.daemon.routes[("POST", "/containers/create")] = lambda query, body: (409, {"message": "name already in use"})
+        with self.assertRaises(Docker_Error) as raised:
+            self.client.run("redis:7-alpine", name="redis")
+        self.assertEqual(raised.exception.status_code, 409)
+        self.assertIn("name already in use", str(raised.exception))
+        self.assertEqual(len(self.daemon.requests), 1)
+
+    def test_health(self):
+        states = {
+            "with-healthcheck": {"State": {"Status": "running", "Health": {"Status": "healthy"}}},
+            "without-healthcheck": {"State": {"Status": "running"}},
+        }
+        for name, details in states.items():
+            self.daemon.routes[("GET", f"/containers/{name}/json")] = lambda query, body, details=details: (200, details)
+        self.assertEqual(self.client.health("with-healthcheck"), "healthy")
+        self.assertIsNone(self.client.health("without-healthcheck"))
+
+    def test_events(self):
+        events = [
+            {"Type": "container", "Action": "start", "Actor": {"ID": "abc123"}, "time": 1700000000},
+            {"Type": "container", "Action": "health_status: healthy", "Actor": {"ID": "abc123"}, "time": 1700000001},
+        ]
+        queries = []
+        self.daemon.routes[("GET", "/events")] = lambda query, body: (queries.append(query), (200, events))[1]
+        filters = {"type": ["container"], "event": ["start", "health_status"]}
+        self.assertEqual(list(self.client.events(filters, since=1700000000, until=1700000060)), events)
+        self.assertEqual(json.loads(queries[0]["filters"][0]), filters)
+        self.assertEqual(queries[0]["until"], ["1700000060.000"])
+
+    def test_error_message(self):
+        self.assertEqual(_error_message(b'{"message": "No such container: abc"}'), "No such container: abc")
+        self.assertEqual(_error_message(b"page not found\n"), "page not found")
+        self.assertEqual(_error_message(b"[]"), "[]")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,28 +1,284 @@
 import subprocess
-from typing import List, Optional, Callable
+import json
+import os
+import queue
+import re
+import signal
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional, Callable
 from enum import Enum, auto
-from InquirerPy import prompt
-from InquirerPy import inquirer
-from tzlocal import get_localzone
+from config import default_env_vars, secret_names
 
+# InquirerPy, tzlocal and yaml are imported where they are first used so the installer
+# starts printing straight away instead of spending the first seconds importing them
 
-local_timezone = get_localzone()
 
-def run_command(command: str):
+def get_local_timezone() -> str | None:
+    """
+    Get the name of the host's time zone.
+
+    Returns:
+        str | None: The time zone name (like "America/New_York"), or None if it can't be detected.
+    """
+    from tzlocal import get_localzone
+    try:
+        return str(get_localzone())
+    except Exception:
+        return None
+
+# (command, seconds, exit code) of every command run, see `print_command_timings()`
+command_timings: List[tuple] = []
+
+
+class Command_Error(Exception):
+    """
+    Raised by `stream_command()` when a command fails or times out.
+
+    Attributes:
+        command (str): The command that was run.
+        returncode (int | None): Exit code of the command, None if it timed out.
+        tail (List[str]): The last lines of its output.
+        duration (float): Seconds the command ran for.
+    """
+    def __init__(self, command: str, returncode: int | None, tail: List[str], duration: float):
+        reason = f"timed out after {duration:.0f}s" if returncode is None else f"exited with code {returncode}"
+        super().__init__(f"{command} {reason}")
+        self.command = command
+        self.returncode = returncode
+        self.tail = tail
+        self.duration = duration
+
+
+def stream_command(command: str, timeout: Optional[float] = None, tail_lines: int = 50) -> Iterator[str]:
+    """
+    Run a shell command and yield its output line by line as it is printed.
+
+    Stdout and stderr are merged. Only the last `tail_lines` lines are kept in memory for the
+    error, so commands with a lot of output (like image builds) don't fill up small hosts.
+    The duration of the command is recorded in `command_timings`.
+
+    Args:
+        command: The shell command to run.
+        timeout: Seconds after which the command (and everything it started) is killed. Commands
+            with a timeout run without the terminal, so they can't prompt for a password.
+        tail_lines: Number of lines of output kept for the error.
+
+    Yields:
+        str: Every line of output, without the line ending.
+
+    Raises:
+        Command_Error: If the command exits with an error or times out.
+    """
+    start = time.monotonic()
+    tail: deque = deque(maxlen=tail_lines)
+    # With a timeout the command gets its own session, so the whole process group is killed and
+    # not only the shell. Without one it stays in ours: a new session has no controlling
+    # terminal, so sudo could not ask for a password
+    isolated = timeout is not None
+    process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, errors="replace", bufsize=1, start_new_session=isolated)
+
+    # Lines are read on a thread so the timeout also applies while the command prints nothing
+    lines: queue.Queue = queue.Queue(maxsize=1000)
+
+    def read_output():
+        for line in process.stdout:
+            lines.put(line.rstrip("\r\n"))
+        lines.put(None)
+
+    threading.Thread(target=read_output, daemon=True).start()
+
+    timed_out = False
+    finished = False
     try:
-        result = subprocess.run(command, shell=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    except subprocess.CalledProcessError as e:
+        while True:
+            remaining = None if timeout is None else timeout - (time.monotonic() - start)
+            try:
+                if remaining is not None and remaining <= 0:
+                    raise queue.Empty
+                line = lines.get(timeout=remaining)
+            except queue.Empty:
+                timed_out = True
+                break
+            if line is None:
+                finished = True
+                break
+            tail.append(line)
+            yield line
+    finally:
+        # Timed out, or the caller stopped reading before the end
+        if not finished:
+            if isolated:
+                _kill_process_group(process)
+            else:
+                _kill_process_tree(process.pid)
+            # Let the reader thread see the end of the output instead of blocking on the full queue
+            try:
+                while lines.get(timeout=5) is not None:
+                    pass
+            except queue.Empty:
+                pass
+        returncode = process.wait()
+        duration = time.monotonic() - start
+        command_timings.append((command, duration, None if timed_out else returncode))
+
+    if timed_out:
+        raise Command_Error(command, None, list(tail), duration)
+    if returncode != 0:
+        raise Command_Error(command, returncode, list(tail), duration)
+
+
+def _kill_process_group(process: subprocess.Popen):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _kill_process_tree(pid: int):
+    # The shell does not always exec the command, so its children are killed too. pgrep -P
+    # lists the children of a process on Linux and macOS
+    try:
+        children = subprocess.run(["pgrep", "-P", str(pid)], capture_output=True, text=True).stdout.split()
+    except FileNotFoundError:
+        children = []
+    try:
+        os.kill(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+    for child in children:
+        _kill_process_tree(int(child))
+
+
+def run_command(command: str, show_output: bool = False, timeout: Optional[float] = None) -> str:
+    """
+    Run a shell command, exiting the installer if it fails.
+
+    Args:
+        command: The shell command to run.
+        show_output: Print the output while the command runs, for long commands like builds.
+        timeout: Seconds after which the command is killed.
+
+    Returns:
+        str: The last lines of output (stdout and stderr), enough for commands that print a single value.
+    """
+    tail: deque = deque(maxlen=50)
+    try:
+        for line in stream_command(command, timeout):
+            tail.append(line)
+            if show_output:
+                print(f"  | {line}")
+    except Command_Error as e:
         print(f"Error running command: {command}")
-        print(f"Exit code: {e.returncode}")
-        print(f"Output: {e.output}")
-        print(f"Error: {e.stderr}")
+        print(f"Exit code: {e.returncode}" if e.returncode is not None else f"Timed out after {e.duration:.0f}s")
+        print(f"Output (last {len(e.tail)} lines):")
+        print("\n".join(e.tail))
         exit(1)
-    
+    return "\n".join(tail)
+
+
+def print_command_timings(min_duration: float = 1.0):
+    """
+    Print how long every command that took at least `min_duration` seconds ran for.
+    """
+    slow_commands = [timing for timing in command_timings if timing[1] >= min_duration]
+    if not slow_commands:
+        return
+    print("\nCommand timings:")
+    for command, duration, returncode in slow_commands:
+        # Cut long commands, they can contain tokens
+        shown_command = command if len(command) <= 60 else command[:57] + "..."
+        status = "timed out" if returncode is None else f"exit {returncode}"
+        print(f"  {shown_command:<60} {duration:6.1f}s ({status})")
+
 def create_file(path, content):
     f = open(path, "x")
     f.write(content)
     f.close()
 
+def wait_until(check: Callable[[], Any], timeout: float, initial_delay: float = 0.25, max_delay: float = 5.0) -> Any:
+    """
+    Call `check` until it returns a truthy value, backing off between calls.
+
+    The delay starts small so a condition that is met quickly is noticed straight away, and
+    grows by half every call up to `max_delay` so a slow one is not polled needlessly.
+
+    Args:
+        check: Function called without arguments, a truthy return value ends the wait.
+        timeout: Seconds to wait at most.
+        initial_delay: Seconds to wait after the first call.
+        max_delay: Maximum seconds between two calls.
+
+    Returns:
+        Any: The truthy value returned by `check`, or None if the timeout was reached.
+    """
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+    while True:
+        result = check()
+        if result:
+            return result
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 1.5, max_delay)
+
+# Answers loaded from an answers file, keyed by `Question.key`
+answers: Dict[str, Any] = {}
+
+# Every answer given during this run (except secrets), can be saved as an answers file
+recorded_answers: Dict[str, Any] = {}
+
+
+def load_answers(path: str):
+    """
+    Load answers for unattended installs from a JSON or YAML file.
+
+    The file maps question keys to answers. Questions without an answer in the file
+    are still prompted.
+
+    Args:
+        path: Path to a .json, .yaml or .yml file.
+    """
+    with open(path) as f:
+        if path.endswith((".yaml", ".yml")):
+            import yaml
+            loaded = yaml.safe_load(f)
+        else:
+            loaded = json.load(f)
+    answers.update(loaded or {})
+
+
+def save_answers(path: str):
+    """
+    Save every answer given so far (except passwords and keys) so the install can be repeated unattended.
+
+    Args:
+        path: Path to a .json, .yaml or .yml file.
+    """
+    with open(path, "w") as f:
+        if path.endswith((".yaml", ".yml")):
+            import yaml
+            yaml.safe_dump(recorded_answers, f, sort_keys=False)
+        else:
+            json.dump(recorded_answers, f, indent=2)
+
+
+_first_prompt_logged = False
+
+
+def _log_first_prompt():
+    # Used by benchmarks/startup.py to measure the time until the first question is shown
+    global _first_prompt_logged
+    log_path = os.environ.get("N8N_INSTALL_STARTUP_LOG")
+    if log_path and not _first_prompt_logged:
+        _first_prompt_logged = True
+        with open(log_path, "a") as f:
+            f.write(f"{time.time()}\n")
+
+
 class Reverse_Proxy_Type(Enum):
     CLOUDFLARE = "Cloudflare Tunnel (best for beginners and dynamic IP)"
     # NGNIX = "NGNIX (best for experienced techs with dedicated IP)"
@@ -37,6 +293,11 @@ class Binary_Modes(Enum):
     filesystem = "filesystem (not available for enterprise)"
     s3 = "s3 remote storage"
 
+class Redis_Persistence(Enum):
+    aof = "append-only file, fsync every second (loses at most a second of queued jobs)"
+    rdb = "snapshots every few minutes (faster, loses the jobs since the last snapshot)"
+    none = "no persistence (fastest, the queue is lost when redis restarts)"
+
 class Email_Modes(Enum):
     Non = "No email configuration (Email password resets and user invites will not work)"
     SMTP = "Manual SMTP configuration"
@@ -107,6 +368,9 @@ class Question:
         validate_message (str | None): Error message to display if validation fails.
         env_var_prefix (str): Prefix to add to the answer when updating environment variables.
         default (str | None): Default value for the question.
+        key (str): Name of the answer in an answers file or `N8N_INSTALL_<KEY>` env var.
+        secret (bool): Whether the answer is left out of the saved answers. Password questions
+            and questions that update a secret variable of the registry always are.
         answer (str): The user's answer after prompting.
 
     Methods:
@@ -153,6 +417,13 @@ class Question:
         ...     # Ask for enterprise key here
         This creates a yes/no question and immediately retrieves the answer for conditional logic.
 
+        Unattended installs:
+        >>> load_answers("answers.yaml")
+        Every question first looks for its `key` in the loaded answers file, then in the
+        `N8N_INSTALL_<KEY>` environment variable, and only prompts if neither has a valid
+        answer. The key defaults to the first env var the question updates, or a slug of the
+        question text (see `key`).
+
     Note:
         The question is automatically prompted upon initialization, and the answer
         is stored in the `answer` attribute. Environment variables are updated automatically
@@ -168,7 +439,9 @@ class Question:
             validate: Optional[Callable] = None, 
             validate_message: Optional[str] = None, 
             env_var_prefix: Optional[str] = "",
-            default: Optional[str] = None,):
+            default: Optional[str] = None,
+            key: Optional[str] = None,
+            secret: bool = False,):
         self.question: str = question
         self.input_type: Input_Type = input_type
         self.validate: Callable | None = validate
@@ -177,6 +450,8 @@ class Question:
         self.default = default
         self.options = options
         self.env_to_update: List[str] | None = self._prep_list_of_env_vars(env_to_update)
+        self.key: str = key or self._default_key()
+        self.secret: bool = secret or input_type == Input_Type.PASSWORD or any(env_var in secret_names() for env_var in self.env_to_update or [])
         self.answer: str = self._promt_question()
 
     def _promt_question(self) -> str:
@@ -220,15 +495,62 @@ class Question:
                 }
             ]
         
-        answer = prompt(question)
+        answer = self._preset_answer()
+        if answer is None:
+            _log_first_prompt()
+            from InquirerPy import prompt
+            answer = prompt(question)["current_question"]
+
+        # Secrets can still be given with N8N_INSTALL_<KEY>
+        if not self.secret:
+            recorded_answers[self.key] = answer
 
         # Updates each entirement Var to the answer. Will do a single one, a list, or none
         if self.env_to_update != None:  
             for env_var in self.env_to_update:
-                env_vars[env_var] = self.env_var_prefix + answer["current_question"]
+                env_vars[env_var] = self.env_var_prefix + answer
 
         
-        return str(answer["current_question"])
+        return str(answer)
+
+    def _preset_answer(self) -> Any:
+        # Answer from the answers file or environment, checked the same way a typed answer would be
+        if self.key in answers:
+            value = answers[self.key]
+            source = "answers file"
+        elif f"N8N_INSTALL_{self.key.upper()}" in os.environ:
+            value = os.environ[f"N8N_INSTALL_{self.key.upper()}"]
+            source = f"N8N_INSTALL_{self.key.upper()}"
+        else:
+            return None
+
+        if self.input_type == Input_Type.CONFIRM:
+            if isinstance(value, bool):
+                return value
+            if str(value).lower() in ("true", "yes", "y", "1"):
+                return True
+            if str(value).lower() in ("false", "no", "n", "0"):
+                return False
+            invalid_message = "expected yes or no"
+        elif self.input_type == Input_Type.CHOICE:
+            matches = [option for option in self.options if option.lower() == str(value).lower()]
+            if matches:
+                return matches[0]
+            invalid_message = f"expected one of {self.options}"
+        else:
+            value = "" if value is None else str(value)
+            validate = self.validate or (lambda selection: selection != " ")
+            if self.input_type == Input_Type.PASSWORD or validate(value):
+                return value
+            invalid_message = self.validate_message or "invalid answer"
+
+        print(f"Ignoring answer for '{self.key}' from {source}: {invalid_message}")
+        return None
+
+    def _default_key(self) -> str:
+        if self.env_to_update:
+            return self.env_to_update[0]
+        return re.sub(r"[^a-z0-9]+", "_", self.question.lower()).strip("_")
     
     def _prep_list_of_env_vars(self, env_to_update) -> List[str] | None:
         if type(env_to_update) == str:
@@ -239,187 +561,31 @@ class Question:
             return env_to_update
 
 
-env_vars = {
-
-    # AI VARIABLES
-    # "N8N_AI_ENABLED": None,
-    # "N8N_AI_PROVIDER": "openai",
-    # "N8N_AI_OPENAI_API_KEY": None,
-
-    # CREDENTIALS VARIABLES
-    "CREDENTIALS_DEFAULT_NAME": "My credentials",
-
-    # DATABASE VARIABLES
-    "DB_TYPE": "sqlite",
-    "DB_TABLE_PREFIX": None,
-    "DB_SQLITE_VACUUM_ON_STARTUP": "false",
-
-    # DEPLOYMENT VARIABLES
-    "N8N_EDITOR_BASE_URL": None,
-    "N8N_PERSONALIZATION_ENABLED": "false",
-    "N8N_CONFIG_FILES": None,
-    "N8N_DISABLE_UI": None,
-    "N8N_PREVIEW_MODE": None,
-    "N8N_TEMPLATES_ENABLED": "false",
-    "N8N_TEMPLATES_HOST": None,
-    "N8N_ENCRYPTION_KEY": None,
-    "N8N_GRACEFUL_SHUTDOWN_TIMEOUT": "30",
-    "N8N_PUBLIC_API_DISABLED": None,
-    "N8N_HIRING_BANNER_ENABLED": None,
-
-    # BINARY DATA 
-    "N8N_AVAILABLE_BINARY_DATA_MODES": None,
-    "N8N_BINARY_DATA_STORAGE_PATH": None,
-    "N8N_DEFAULT_BINARY_DATA_MODE": None,
-
-    # USER MANANEMENT 
-    #  SMTP EMAIL
-    "N8N_EMAIL_MODE": "smtp",
-    "N8N_SMTP_HOST": None,
-    "N8N_SMTP_PORT": None,
-    "N8N_SMTP_USER": None,
-    "N8N_SMTP_PASS": None,
-    #  SERVICE ACCOUNT EMAIL
-    "N8N_SMTP_OAUTH_SERVICE_CLIENT": None,
-    "N8N_SMTP_OAUTH_PRIVATE_KEY": None,
-    "N8N_SMTP_SENDER": None,
-    "N8N_SMTP_SSL": "true",
-    #  Templates
-    "N8N_UM_EMAIL_TEMPLATES_INVITE": None,
-    "N8N_UM_EMAIL_TEMPLATES_PWRESET": None,
-    "N8N_UM_EMAIL_TEMPLATES_WORKFLOW_SHARED": None,
-    "N8N_UM_EMAIL_TEMPLATES_CREDENTIALS_SHARED": None,
-    #  Token options
-    "N8N_USER_MANAGEMENT_JWT_SECRET": None,
-    "N8N_USER_MANAGEMENT_JWT_DURATION_HOURS": None,
-    "N8N_USER_MANAGEMENT_JWT_REFRESH_TIMEOUT_HOURS": None,
-    "N8N_MFA_ENABLED": None,
-
-    # ENDPOINTS
-    "N8N_PAYLOAD_SIZE_MAX": "16",
-    "N8N_METRICS": "false",
-    "N8N_METRICS_PREFIX": "n8n_",
-    "N8N_METRICS_INCLUDE_DEFAULT_METRICS": "true",
-    "N8N_METRICS_INCLUDE_CACHE_METRICS": "false",
-    "N8N_METRICS_INCLUDE_MESSAGE_EVENT_BUS_METRICS": "false",
-    "N8N_METRICS_INCLUDE_WORKFLOW_ID_LABEL": "false",
-    "N8N_METRICS_INCLUDE_NODE_TYPE_LABEL": "false",
-    "N8N_METRICS_INCLUDE_CREDENTIAL_TYPE_LABEL": "false",
-    "N8N_METRICS_INCLUDE_API_ENDPOINTS": "false",
-    "N8N_METRICS_INCLUDE_API_PATH_LABEL": "false",
-    "N8N_METRICS_INCLUDE_API_METHOD_LABEL": "false",
-    "N8N_METRICS_INCLUDE_API_STATUS_CODE_LABEL": "false",
-    "N8N_ENDPOINT_REST": "rest",
-    "N8N_ENDPOINT_WEBHOOK": "webhook",
-    "N8N_ENDPOINT_WEBHOOK_TEST": "webhook-test",
-    "N8N_ENDPOINT_WEBHOOK_WAIT": "webhook-waiting",
-    "WEBHOOK_URL": None,
-    "N8N_DISABLE_PRODUCTION_MAIN_PROCESS": "false",
-
-    # EXTERNAL HOOKS
-    "EXTERNAL_HOOK_FILES": None,
-    "EXTERNAL_FRONTEND_HOOKS_URLS": None,
-
-    # EXECUTION
-    "EXECUTIONS_MODE": "regular",
-    "EXECUTIONS_TIMEOUT": "-1",
-    "EXECUTIONS_TIMEOUT_MAX": "3600",
-    "EXECUTIONS_DATA_SAVE_ON_ERROR": "all",
-    "EXECUTIONS_DATA_SAVE_ON_SUCCESS": "all",
-    "EXECUTIONS_DATA_SAVE_ON_PROGRESS": "false",
-    "EXECUTIONS_DATA_SAVE_MANUAL_EXECUTIONS": "true",
-    "EXECUTIONS_DATA_PRUNE": "true",
-    "EXECUTIONS_DATA_MAX_AGE": "336",
-    "EXECUTIONS_DATA_PRUNE_MAX_COUNT": "10000",
-    "EXECUTIONS_DATA_HARD_DELETE_BUFFER": "1",
-    "EXECUTIONS_DATA_PRUNE_HARD_DELETE_INTERVAL": "15",
-    "EXECUTIONS_DATA_PRUNE_SOFT_DELETE_INTERVAL": "60",
-    "N8N_CONCURRENCY_PRODUCTION_LIMIT": "-1",
-    
-    # LOGS
-    "N8N_LOG_LEVEL": "info",
-    "N8N_LOG_OUTPUT": "console",
-    "N8N_LOG_FILE_COUNT_MAX": None,
-    "N8N_LOG_FILE_SIZE_MAX": None,
-    "N8N_LOG_FILE_LOCATION": None,
-    "DB_LOGGING_ENABLED": "false",
-    "DB_LOGGING_OPTIONS": None,
-    "DB_LOGGING_MAX_EXECUTION_TIME": None,
-    "CODE_ENABLE_STDOUT": "false",
-
-    # LOG STREAMING
-    "N8N_EVENTBUS_CHECKUNSENTINTERVAL": "0",
-    "N8N_EVENTBUS_LOGWRITER_SYNCFILEACCESS": "false",
-    "N8N_EVENTBUS_LOGWRITER_KEEPLOGCOUNT": "3",
-    "N8N_EVENTBUS_LOGWRITER_MAXFILESIZEINKB": "10240",
-    "N8N_EVENTBUS_LOGWRITER_LOGBASENAME": "n8nEventLog",
-
-    # EXTERNAL DATA STORAGE
-    "N8N_EXTERNAL_STORAGE_S3_HOST": None,
-    "N8N_EXTERNAL_STORAGE_S3_BUCKET_NAME": None,
-    "N8N_EXTERNAL_STORAGE_S3_BUCKET_REGION": None,
-    "N8N_EXTERNAL_STORAGE_S3_ACCESS_KEY": None,
-    "N8N_EXTERNAL_STORAGE_S3_ACCESS_SECRET": None,
-
-    # NODES
-    "NODES_INCLUDE": None,
-    "NODES_EXCLUDE": None,
-    "NODE_FUNCTION_ALLOW_BUILTIN": None,
-    "NODE_FUNCTION_ALLOW_EXTERNAL": None,
-    "NODES_ERROR_TRIGGER_TYPE": "n8n-nodes-base.errorTrigger",
-    "N8N_CUSTOM_EXTENSIONS": None,
-    "N8N_COMMUNITY_PACKAGES_ENABLED": "true",
-    "N8N_COMMUNITY_PACKAGES_REGISTRY": "https://registry.npmjs.org",
+# Values of the n8n environment variables, the questions update them. See `config.ENV_REGISTRY`
+env_vars = default_env_vars()
 
+# Options for the shape of the generated docker compose stack (not written to the .env file)
+stack_options = {
     # QUEUE MODE
-    "QUEUE_BULL_PREFIX": None,
-    "QUEUE_BULL_REDIS_DB": None,
-    "QUEUE_BULL_REDIS_HOST": "localhost",
-    "QUEUE_BULL_REDIS_PORT": "6379",
-    "QUEUE_BULL_REDIS_USERNAME": None,
-    "QUEUE_BULL_REDIS_PASSWORD": None,
-    "QUEUE_BULL_REDIS_TIMEOUT_THRESHOLD": "1000",
-    "QUEUE_BULL_REDIS_CLUSTER_NODES": None,
-    "QUEUE_BULL_REDIS_TLS": None,
-    "QUEUE_RECOVERY_INTERVAL": None,
-    "QUEUE_HEALTH_CHECK_ACTIVE": "false",
-    "QUEUE_HEALTH_CHECK_PORT": None,
-    "QUEUE_WORKER_LOCK_DURATION": "30000",
-    "QUEUE_WORKER_LOCK_RENEW_TIME": "15000",
-    "QUEUE_WORKER_STALLED_INTERVAL": "30000",
-    "QUEUE_WORKER_MAX_STALLED_COUNT": "1",
-
-    # SECURITY
-    "N8N_BLOCK_ENV_ACCESS_IN_NODE": "false",
-    "N8N_RESTRICT_FILE_ACCESS_TO": None,
-    "N8N_BLOCK_FILE_ACCESS_TO_N8N_FILES": "true",
-    "N8N_SECURITY_AUDIT_DAYS_ABANDONED_WORKFLOW": "90",
-    "N8N_SECURE_COOKIE": "true",
-
-    # GIT
-    "N8N_SOURCECONTROL_DEFAULT_SSH_KEY_TYPE": "ed25519",
-
-    # EXTERNAL SECRETS
-    "N8N_EXTERNAL_SECRETS_UPDATE_INTERVAL": None,
-
-    # LOCAL
-    "GENERIC_TIMEZONE": None,
-    "N8N_DEFAULT_LOCALE": None,
-
-    # WORKFLOWS
-    "WORKFLOWS_DEFAULT_NAME": "My workflow",
-    "N8N_ONBOARDING_FLOW_DISABLED": "false",
-    "N8N_WORKFLOW_TAGS_DISABLED": "false",
-    "N8N_WORKFLOW_CALLER_POLICY_DEFAULT_OPTION": "workflowsFromSameOwner",
-
-    # LICENSE
-    "N8N_HIDE_USAGE_PAGE": "false",
-    "N8N_LICENSE_ACTIVATION_KEY": None,
-    "N8N_LICENSE_AUTO_RENEW_ENABLED": "true",
-    "N8N_LICENSE_AUTO_RENEW_OFFSET": None,
-    "N8N_LICENSE_SERVER_URL": None,
-    "HTTP_PROXY_LICENSE_SERVER": None,
-    "HTTPS_PROXY_LICENSE_SERVER": None,
+    "worker_count": 0,
+    "webhook_count": 0,
+    # QUEUE MODE REDIS (see `n8n.use_redis()`)
+    "redis_persistence": "aof",
+    # Address redis, postgres and minio are published on for workers on other hosts (see remote.py)
+    "publish_address": None,
+    # SQLITE (see `n8n.use_sqlite_profile()`)
+    "sqlite_profile": True,
+    "sqlite_host_path": None,
+    # BINARY DATA
+    "binary_data_host_path": None,
+    "local_s3": False,
+    # MONITORING (see `n8n.use_monitoring()`)
+    "monitoring": False,
+    # REGISTRY MIRROR
+    "registry_mirror": None,
+    # RESOURCE LIMITS (see `host.size_services()`)
+    "resource_limits": True,
+    "resource_overrides": {},
     }
 
 timezones = [